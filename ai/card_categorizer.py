@@ -1,8 +1,15 @@
+import json
 from typing import List, Dict
 from langchain_core.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import JsonOutputParser
 from pydantic import BaseModel, Field
+from ai.response_cache import ResponseCache, response_cache_key
+from chunk_planner import ChunkPlan, estimate_tokens, name_output_tokens, plan_chunks
+
+DEFAULT_API_BASE = "https://open.bigmodel.cn/api/paas/v4/"
+# Categories a card is expected to be placed in on average, when estimating the response size
+CATEGORIES_PER_CARD = 2
 
 class CardCategory(BaseModel):
     category: str = Field(
@@ -18,13 +25,18 @@ class CardCategories(BaseModel):
     )
 
 class MagicCardSelector:
-    def __init__(self, model_name: str = "glm-4.5-flash", temperature: float = 0.1):
+    def __init__(self, model_name: str = "glm-4.5-flash", temperature: float = 0.1, api_base: str = DEFAULT_API_BASE, cache: ResponseCache | None = None):
+        self.model_name = model_name
+        self.temperature = temperature
+        self.api_base = api_base
+        self.cache = cache
+        self.max_output_tokens = 2000
         self.llm = ChatOpenAI(
             model=model_name,
             temperature=temperature,
             model_kwargs={"response_format": {"type": "json_object"}},
-            openai_api_base="https://open.bigmodel.cn/api/paas/v4/",
-            max_completion_tokens=2000
+            openai_api_base=api_base,
+            max_completion_tokens=self.max_output_tokens
         )
 
         self.parser = JsonOutputParser(pydantic_object=CardCategories)
@@ -48,20 +60,74 @@ class MagicCardSelector:
         
         self.chain = self.prompt_template | self.llm | self.parser
 
-    def categorize_cards(self, cards: List[Dict], deck_concept: str, categories: list[str]) -> CardCategories:
-        formatted_cards = "\n".join(
+    def format_card(self, card: Dict) -> str:
+        return (
             f"- {card.get('name', 'Unknown')}: {card.get('mana_cost', '')} - {card.get('type_line', '')}\n" +
             f"  Text: {card.get('oracle_text', '')}\n" +
             f"  {card.get('power', '')}/{card.get('toughness', '') if 'power' in card else ''}\n"
-            for card in cards
         )
+
+    def prompt_overhead(self, deck_concept: str, categories: list[str]) -> str:
+        """
+        The prompt sent with every chunk, without the cards. Used to plan chunks by tokens.
+        """
         formatted_categories = "\n".join(f"- {category}" for category in categories)
-        response = self.chain.invoke({
+        return self.prompt_template.format(cards="", deck_concept=deck_concept, categories=formatted_categories, format_instructions=self.parser.get_format_instructions())
+
+    def card_output_tokens(self, card: Dict) -> int:
+        """
+        Estimated completion tokens a card adds to the response, its name in the card list of
+        every category it is placed in.
+        """
+        return name_output_tokens(card) * CATEGORIES_PER_CARD
+
+    def output_overhead_tokens(self, categories: list[str]) -> int:
+        """
+        Estimated completion tokens of the category objects around the card names, the CUT
+        category included.
+        """
+        skeleton = {"categories": [{"category": category, "cards": []} for category in [*categories, "CUT"]]}
+        return estimate_tokens(json.dumps(skeleton))
+
+    def plan_categorize_chunks(self, cards: List[Dict], deck_concept: str, categories: list[str], token_budget: int) -> ChunkPlan:
+        """
+        Packs cards into chunks that fit both a prompt token budget and max_output_tokens.
+        """
+        overhead_tokens = estimate_tokens(self.prompt_overhead(deck_concept, categories))
+        return plan_chunks(cards, self.format_card, token_budget, overhead_tokens, self.max_output_tokens, self.card_output_tokens, self.output_overhead_tokens(categories))
+
+    def categorize_in_chunks(self, cards: List[Dict], deck_concept: str, categories: list[str], token_budget: int) -> CardCategories:
+        """
+        Categorizes any number of cards, one request per planned chunk, see plan_categorize_chunks.
+        Returns:
+            CardCategories: The categories of every chunk merged, in order of first appearance
+        """
+        plan = self.plan_categorize_chunks(cards, deck_concept, categories, token_budget)
+        print(plan.summary())
+        merged = {}
+        for i, chunk in enumerate(plan):
+            print(f"Processing chunk {i+1}/{len(plan)}")
+            for category in self.categorize_cards(chunk, deck_concept, categories)["categories"]:
+                merged.setdefault(category["category"], []).extend(category["cards"])
+        return {"categories": [{"category": category, "cards": names} for category, names in merged.items()]}
+
+    def categorize_cards(self, cards: List[Dict], deck_concept: str, categories: list[str]) -> CardCategories:
+        formatted_cards = "\n".join(self.format_card(card) for card in cards)
+        formatted_categories = "\n".join(f"- {category}" for category in categories)
+        inputs = {
             "cards": formatted_cards,
             "deck_concept": deck_concept,
             "categories": formatted_categories,
             "format_instructions": self.parser.get_format_instructions()
-        })
+        }
+        if self.cache is not None:
+            cache_key = response_cache_key(self.model_name, self.prompt_template.template, inputs, self.temperature, self.api_base)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        response = self.chain.invoke(inputs)
+        if self.cache is not None:
+            self.cache.put(cache_key, response)
         return response
 
 if __name__ == "__main__":
@@ -3,6 +3,10 @@ from langchain_core.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import JsonOutputParser
 from pydantic import BaseModel, Field
+from ai.response_cache import ResponseCache, response_cache_key
+from chunk_planner import name_output_tokens
+
+DEFAULT_API_BASE = "https://open.bigmodel.cn/api/paas/v4/"
 
 class CardSelection(BaseModel):
     selected_cards: List[str] = Field(
@@ -10,12 +14,17 @@ class CardSelection(BaseModel):
     )
 
 class MagicCardSelector:
-    def __init__(self, model_name: str = "glm-4.5-flash", temperature: float = 0.1):
+    def __init__(self, model_name: str = "glm-4.5-flash", temperature: float = 0.1, api_base: str = DEFAULT_API_BASE, cache: ResponseCache | None = None):
+        self.model_name = model_name
+        self.temperature = temperature
+        self.api_base = api_base
+        self.cache = cache
+        self.max_output_tokens = None  # Completions are not capped
         self.llm = ChatOpenAI(
             model=model_name,
             temperature=temperature,
             model_kwargs={"response_format": {"type": "json_object"}},
-            openai_api_base="https://open.bigmodel.cn/api/paas/v4/"
+            openai_api_base=api_base
         )
         self.parser = JsonOutputParser(pydantic_object=CardSelection)
         self.prompt_template = PromptTemplate(
@@ -35,25 +44,49 @@ class MagicCardSelector:
         )
         self.chain = self.prompt_template | self.llm | self.parser
 
-    def select_cards(self, cards: List[Dict], deck_concept: str) -> CardSelection:
-        formatted_cards = "\n".join(
+    def format_card(self, card: Dict) -> str:
+        return (
             f"- {card.get('name', 'Unknown')}: {card.get('mana_cost', '')} - {card.get('type_line', '')}\n" +
             f"  Text: {card.get('oracle_text', '')}\n" +
             f"  {card.get('power', '')}/{card.get('toughness', '') if 'power' in card else ''}\n"
-            for card in cards
         )
+
+    def card_output_tokens(self, card: Dict) -> int:
+        """
+        Estimated completion tokens a card adds to the response, its name in selected_cards.
+        """
+        return name_output_tokens(card)
+
+    def prompt_overhead(self, deck_concept: str) -> str:
+        """
+        The prompt sent with every chunk, without the cards. Used to plan chunks by tokens.
+        """
+        return self.prompt_template.format(cards="", deck_concept=deck_concept, format_instructions=self.parser.get_format_instructions())
+
+    def select_cards(self, cards: List[Dict], deck_concept: str) -> CardSelection:
+        formatted_cards = "\n".join(self.format_card(card) for card in cards)
+        inputs = {
+            "cards": formatted_cards,
+            "deck_concept": deck_concept,
+            "format_instructions": self.parser.get_format_instructions()
+        }
+        if self.cache is not None:
+            cache_key = response_cache_key(self.model_name, self.prompt_template.template, inputs, self.temperature, self.api_base)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
         retries = 10
         while retries > 0:
             try:
-                response = self.chain.invoke({
-                    "cards": formatted_cards,
-                    "deck_concept": deck_concept,
-                    "format_instructions": self.parser.get_format_instructions()
-                })
-                return response
+                response = self.chain.invoke(inputs)
             except Exception as e:
                 retries -= 1
                 print(f"Error occurred: {e}. retrying...")
+                continue
+            # Outside of the try, a failing cache write is not retried as a failed request
+            if self.cache is not None:
+                self.cache.put(cache_key, response)
+            return response
         raise Exception("Failed to get a valid response after multiple retries")
 
 if __name__ == "__main__":
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import sqlite3
+import threading
+
+DEFAULT_CACHE_PATH = 'llm_cache.db'
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+def response_cache_key(model_name: str, template: str, inputs: dict, temperature: float, api_base: str) -> str:
+    """
+    Content address of an LLM request.
+    Args:
+        model_name (str): Name of the model answering the request
+        template (str): Prompt template the inputs are filled into
+        inputs (dict): Prompt inputs, e.g. the deck concept and the formatted cards
+        temperature (float): Sampling temperature of the request
+        api_base (str): Base URL of the API serving the model, as endpoints may serve
+            different models under the same name
+    Returns:
+        str: SHA-256 hex digest identifying the request
+    """
+    template_hash = hashlib.sha256(template.encode('utf-8')).hexdigest()
+    request = json.dumps({'model': model_name, 'template': template_hash, 'inputs': inputs, 'temperature': temperature, 'api_base': api_base}, sort_keys=True)
+    return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """
+    On-disk SQLite cache of parsed LLM responses keyed by response_cache_key. When the
+    stored responses grow past `max_bytes` the least recently used ones are evicted. One
+    cache can be shared by the threads of a chunk dispatch.
+
+    The total size of the responses is kept in a one-row table next to them, so a put only
+    reads the oldest responses when there is something to evict.
+    """
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            last_used INTEGER NOT NULL
+        )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS responses_size (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL)')
+        # Caches written before the total was kept are summed once
+        self.conn.execute('INSERT OR IGNORE INTO responses_size (id, total) SELECT 0, COALESCE(SUM(size), 0) FROM responses')
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _next_use(self) -> int:
+        return self.conn.execute('SELECT COALESCE(MAX(last_used), 0) + 1 FROM responses').fetchone()[0]
+
+    def get(self, key: str):
+        """
+        Returns the cached response for a key, or None if it is not cached.
+        """
+        with self._lock:
+            row = self.conn.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (self._next_use(), key))
+            self.conn.commit()
+            return json.loads(row[0])
+
+    def put(self, key: str, response):
+        """
+        Caches a JSON serializable response and evicts the least recently used responses
+        beyond max_bytes.
+        """
+        value = json.dumps(response)
+        with self._lock:
+            replaced = self.conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self.conn.execute(
+                'INSERT INTO responses (key, response, size, last_used) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET response = excluded.response, size = excluded.size, last_used = excluded.last_used',
+                (key, value, len(value), self._next_use())
+            )
+            self.conn.execute('UPDATE responses_size SET total = total + ?', (len(value) - (replaced[0] if replaced else 0),))
+            (total,) = self.conn.execute('SELECT total FROM responses_size').fetchone()
+            if total > self.max_bytes:
+                self._evict(total - self.max_bytes)
+            self.conn.commit()
+
+    def _evict(self, excess: int):
+        """
+        Deletes the least recently used responses until `excess` bytes are freed.
+        """
+        evicted, freed = [], 0
+        # Walks the last_used index from the oldest response and stops as soon as enough is freed
+        cursor = self.conn.execute('SELECT key, size FROM responses ORDER BY last_used')
+        for key, size in cursor:
+            if freed >= excess:
+                break
+            evicted.append((key,))
+            freed += size
+        cursor.close()
+        self.conn.executemany('DELETE FROM responses WHERE key = ?', evicted)
+        self.conn.execute('UPDATE responses_size SET total = total - ?', (freed,))
+
+    def summary(self) -> str:
+        return f"Response cache: {self.hits} hits, {self.misses} misses."
@@ -0,0 +1,60 @@
+"""
+Compares the per-ID `get_card_data` lookup (one connection and one JSON parse per card)
+with the batched `CardLookup` engine reading the projected cards table, and with the
+memory-mapped `CardIndex` file.
+
+Run from the repository root: python -m benchmarks.bench_card_lookup
+"""
+import os
+import random
+import tempfile
+import time
+import click
+from benchmarks.synthetic import write_bulk_file
+from card_index import CardIndex
+from card_lookup import CardLookup
+from db_loader import load_db, write_card_index
+from scryfall_data_enhancer import get_card_data
+
+@click.command()
+@click.option('--cards', default=50_000, help='Number of cards in the synthetic database.')
+@click.option('--lookups', default=50_000, help='Number of IDs in the synthetic collection.')
+def main(cards, lookups):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bulk_file = os.path.join(tmp_dir, 'all_cards.json')
+        db_path = os.path.join(tmp_dir, 'cards.db')
+        index_path = os.path.join(tmp_dir, 'cards.idx')
+        ids = write_bulk_file(bulk_file, cards)
+        load_db(bulk_file, db_path)
+        write_card_index(db_path, index_path)
+
+        # Collections repeat printings and contain IDs that are not in the database
+        rng = random.Random(1)
+        collection = [rng.choice(ids) for _ in range(lookups - lookups // 100)]
+        collection += [f"00000000-0000-4000-8000-{i:012x}" for i in range(lookups // 100)]
+        rng.shuffle(collection)
+
+        start = time.perf_counter()
+        per_id = [get_card_data(id=card_id, db_path=db_path) for card_id in collection]
+        per_id_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with CardLookup(db_path) as lookup:
+            batched = [details for _, details in lookup.iter_cards(collection)]
+        batched_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with CardIndex(index_path) as index:
+            indexed = [details for _, details in index.iter_cards(collection)]
+        indexed_seconds = time.perf_counter() - start
+
+        assert [details and details['name'] for details in per_id] == [details and details['name'] for details in batched], \
+            "Batched lookup returned different cards"
+        assert batched == indexed, "Card index returned different cards"
+        print(f"{len(collection)} lookups against {cards} cards")
+        print(f"  get_card_data per ID: {per_id_seconds:.2f}s")
+        print(f"  CardLookup batched:   {batched_seconds:.2f}s ({per_id_seconds / batched_seconds:.1f}x faster)")
+        print(f"  CardIndex mmap:       {indexed_seconds:.2f}s ({per_id_seconds / indexed_seconds:.1f}x faster)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Compares the one-pass `create_all_color_identity_csvs` fan-out with the previous loop
+that ran `create_color_identity_csv` once per color identity.
+
+Run from the repository root: python -m benchmarks.bench_color_identity_fanout
+"""
+import contextlib
+import csv
+import io
+import os
+import random
+import tempfile
+import time
+import click
+from benchmarks.synthetic import COLORS
+from scryfall_data_enhancer import COLOR_IDENTITIES, ENHANCED_HEADERS, create_all_color_identity_csvs, create_color_identity_csv
+
+def write_commander_legal_file(path: str, rows: int, seed: int = 0):
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(ENHANCED_HEADERS)
+        for i in range(rows):
+            color_identity = ''.join(sorted(rng.sample(COLORS, rng.choice([0, 1, 1, 1, 2, 2, 3, 4, 5]))))
+            writer.writerow([f"Card {i}", f"id-{i}", 'True', color_identity, '{1}', '1', 'Instant', '', '', 'Draw a card.'])
+
+@click.command()
+@click.option('--rows', default=50_000, help='Number of rows in the synthetic commander legal CSV.')
+def main(rows):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        inputs = {}
+        for mode in ['per-color', 'fan-out']:
+            os.mkdir(os.path.join(tmp_dir, mode))
+            inputs[mode] = os.path.join(tmp_dir, mode, 'commander-legal.csv')
+            write_commander_legal_file(inputs[mode], rows)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            per_color_files = [create_color_identity_csv(inputs['per-color'], color_info) for color_info in COLOR_IDENTITIES.values()]
+            per_color_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            fan_out_files = create_all_color_identity_csvs(inputs['fan-out'])
+            fan_out_seconds = time.perf_counter() - start
+
+        for per_color_file, fan_out_file in zip(per_color_files, fan_out_files):
+            with open(per_color_file, 'rb') as expected, open(fan_out_file, 'rb') as actual:
+                assert actual.read() == expected.read(), f"{fan_out_file} differs"
+
+        print(f"{rows} rows into {len(COLOR_IDENTITIES)} color identity CSVs")
+        print(f"  per-color loop: {per_color_seconds:.2f}s")
+        print(f"  one-pass fan-out: {fan_out_seconds:.2f}s ({per_color_seconds / fan_out_seconds:.1f}x faster)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Compares the row-by-row stage pipeline with the pandas columnar engine on a synthetic
+collection, and checks that both write the same files.
+
+Run from the repository root: python -m benchmarks.bench_columnar
+"""
+import contextlib
+import csv
+import io
+import os
+import random
+import tempfile
+import time
+import click
+from benchmarks.synthetic import write_bulk_file
+from columnar import run_columnar_pipeline
+from db_loader import load_db
+from scryfall_data_enhancer import create_all_color_identity_csvs, enhance_card_data, filter_commander_legal, generate_commander_combinations, reduce_collection_csv
+
+def write_manabox_file(path: str, ids: list[str], rows: int, seed: int = 0):
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Name', 'Foil', 'Quantity', 'Scryfall ID', 'Purchase price'])
+        for _ in range(rows):
+            writer.writerow(['', rng.choice(['normal', 'foil']), rng.randint(1, 4), rng.choice(ids), f"{rng.uniform(0, 20):.2f}"])
+
+@click.command()
+@click.option('--cards', default=20_000, help='Number of cards in the synthetic database.')
+@click.option('--rows', default=50_000, help='Number of lines in the synthetic ManaBox export.')
+def main(cards, rows):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bulk_file = os.path.join(tmp_dir, 'all_cards.json')
+        card_db = os.path.join(tmp_dir, 'cards.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            ids = write_bulk_file(bulk_file, cards)
+            load_db(bulk_file, card_db, bulk=True)
+
+        collection_files = {}
+        for mode in ['rows', 'columnar']:
+            os.mkdir(os.path.join(tmp_dir, mode))
+            collection_files[mode] = os.path.join(tmp_dir, mode, 'collection.csv')
+            write_manabox_file(collection_files[mode], ids, rows)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            commander_legal_file = filter_commander_legal(enhance_card_data(reduce_collection_csv(collection_files['rows']), card_db))
+            create_all_color_identity_csvs(commander_legal_file)
+            generate_commander_combinations(commander_legal_file)
+            rows_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            created_files = run_columnar_pipeline(collection_files['columnar'], card_db)
+            columnar_seconds = time.perf_counter() - start
+
+        for columnar_file in created_files:
+            with open(columnar_file, 'rb') as actual, open(columnar_file.replace(os.path.join(tmp_dir, 'columnar'), os.path.join(tmp_dir, 'rows')), 'rb') as expected:
+                assert actual.read() == expected.read(), f"{columnar_file} differs"
+
+        print(f"{rows} collection lines against {cards} cards, {len(created_files)} output files")
+        print(f"  row by row: {rows_seconds:.2f}s")
+        print(f"  columnar:   {columnar_seconds:.2f}s ({rows_seconds / columnar_seconds:.1f}x faster)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+Measures bulk data parse throughput for every installed ijson backend, with numbers
+parsed as Decimals (the ijson default) and as floats.
+
+Run from the repository root: python -m benchmarks.bench_ijson_backends
+"""
+import os
+import tempfile
+import time
+import click
+import ijson
+from benchmarks.synthetic import write_bulk_file
+from db_loader import IJSON_BACKENDS
+
+@click.command()
+@click.option('--cards', default=50_000, help='Number of cards in the synthetic bulk file.')
+def main(cards):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bulk_file = os.path.join(tmp_dir, 'all_cards.json')
+        write_bulk_file(bulk_file, cards)
+        size_mb = os.path.getsize(bulk_file) / (1024 * 1024)
+        print(f"{cards} cards, {size_mb:.1f} MiB")
+
+        for name in IJSON_BACKENDS:
+            try:
+                backend = ijson.get_backend(name)
+            except ImportError:
+                print(f"  {name}: not installed")
+                continue
+            for use_float in [False, True]:
+                start = time.perf_counter()
+                with open(bulk_file, 'rb') as f:
+                    parsed = sum(1 for _ in backend.items(f, 'item', use_float=use_float))
+                seconds = time.perf_counter() - start
+                assert parsed == cards
+                print(f"  {name:<10} use_float={use_float!s:<5}: {seconds:.2f}s ({size_mb / seconds:.1f} MiB/s, {cards / seconds:.0f} cards/s)")
+
+if __name__ == '__main__':
+    main()
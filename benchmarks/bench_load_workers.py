@@ -0,0 +1,43 @@
+"""
+Compares bulk database loads with 1, 2, 4 and 8 encoding worker processes.
+
+Run from the repository root: python -m benchmarks.bench_load_workers
+"""
+import os
+import sqlite3
+import tempfile
+import time
+import click
+from benchmarks.synthetic import write_bulk_file
+from db_loader import load_db
+
+def _table_contents(db_path: str) -> list:
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute('SELECT * FROM cards ORDER BY id').fetchall()
+
+@click.command()
+@click.option('--cards', default=100_000, help='Number of cards in the synthetic bulk file.')
+@click.option('--store-json/--no-store-json', default=True, help='Also store the raw card objects.')
+def main(cards, store_json):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bulk_file = os.path.join(tmp_dir, 'all_cards.json')
+        write_bulk_file(bulk_file, cards)
+
+        results = []
+        baseline = None
+        for workers in [1, 2, 4, 8]:
+            db_path = os.path.join(tmp_dir, f"cards-{workers}.db")
+            start = time.perf_counter()
+            load_db(bulk_file, db_path, store_json=store_json, bulk=True, workers=workers)
+            results.append((workers, time.perf_counter() - start))
+            contents = _table_contents(db_path)
+            if baseline is None:
+                baseline = contents
+            assert contents == baseline, f"Load with {workers} workers produced different rows"
+
+        print(f"\n{cards} cards, store_json={store_json}, {os.cpu_count()} CPUs")
+        for workers, seconds in results:
+            print(f"  {workers} worker(s): {seconds:.2f}s ({cards / seconds:.0f} rows/s, {results[0][1] / seconds:.2f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import csv
+import json
+import random
+import uuid
+
+COLORS = ['W', 'U', 'B', 'R', 'G']
+TYPE_LINES = ['Instant', 'Sorcery', 'Artifact', 'Enchantment', 'Creature — Human Soldier', 'Legendary Creature — Elf Druid', 'Land']
+
+def make_card(rng: random.Random) -> dict:
+    """
+    Builds a card object shaped like an entry of the Scryfall `all_cards` bulk file.
+    Args:
+        rng: Random number generator, seed it for reproducible data
+    Returns:
+        dict: Synthetic Scryfall card object
+    """
+    color_identity = sorted(rng.sample(COLORS, rng.randint(0, 3)))
+    type_line = rng.choice(TYPE_LINES)
+    card = {
+        'object': 'card',
+        'id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        'oracle_id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        'lang': 'en',
+        'name': f"Synthetic Card {rng.getrandbits(32):08x}",
+        'mana_cost': ''.join(f"{{{color}}}" for color in color_identity),
+        'cmc': float(len(color_identity)),
+        'type_line': type_line,
+        'oracle_text': "When this enters, draw a card.\nWhenever you cast a spell, put a +1/+1 counter on target creature. " * rng.randint(1, 4),
+        'colors': color_identity,
+        'color_identity': color_identity,
+        'keywords': [],
+        'legalities': {format_name: rng.choice(['legal', 'not_legal', 'banned']) for format_name in ['standard', 'modern', 'legacy', 'vintage', 'commander']},
+        'set': 'syn',
+        'set_name': 'Synthetic',
+        'collector_number': str(rng.randint(1, 400)),
+        'rarity': rng.choice(['common', 'uncommon', 'rare', 'mythic']),
+        'prices': {'usd': f"{rng.uniform(0, 100):.2f}", 'usd_foil': None},
+        'image_uris': {size: f"https://example.invalid/{size}.jpg" for size in ['small', 'normal', 'large', 'png', 'art_crop', 'border_crop']},
+    }
+    if 'Creature' in type_line:
+        card['power'] = str(rng.randint(0, 6))
+        card['toughness'] = str(rng.randint(1, 6))
+    return card
+
+def write_bulk_file(path: str, count: int, seed: int = 0) -> list[str]:
+    """
+    Writes a synthetic `all_cards` style JSON array to disk.
+    Args:
+        path: Path of the JSON file to write
+        count: Number of card objects to generate
+        seed: Seed for the random number generator
+    Returns:
+        list: The Scryfall IDs of the generated cards, in file order
+    """
+    rng = random.Random(seed)
+    ids = []
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[\n')
+        for i in range(count):
+            card = make_card(rng)
+            ids.append(card['id'])
+            f.write(('' if i == 0 else ',\n') + json.dumps(card, ensure_ascii=False))
+        f.write('\n]\n')
+    return ids
+
+def write_collection_file(path: str, ids: list[str]):
+    """
+    Writes a reduced collection CSV (name, scryfall_id) for the given IDs.
+    Args:
+        path: Path of the CSV file to write
+        ids: Scryfall IDs to include, in order
+    """
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name', 'scryfall_id'])
+        for card_id in ids:
+            writer.writerow(['', card_id])
@@ -0,0 +1,139 @@
+import bisect
+import json
+import mmap
+from typing import Iterable, Iterator
+from card_lookup import DEFAULT_CACHE_SIZE, CardLookup
+from db_loader import CARD_INDEX_FANOUT, CARD_INDEX_HEADER, CARD_INDEX_MAGIC, CARD_INDEX_OFFSET, CARD_INDEX_RECORD_LENGTH
+
+class _SortedKeys:
+    """Sequence view of the sorted id keys of a card index, for bisect."""
+    def __init__(self, buffer: mmap.mmap, offset: int, count: int):
+        self.buffer = buffer
+        self.offset = offset
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i: int) -> bytes:
+        start = self.offset + i * 16
+        return self.buffer[start:start + 16]
+
+class CardIndex:
+    """
+    Read-only card lookups against a card index file written by db_loader.write_card_index.
+
+    The file is memory-mapped and IDs are found by binary search over its sorted keys, so
+    opening it is instant, nothing but the requested records is read, and processes
+    enhancing different collections at once share the operating system's page cache.
+    """
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self.found = 0
+        self.missing = 0
+        # Decoded records by offset, shared by every printing of a card
+        self.records = {}
+        with open(index_path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, columns_length = CARD_INDEX_HEADER.unpack_from(self.buffer, 0)
+        if magic != CARD_INDEX_MAGIC:
+            self.buffer.close()
+            raise ValueError(f"'{index_path}' is not a card index, write it with db_loader --index-file")
+        columns_offset = CARD_INDEX_HEADER.size
+        self.columns = json.loads(self.buffer[columns_offset:columns_offset + columns_length])
+        self.fanout_offset = columns_offset + columns_length
+        self.keys = _SortedKeys(self.buffer, self.fanout_offset + CARD_INDEX_FANOUT.size, self.count)
+        self.offsets_offset = self.keys.offset + self.count * 16
+
+    def close(self):
+        self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, card_id: str) -> dict | None:
+        """
+        Args:
+            card_id (str): Scryfall ID of a printing
+        Returns:
+            dict: Card record keyed like CardLookup records, or None if the ID is not indexed
+        """
+        try:
+            key = bytes.fromhex(card_id.replace('-', ''))
+        except ValueError:
+            return None
+        if len(key) != 16:
+            return None
+        prefix = key[0] << 8 | key[1]
+        low = self._fanout(prefix - 1) if prefix else 0
+        high = self._fanout(prefix)
+        i = bisect.bisect_left(self.keys, key, low, high)
+        if i == high or self.keys[i] != key:
+            return None
+        (record_offset,) = CARD_INDEX_OFFSET.unpack_from(self.buffer, self.offsets_offset + i * CARD_INDEX_OFFSET.size)
+        record = self.records.get(record_offset)
+        if record is None:
+            (record_length,) = CARD_INDEX_RECORD_LENGTH.unpack_from(self.buffer, record_offset)
+            record_start = record_offset + CARD_INDEX_RECORD_LENGTH.size
+            record = self.records[record_offset] = dict(zip(self.columns, json.loads(self.buffer[record_start:record_start + record_length])))
+        return {'id': card_id, **record}
+
+    def _fanout(self, prefix: int) -> int:
+        return int.from_bytes(self.buffer[self.fanout_offset + prefix * 4:self.fanout_offset + prefix * 4 + 4], 'little')
+
+    def get_cards(self, ids: Iterable[str]) -> dict[str, dict]:
+        """
+        Looks up every given ID.
+        Args:
+            ids: Scryfall IDs to resolve, duplicates are allowed
+        Returns:
+            dict: Card records keyed by Scryfall ID, IDs that are not in the index are absent
+        """
+        return {card_id: record for card_id, record in self.iter_cards(dict.fromkeys(ids)) if record is not None}
+
+    def commander_cards(self, ids: Iterable[str]) -> list[dict]:
+        """
+        Finds the cards among the given IDs that can lead a deck, like CardLookup.commander_cards.
+        Args:
+            ids: Scryfall IDs to search, e.g. the cards of a collection
+        Returns:
+            list: Card records with non-zero commander flags, in input order without duplicates
+        """
+        return [record for record in self.get_cards(ids).values() if record['commander_flags']]
+
+    def iter_cards(self, ids: Iterable[str]) -> Iterator[tuple[str, dict | None]]:
+        """
+        Resolves IDs in input order.
+        Args:
+            ids: Scryfall IDs to resolve
+        Yields:
+            tuple: (Scryfall ID, card record or None if the ID is not in the index)
+        """
+        for card_id in ids:
+            record = self.get(card_id)
+            if record is None:
+                self.missing += 1
+            else:
+                self.found += 1
+            yield card_id, record
+
+    def summary(self) -> str:
+        return f"Card index: {self.found} found, {self.missing} missing."
+
+def open_card_source(card_db: str, cache_size: int = DEFAULT_CACHE_SIZE, warm_cache: str | None = None) -> CardLookup | CardIndex:
+    """
+    Opens a card database for lookups, either a card index file or a SQLite database.
+    Args:
+        card_db (str): Path to a card index file or a SQLite card database
+        cache_size (int): Number of records cached by a SQLite lookup
+        warm_cache (str): Path of the warm cache file of a SQLite lookup
+    Returns:
+        CardIndex or CardLookup: Open lookup, use it as a context manager
+    """
+    with open(card_db, 'rb') as f:
+        if f.read(len(CARD_INDEX_MAGIC)) == CARD_INDEX_MAGIC:
+            return CardIndex(card_db)
+    return CardLookup(card_db, cache_size=cache_size, warm_cache_path=warm_cache)
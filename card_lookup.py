@@ -0,0 +1,238 @@
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Iterator
+from color_identity import ColorMaskIndex
+from db_loader import CARD_RECORD_COLUMNS
+
+DEFAULT_CACHE_SIZE = 10000
+# Returned by CardCache.get for IDs that are not cached, None is cached for IDs missing from the database
+MISSING = object()
+
+def database_version(db_path: str) -> str:
+    """
+    Identifies the contents of a card database file. Loading or refreshing the database
+    changes the version, so warm caches built from an older version are ignored.
+    """
+    stat = os.stat(db_path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+class CardCache:
+    """
+    Bounded LRU cache of card records keyed by Scryfall ID, counting the hits and misses of
+    the lookups in front of it. It can be saved to and loaded from a warm cache file.
+    """
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self.records = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, card_id: str, default=MISSING):
+        record = self.records.get(card_id, default)
+        if record is not default:
+            self.records.move_to_end(card_id)
+        return record
+
+    def put(self, card_id: str, record: dict | None):
+        if self.max_size <= 0:
+            return
+        self.records[card_id] = record
+        self.records.move_to_end(card_id)
+        if len(self.records) > self.max_size:
+            self.records.popitem(last=False)
+
+    def save(self, path: str, db_version: str):
+        """
+        Writes the cached records to a warm cache file.
+        Args:
+            path (str): Path of the warm cache file
+            db_version (str): Version of the database the records were read from
+        """
+        records = [(card_id, None if record is None else tuple(record[column] for column in CARD_RECORD_COLUMNS))
+                   for card_id, record in self.records.items()]
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'db_version': db_version, 'columns': CARD_RECORD_COLUMNS, 'records': records}, f)
+        os.replace(temp_path, path)
+
+    def load(self, path: str, db_version: str) -> bool:
+        """
+        Fills the cache from a warm cache file, unless it was written for another version of
+        the database or with other columns, or cannot be read.
+        Args:
+            path (str): Path of the warm cache file
+            db_version (str): Version of the database being looked up
+        Returns:
+            bool: Whether the warm cache was used
+        """
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                warm_cache = json.load(f)
+            if warm_cache['db_version'] != db_version or warm_cache['columns'] != CARD_RECORD_COLUMNS:
+                print(f"Ignoring warm cache '{path}', it was built for another version of the card database.")
+                return False
+            records = [(card_id, None if values is None else dict(zip(CARD_RECORD_COLUMNS, values, strict=True)))
+                       for card_id, values in warm_cache['records']]
+        except (OSError, ValueError, KeyError, TypeError):
+            # Truncated files and files in an older format are rebuilt on close
+            print(f"Ignoring warm cache '{path}', it could not be read.")
+            return False
+        for card_id, record in records:
+            self.put(card_id, record)
+        print(f"Loaded {len(self)} cards from warm cache '{path}'.")
+        return True
+
+class CardLookup:
+    """
+    Resolves Scryfall IDs against the card database in bulk.
+
+    A single read-only connection is kept open for the lifetime of the lookup, and IDs are
+    resolved with chunked `WHERE id IN (...)` queries instead of one connection, one point
+    query and one JSON parse per card. Printing IDs are first mapped to their oracle IDs, and
+    each oracle card is read once no matter how many printings of it are looked up.
+
+    Resolved records are kept in an LRU cache, so IDs repeated across a collection are only
+    queried once, and the cache can be persisted to a warm cache file for later runs against
+    the same database.
+    """
+    def __init__(self, db_path: str, chunk_size: int = 500, cache_size: int = DEFAULT_CACHE_SIZE, warm_cache_path: str | None = None):
+        self.db_path = db_path
+        self.db_version = database_version(db_path)
+        self.warm_cache_path = warm_cache_path
+        self.cache = CardCache(cache_size)
+        # Oracle records by oracle_id, shared by the printings resolved to them
+        self.oracle_cache = CardCache(cache_size)
+        # Stay well below SQLite's default limit on bound parameters per statement
+        self.chunk_size = chunk_size
+        self.conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+        if self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = 'cards'").fetchone() is None:
+            self.conn.close()
+            raise ValueError(f"'{db_path}' has no cards view, load it with db_loader")
+        if warm_cache_path:
+            self.cache.load(warm_cache_path, self.db_version)
+
+    def close(self):
+        self.conn.close()
+        if self.warm_cache_path:
+            self.cache.save(self.warm_cache_path, self.db_version)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _fetch_chunk(self, ids: list[str]) -> dict[str, dict]:
+        placeholders = ','.join('?' * len(ids))
+        oracle_ids = dict(self.conn.execute(f"SELECT id, oracle_id FROM printings WHERE id IN ({placeholders})", ids))
+        # Cached records are taken out up front, the puts below may evict them from the cache
+        found = {}
+        pending = []
+        for oracle_id in dict.fromkeys(oracle_ids.values()):
+            oracle_record = self.oracle_cache.get(oracle_id)
+            if oracle_record is MISSING:
+                pending.append(oracle_id)
+            else:
+                found[oracle_id] = oracle_record
+        self.oracle_cache.misses += len(pending)
+        self.oracle_cache.hits += len(oracle_ids) - len(pending)
+        if pending:
+            placeholders = ','.join('?' * len(pending))
+            oracle_columns = ['oracle_id'] + CARD_RECORD_COLUMNS[1:]
+            cursor = self.conn.execute(f"SELECT {', '.join(oracle_columns)} FROM oracle_cards WHERE oracle_id IN ({placeholders})", pending)
+            for row in cursor:
+                found[row[0]] = dict(zip(CARD_RECORD_COLUMNS[1:], row[1:]))
+                self.oracle_cache.put(row[0], found[row[0]])
+        records = {}
+        for card_id, oracle_id in oracle_ids.items():
+            records[card_id] = {'id': card_id, **found[oracle_id]}
+        return records
+
+    def get_cards(self, ids: Iterable[str]) -> dict[str, dict]:
+        """
+        Looks up every given ID.
+        Args:
+            ids: Scryfall IDs to resolve, duplicates are allowed
+        Returns:
+            dict: Card records keyed by Scryfall ID, IDs that are not in the database are absent
+        """
+        return {card_id: record for card_id, record in self.iter_cards(dict.fromkeys(ids)) if record is not None}
+
+    def iter_cards(self, ids: Iterable[str]) -> Iterator[tuple[str, dict | None]]:
+        """
+        Resolves IDs one chunk at a time, preserving the input order.
+        Args:
+            ids: Scryfall IDs to resolve
+        Yields:
+            tuple: (Scryfall ID, card record or None if the ID is not in the database)
+        """
+        pending = []
+        for card_id in ids:
+            pending.append(card_id)
+            if len(pending) >= self.chunk_size:
+                yield from self._resolve_in_order(pending)
+                pending = []
+        if pending:
+            yield from self._resolve_in_order(pending)
+
+    def _resolve_in_order(self, ids: list[str]) -> Iterator[tuple[str, dict | None]]:
+        resolved = {}
+        pending = []
+        for card_id in dict.fromkeys(ids):
+            record = self.cache.get(card_id)
+            if record is MISSING:
+                pending.append(card_id)
+            else:
+                resolved[card_id] = record
+        if pending:
+            found = self._fetch_chunk(pending)
+            for card_id in pending:
+                resolved[card_id] = found.get(card_id)
+                self.cache.put(card_id, resolved[card_id])
+        # Repeats of an ID within the chunk count as hits, only the query is a miss
+        self.cache.misses += len(pending)
+        self.cache.hits += len(ids) - len(pending)
+        for card_id in ids:
+            yield card_id, resolved[card_id]
+
+    def summary(self) -> str:
+        return f"Card cache: {self.cache.hits} hits, {self.cache.misses} misses."
+
+    def commander_cards(self, ids: Iterable[str]) -> list[dict]:
+        """
+        Finds the cards among the given IDs that can lead a deck, using the commander flags
+        computed when the database was built instead of scanning oracle text.
+        Args:
+            ids: Scryfall IDs to search, e.g. the cards of a collection
+        Returns:
+            list: Card records with non-zero commander flags, in input order without duplicates
+        """
+        unique_ids = list(dict.fromkeys(ids))
+        found = {}
+        for start in range(0, len(unique_ids), self.chunk_size):
+            chunk = unique_ids[start:start + self.chunk_size]
+            placeholders = ','.join('?' * len(chunk))
+            cursor = self.conn.execute(f"SELECT {', '.join(CARD_RECORD_COLUMNS)} FROM cards WHERE commander_flags != 0 AND id IN ({placeholders})", chunk)
+            found.update((row[0], dict(zip(CARD_RECORD_COLUMNS, row))) for row in cursor)
+        return [found[card_id] for card_id in unique_ids if card_id in found]
+
+    def color_index(self, ids: Iterable[str]) -> ColorMaskIndex:
+        """
+        Indexes the given cards by their stored color mask.
+        Args:
+            ids: Scryfall IDs to index, e.g. the cards of a collection
+        Returns:
+            ColorMaskIndex: Index answering which of the cards fit a color identity
+        """
+        index = ColorMaskIndex()
+        for card_id, record in self.get_cards(ids).items():
+            index.add(card_id, record['color_mask'])
+        return index
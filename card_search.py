@@ -0,0 +1,68 @@
+import csv
+import sqlite3
+from pathlib import Path
+from typing import Iterable
+from color_identity import color_mask
+from db_loader import CARD_RECORD_COLUMNS
+
+SEARCH_RESULT_COLUMNS = ['oracle_id'] + CARD_RECORD_COLUMNS[1:]
+# Scryfall ID column of a ManaBox export and of the CSVs written by the enhancer
+COLLECTION_ID_COLUMNS = ['Scryfall ID', 'scryfall_id']
+
+def read_collection_ids(collection_file: str) -> set[str]:
+    """
+    Reads the Scryfall IDs of a ManaBox export or of any CSV written by the enhancer.
+    Args:
+        collection_file (str): Path to the collection CSV file
+    Returns:
+        set: Scryfall IDs in the collection
+    """
+    with open(collection_file, mode='r', newline='', encoding='utf-8') as csvfile:
+        reader = csv.DictReader(csvfile)
+        id_column = next((column for column in COLLECTION_ID_COLUMNS if column in (reader.fieldnames or [])), None)
+        if id_column is None:
+            raise ValueError(f"'{collection_file}' has none of the columns {', '.join(COLLECTION_ID_COLUMNS)}")
+        return {row[id_column] for row in reader if row[id_column]}
+
+def search_cards(db_path: str, query: str, identity: str | None = None, card_ids: Iterable[str] | None = None, limit: int | None = None) -> list[dict]:
+    """
+    Searches the name, type line and rules text of the oracle cards.
+
+    The query uses the SQLite FTS5 syntax: terms are stemmed, so 'counter' also matches
+    'counters', and can be combined with AND, OR, NOT and parentheses or restricted to a
+    column, e.g. 'counters AND type_line:(creature OR planeswalker)'.
+    Args:
+        db_path (str): Path to the SQLite card database
+        query (str): FTS5 full-text query
+        identity (str): Only return cards that fit within this color identity, e.g. 'rw'
+        card_ids (iterable): Only return cards with a printing among these Scryfall IDs
+        limit (int): Return at most this many cards
+    Returns:
+        list: Matching oracle cards as dicts of SEARCH_RESULT_COLUMNS, best matches first
+    """
+    conditions = ['oracle_cards_search MATCH ?']
+    params = [query]
+    if identity is not None:
+        # The mask fits when it adds no colors, cards with unknown colors never fit
+        conditions.append('(oracle_cards.color_mask | ?) = ?')
+        params += [color_mask(identity)] * 2
+    # Read-only, a mistyped path fails instead of creating an empty database, the temp table
+    # of owned IDs lives in the temp database
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        if card_ids is not None:
+            conn.execute('CREATE TEMP TABLE owned (id TEXT PRIMARY KEY)')
+            conn.executemany('INSERT OR IGNORE INTO owned (id) VALUES (?)', ((card_id,) for card_id in card_ids))
+            conditions.append('oracle_cards.oracle_id IN (SELECT oracle_id FROM printings JOIN owned ON owned.id = printings.id)')
+        sql = f'''
+        SELECT {', '.join(f"oracle_cards.{column}" for column in SEARCH_RESULT_COLUMNS)}
+        FROM oracle_cards_search JOIN oracle_cards ON oracle_cards.rowid = oracle_cards_search.rowid
+        WHERE {' AND '.join(conditions)}
+        ORDER BY oracle_cards_search.rank
+        '''
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return [dict(zip(SEARCH_RESULT_COLUMNS, row)) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+
+DEFAULT_CONCURRENCY = 4
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter. Tokens refill at `rate` per second up to
+    `capacity`, and every acquire takes one token, waiting for it if the bucket is empty.
+    """
+    def __init__(self, rate: float, capacity: float = 1, clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+def dispatch_chunks(chunks: Iterable, work: Callable, concurrency: int = DEFAULT_CONCURRENCY, rate_limiter: TokenBucket | None = None) -> list:
+    """
+    Runs `work` on every chunk on a pool of threads, for blocking calls such as LLM requests.
+    Args:
+        chunks (iterable): Chunks to process
+        work (callable): Function processing one chunk, called from several threads at once
+        concurrency (int): Maximum number of chunks processed at the same time
+        rate_limiter (TokenBucket): Limits how often a chunk is started, if given
+    Returns:
+        list: Results of `work`, in chunk order
+    """
+    def run(chunk):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        return work(chunk)
+
+    concurrency = max(1, concurrency)
+    results = []
+    # Chunks are pulled from the iterable as the pool frees up, so a lazy iterable is never
+    # read far ahead of the requests
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        try:
+            for chunk in chunks:
+                in_flight.append(executor.submit(run, chunk))
+                if len(in_flight) > concurrency:
+                    results.append(in_flight.popleft().result())
+            while in_flight:
+                results.append(in_flight.popleft().result())
+        except BaseException:
+            # Chunks that have not started yet are dropped, the ones in flight still finish
+            for future in in_flight:
+                future.cancel()
+            raise
+    return results
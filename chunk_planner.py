@@ -0,0 +1,80 @@
+import math
+from typing import Callable, Iterable, Iterator
+
+# Rough average for English rules text with OpenAI style tokenizers, close enough for
+# packing chunks without depending on the tokenizer of every model
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def name_output_tokens(card: dict) -> int:
+    """
+    Estimated completion tokens of naming a card once in a JSON list of names.
+    """
+    return estimate_tokens(card.get('name', '')) + 2  # The quotes and comma of a JSON list
+
+class ChunkPlan:
+    """
+    Cards packed into chunks that each fit a prompt token budget. It can be iterated like
+    filter_cards.CardChunks.
+    """
+    def __init__(self, chunks: list[list[dict]], prompt_tokens: list[int], token_budget: int, oversized: int):
+        self.chunks = chunks
+        self.prompt_tokens = prompt_tokens  # Estimated prompt tokens of each chunk
+        self.token_budget = token_budget
+        self.oversized = oversized  # Cards over the budget on their own, sent in a chunk of one
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def iter_from(self, start_chunk: int) -> Iterator[tuple[int, list[dict]]]:
+        return ((i, self.chunks[i]) for i in range(start_chunk, len(self.chunks)))
+
+    def summary(self) -> str:
+        cards = sum(len(chunk) for chunk in self.chunks)
+        total = sum(self.prompt_tokens)
+        average = total // len(self.chunks) if self.chunks else 0
+        summary = f"Planned {len(self.chunks)} calls for {cards} cards: about {total} prompt tokens, {average} per call (budget {self.token_budget})."
+        if self.oversized:
+            summary += f" {self.oversized} cards exceed the budget on their own."
+        return summary
+
+def plan_chunks(cards: Iterable[dict], format_card: Callable[[dict], str], token_budget: int, overhead_tokens: int = 0,
+                max_output_tokens: int | None = None, card_output_tokens: Callable[[dict], int] = name_output_tokens, output_overhead_tokens: int = 0) -> ChunkPlan:
+    """
+    Packs cards, in order, into as few chunks as possible without going over a token budget.
+    Args:
+        cards (iterable): Cards to send
+        format_card (callable): Formats a card the way the selector puts it in the prompt
+        token_budget (int): Maximum estimated prompt tokens per call
+        overhead_tokens (int): Estimated tokens of the prompt without any cards
+        max_output_tokens (int): Maximum completion tokens of the model, if capped. The chunk
+            is also kept small enough for a response covering every card of it.
+        card_output_tokens (callable): Estimated completion tokens a card adds to the response
+        output_overhead_tokens (int): Estimated completion tokens of a response without cards
+    Returns:
+        ChunkPlan: The planned chunks
+    """
+    chunks, prompt_tokens = [], []
+    chunk, tokens, output_tokens, oversized = [], overhead_tokens, output_overhead_tokens, 0
+    for card in cards:
+        card_tokens = estimate_tokens(format_card(card)) + 1  # The newline joining the cards
+        card_output = card_output_tokens(card)
+        fits = tokens + card_tokens <= token_budget and (max_output_tokens is None or output_tokens + card_output <= max_output_tokens)
+        if chunk and not fits:
+            chunks.append(chunk)
+            prompt_tokens.append(tokens)
+            chunk, tokens, output_tokens = [], overhead_tokens, output_overhead_tokens
+        if not chunk and overhead_tokens + card_tokens > token_budget:
+            oversized += 1
+        chunk.append(card)
+        tokens += card_tokens
+        output_tokens += card_output
+    if chunk:
+        chunks.append(chunk)
+        prompt_tokens.append(tokens)
+    return ChunkPlan(chunks, prompt_tokens, token_budget, oversized)
@@ -0,0 +1,67 @@
+from collections import defaultdict
+from typing import Iterator
+
+W, U, B, R, G = 1, 2, 4, 8, 16
+COLOR_BITS = {'w': W, 'u': U, 'b': B, 'r': R, 'g': G}
+ALL_COLORS_MASK = W | U | B | R | G
+# Set for any character outside WUBRG, so such an identity never fits a commander
+UNKNOWN_COLOR_BIT = 32
+
+def color_mask(color_identity: str) -> int:
+    """
+    Converts a color identity string such as 'BG' or 'gw' into a 5-bit WUBRG mask.
+    Args:
+        color_identity (str): Color identity letters in any order and case
+    Returns:
+        int: The color mask, with UNKNOWN_COLOR_BIT set if any letter is not a color
+    """
+    mask = 0
+    for color in color_identity.strip().lower():
+        mask |= COLOR_BITS.get(color, UNKNOWN_COLOR_BIT)
+    return mask
+
+def mask_to_color_identity(mask: int) -> str:
+    """
+    Converts a color mask back into a color identity string, lowercase and sorted
+    alphabetically, e.g. 'bgruw'.
+    """
+    return ''.join(sorted(color for color, bit in COLOR_BITS.items() if mask & bit))
+
+def fits_color_mask(mask: int, target_mask: int) -> bool:
+    """
+    Checks whether a card with color mask `mask` can be played under a commander with
+    color mask `target_mask`.
+    """
+    return mask & ~target_mask == 0
+
+def submasks(target_mask: int) -> Iterator[int]:
+    """
+    Yields every color mask that fits within the target mask, including the target itself
+    and colorless.
+    """
+    mask = target_mask
+    while True:
+        yield mask
+        if mask == 0:
+            return
+        mask = (mask - 1) & target_mask
+
+class ColorMaskIndex:
+    """
+    Index of card IDs by color mask, answering which cards fit a color identity by visiting
+    at most 32 buckets instead of checking every card.
+    """
+    def __init__(self):
+        self.ids_by_mask = defaultdict(list)
+
+    def add(self, card_id: str, mask: int):
+        self.ids_by_mask[mask].append(card_id)
+
+    def fitting(self, target_mask: int) -> list[str]:
+        """
+        Args:
+            target_mask (int): Color mask of the commander(s)
+        Returns:
+            list: IDs of the indexed cards that fit the color identity
+        """
+        return [card_id for mask in submasks(target_mask) for card_id in self.ids_by_mask.get(mask, [])]
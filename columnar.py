@@ -0,0 +1,216 @@
+import csv
+import os
+from typing import Iterator
+import pandas as pd
+from card_index import CardIndex, open_card_source
+from card_lookup import DEFAULT_CACHE_SIZE, CardLookup
+from db_loader import CARD_RECORD_COLUMNS
+from scryfall_data_enhancer import COLOR_IDENTITIES, ENHANCED_HEADERS, REDUCED_COLUMN_MAPPING, write_commander_combinations
+
+def write_frame(frame: pd.DataFrame, path: str) -> str:
+    """
+    Writes a DataFrame in the dialect of csv.DictWriter, so the file matches the one written
+    by the row-by-row pipeline byte for byte.
+    """
+    frame.to_csv(path, index=False, lineterminator='\r\n', encoding='utf-8')
+    return path
+
+def read_reduced_frame(collection_file: str) -> pd.DataFrame:
+    """
+    Reads the ManaBox collection CSV and reduces it to the REDUCED_COLUMN_MAPPING columns.
+    Args:
+        collection_file (str): Path to the ManaBox collection CSV file
+    Returns:
+        DataFrame: Reduced collection, every value a string
+    """
+    collection = pd.read_csv(collection_file, dtype=str, keep_default_na=False, usecols=list(REDUCED_COLUMN_MAPPING))
+    return collection[list(REDUCED_COLUMN_MAPPING)].rename(columns=REDUCED_COLUMN_MAPPING)
+
+def enhance_frame(reduced: pd.DataFrame, lookup: CardLookup | CardIndex) -> pd.DataFrame:
+    """
+    Joins the reduced collection against the card records in one merge, dropping cards that
+    are not in the database.
+    Args:
+        reduced (DataFrame): Reduced collection with a scryfall_id column
+        lookup (CardLookup or CardIndex): Open lookup against the card database
+    Returns:
+        DataFrame: The ENHANCED_HEADERS columns formatted like format_enhanced_row, followed
+            by the color_mask, commander_flags and partner_with columns of the card records
+    """
+    records = lookup.get_cards(reduced['scryfall_id'])
+    missing = ~reduced['scryfall_id'].isin(records.keys())
+    if missing.any():
+        print(f" -> Could not fetch details for {missing.sum()} cards. Skipping.")
+    cards = pd.DataFrame.from_records(list(records.values()), columns=CARD_RECORD_COLUMNS)
+    # An inner merge keeps the order of the collection
+    joined = reduced[['scryfall_id']].merge(cards, left_on='scryfall_id', right_on='id', how='inner')
+    return pd.DataFrame({
+        'name': joined['name'],
+        'scryfall_id': joined['scryfall_id'],
+        'commander_legal': joined['commander_legal'].astype(bool).map({True: 'True', False: 'False'}),
+        'color_identity': joined['color_identity'],
+        'mana_cost': joined['mana_cost'],
+        'cmc': joined['cmc'].astype(float).astype(int).astype(str),
+        'type_line': joined['type_line'],
+        'power': joined['power'],
+        'toughness': joined['toughness'],
+        'oracle_text': joined['oracle_text'].str.replace('\n', '|', regex=False),
+        'color_mask': joined['color_mask'].astype(int),
+        'commander_flags': joined['commander_flags'].astype(int),
+        'partner_with': joined['partner_with'],
+    })
+
+def run_columnar_pipeline(collection_file: str, card_db: str, cache_size: int = DEFAULT_CACHE_SIZE, warm_cache: str | None = None) -> list[str]:
+    """
+    Runs the stage-by-stage pipeline on DataFrames instead of row by row.
+
+    The collection is joined against the card records in one merge, and the legality and
+    color identity filters are column operations on the precomputed color masks. Commander
+    combinations use the commander flags of the card database. The output files have the
+    same names and the same bytes as the ones written by the row-by-row pipeline.
+    Args:
+        collection_file (str): Path to the ManaBox collection CSV file
+        card_db (str): Path to the SQLite database or card index file containing card data
+        cache_size (int): Number of card records kept in the lookup cache
+        warm_cache (str): Path of a warm cache file to load before and save after the run
+    Returns:
+        list: Paths to the created CSV files
+    """
+    reduced_file = collection_file.replace('.csv', '-reduced.csv')
+    enhanced_file = reduced_file.replace('.csv', '-enhanced.csv')
+    commander_legal_file = enhanced_file.replace('.csv', '-commander-legal.csv')
+
+    reduced = read_reduced_frame(collection_file)
+    created_files = [write_frame(reduced, reduced_file)]
+    print(f"Enhancing {len(reduced)} cards...")
+    with open_card_source(card_db, cache_size, warm_cache) as lookup:
+        enhanced = enhance_frame(reduced, lookup)
+        print(lookup.summary())
+    created_files.append(write_frame(enhanced[ENHANCED_HEADERS], enhanced_file))
+
+    legal = enhanced[enhanced['commander_legal'] == 'True']
+    created_files.append(write_frame(legal[ENHANCED_HEADERS], commander_legal_file))
+
+    for color_info in COLOR_IDENTITIES.values():
+        # A card fits when its mask is a subset of the commander's, unknown colors never fit
+        fitting = legal[(legal['color_mask'] & ~color_info['color_mask']) == 0]
+        output_file = commander_legal_file.replace('.csv', f"-{color_info['color_identity']}.csv")
+        created_files.append(write_frame(fitting[ENHANCED_HEADERS], output_file))
+        print(f"Successfully wrote {len(fitting)} rows to {output_file}")
+
+    combinations_file = commander_legal_file.replace('.csv', '_commander_combinations.csv')
+    candidates = legal[legal['commander_flags'] != 0][['name', 'color_identity', 'commander_flags', 'partner_with']]
+    created_files.append(write_commander_combinations(candidates.to_dict('records'), combinations_file))
+    return created_files
+
+# Columns of the card CSVs with a type other than string. Oracle text is written with '|'
+# between lines so each card stays on one CSV line, Parquet keeps the real newlines.
+TYPED_COLUMNS = {
+    'commander_legal': lambda column: column == 'True',
+    'cmc': lambda column: column.astype('int64'),
+    'color_identity': lambda column: column.map(list),
+    'oracle_text': lambda column: column.str.replace('|', '\n', regex=False),
+    'quantity': lambda column: column.astype('int64'),
+    'foil_quantity': lambda column: column.astype('int64'),
+    'purchase_price': lambda column: column.astype('float64'),
+}
+
+def typed_card_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts a card CSV read as strings to typed columns: bool legality, int cmc and
+    quantities, float purchase price, color identity as a list of color letters and oracle
+    text with its newlines restored. Columns the frame does not have are skipped.
+    Args:
+        frame (DataFrame): Card CSV read with every value a string
+    Returns:
+        DataFrame: The same columns in the same order, typed
+    """
+    return frame.assign(**{column: convert(frame[column]) for column, convert in TYPED_COLUMNS.items() if column in frame.columns})
+
+def write_parquet_files(csv_files: list[str]) -> list[str]:
+    """
+    Writes a Parquet file with typed columns next to each CSV file. Needs pyarrow.
+    Args:
+        csv_files (list): Paths to the CSV files written by the pipeline
+    Returns:
+        list: Paths to the created Parquet files
+    """
+    parquet_files = []
+    for csv_file in csv_files:
+        parquet_file = os.path.splitext(csv_file)[0] + '.parquet'
+        frame = pd.read_csv(csv_file, dtype=str, keep_default_na=False)
+        typed_card_frame(frame).to_parquet(parquet_file, index=False)
+        parquet_files.append(parquet_file)
+    print(f"Successfully wrote {len(parquet_files)} Parquet files")
+    return parquet_files
+
+def count_card_rows(file_path: str) -> int:
+    """
+    Counts the rows of a card CSV or Parquet file without building any DataFrame. Parquet
+    files know their row count, CSV rows are counted by the csv module so quoted newlines
+    are handled.
+    Args:
+        file_path (str): Path to the CSV or Parquet file
+    Returns:
+        int: Number of rows, not counting the CSV header
+    """
+    if os.path.splitext(file_path)[1] == '.parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(file_path).metadata.num_rows
+    with open(file_path, mode='r', newline='', encoding='utf-8') as csvfile:
+        # Blank lines are skipped by pd.read_csv, so they are not counted either
+        return max(0, sum(1 for row in csv.reader(csvfile) if row) - 1)
+
+def _csv_lines_spanning(file_path: str, rows: int) -> int:
+    """
+    Counts the CSV records after the header, blank lines included, up to and including the
+    given number of card rows. pd.read_csv counts blank lines in skiprows but not in its output.
+    """
+    with open(file_path, mode='r', newline='', encoding='utf-8') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader, None)
+        lines = 0
+        for row in reader:
+            if rows <= 0:
+                break
+            lines += 1
+            if row:
+                rows -= 1
+        return lines
+
+def iter_card_frames(file_path: str, chunk_size: int, columns: list[str] | None = None, skip_rows: int = 0) -> Iterator[pd.DataFrame]:
+    """
+    Reads a card CSV or Parquet file in chunks of rows. Parquet files are recognised by their
+    extension and only the requested columns are read from them.
+    Args:
+        file_path (str): Path to the CSV or Parquet file
+        chunk_size (int): Number of rows per chunk
+        columns (list): Columns to read, all of them if None
+        skip_rows (int): Number of rows to skip before the first chunk, without converting them
+    Yields:
+        DataFrame: The next chunk of rows
+    """
+    if os.path.splitext(file_path)[1] != '.parquet':
+        skiprows = range(1, _csv_lines_spanning(file_path, skip_rows) + 1) if skip_rows else None
+        yield from pd.read_csv(file_path, chunksize=chunk_size, usecols=columns, skiprows=skiprows)
+        return
+    # Imported here as pyarrow is only needed for Parquet files
+    import pyarrow.parquet as pq
+    parquet_file = pq.ParquetFile(file_path)
+    # Whole row groups before skip_rows are never read
+    row_groups = []
+    for i in range(parquet_file.num_row_groups):
+        group_rows = parquet_file.metadata.row_group(i).num_rows
+        if not row_groups and skip_rows >= group_rows:
+            skip_rows -= group_rows
+        else:
+            row_groups.append(i)
+    if not row_groups:
+        return
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns, row_groups=row_groups):
+        if skip_rows >= batch.num_rows:
+            skip_rows -= batch.num_rows
+            continue
+        batch, skip_rows = batch.slice(skip_rows), 0
+        # to_pylist keeps list columns as Python lists rather than numpy arrays
+        yield pd.DataFrame.from_records(batch.to_pylist(), columns=batch.schema.names)
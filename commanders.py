@@ -0,0 +1,205 @@
+import re
+from collections import defaultdict
+from itertools import product
+from typing import Iterable, Iterator
+from color_identity import color_mask, mask_to_color_identity, submasks
+
+COMMANDER_COMBINATION_HEADERS = ['commander_1', 'commander_2', 'combined_color_identity']
+
+# Bits of the commander flags computed by classify_commander
+LEGENDARY_CREATURE = 1
+PARTNER = 2  # "Partner" (not "Partner with")
+PARTNER_WITH = 4
+FRIENDS_FOREVER = 8
+CHOOSE_A_BACKGROUND = 16
+BACKGROUND = 32
+PLANESWALKER_COMMANDER = 64  # Planeswalkers that "can be your commander"
+LEGENDARY_ARTIFACT = 128  # Legendary artifacts with power and toughness
+
+# All oracle text keywords in one pattern, so each card is scanned once. The partner name
+# runs up to the reminder text or the end of the line, which is '|' in the enhanced CSV.
+ORACLE_KEYWORDS = re.compile(
+    r'(?P<partner_with>partner with (?P<partner_name>[^(\n|]+))'
+    r'|(?P<partner>partner)'
+    r'|(?P<friends_forever>friends forever)'
+    r'|(?P<choose_a_background>choose a background)'
+    r'|(?P<can_be_your_commander>can be your commander)',
+    re.IGNORECASE,
+)
+
+def classify_commander(type_line: str, oracle_text: str, power: str = '', toughness: str = '') -> tuple[int, str]:
+    """
+    Classifies how a card can lead a deck.
+    Args:
+        type_line (str): Type line of the card
+        oracle_text (str): Oracle text of the card, lines separated by newlines or '|'
+        power (str): Power of the card, if any
+        toughness (str): Toughness of the card, if any
+    Returns:
+        tuple: (commander flags, name of the "Partner with" card or '')
+    """
+    keywords = set()
+    partner_name = ''
+    for match in ORACLE_KEYWORDS.finditer(oracle_text):
+        if match.group('partner_with'):
+            keywords.add('partner_with')
+            partner_name = partner_name or match.group('partner_name').strip()
+        else:
+            keywords.add(match.lastgroup)
+    type_line = type_line.lower()
+
+    flags = 0
+    if 'legendary' in type_line and 'creature' in type_line:
+        flags |= LEGENDARY_CREATURE
+        if 'partner_with' in keywords:
+            flags |= PARTNER_WITH
+        elif 'partner' in keywords:
+            flags |= PARTNER
+        elif 'friends_forever' in keywords:
+            flags |= FRIENDS_FOREVER
+        if 'choose_a_background' in keywords:
+            flags |= CHOOSE_A_BACKGROUND
+    elif 'planeswalker' in type_line and 'can_be_your_commander' in keywords:
+        flags |= PLANESWALKER_COMMANDER
+    elif 'legendary' in type_line and 'enchantment' in type_line and 'background' in type_line:
+        flags |= BACKGROUND
+    elif 'legendary' in type_line and 'artifact' in type_line and power and toughness:
+        flags |= LEGENDARY_ARTIFACT
+    return flags, partner_name if flags & PARTNER_WITH else ''
+
+class CommanderPool:
+    """
+    The commander candidates of a collection, sorted into the ways they can lead a deck.
+
+    Only the candidates are held, pairings are generated lazily by iter_combinations. Cards
+    that pair up are also bucketed by color mask, so the pairings that reach one target color
+    identity can be found without walking the full cross product.
+    """
+    def __init__(self, cards: Iterable[dict]):
+        self.masks = {}  # Card name to color mask
+        self.positions = {}  # Card name to position in the collection
+        self.color_identities = {}  # Card name to color identity as written for single commanders
+        self.legendary_creatures = []
+        self.partner_cards = []  # Cards with "Partner" (not "Partner With")
+        self.partner_with_pairs = []  # (card, partner) name pairs, card < partner
+        self.friends_forever_cards = []  # Cards with "Friends Forever"
+        self.background_choosers = []  # Legendary creatures with "Choose a Background"
+        self.planeswalkers = []
+        self.backgrounds = []
+        self.legendary_artifacts = []
+
+        partner_with_names = defaultdict(set)
+        for card in cards:
+            name = card['name']
+            self.positions[name] = len(self.positions)
+            self.masks[name] = color_mask(card.get('color_identity', ''))
+            self.color_identities[name] = card.get('color_identity', '').lower()
+            if 'commander_flags' in card:
+                # Classified when the card database was built
+                flags, partner_name = card['commander_flags'], card['partner_with']
+            else:
+                flags, partner_name = classify_commander(card.get('type_line', ''), card.get('oracle_text', ''), card.get('power', ''), card.get('toughness', ''))
+
+            if flags & LEGENDARY_CREATURE:
+                self.legendary_creatures.append(name)
+            if flags & PARTNER_WITH:
+                partner_with_names[name].add(partner_name.lower())
+            if flags & PARTNER:
+                self.partner_cards.append(name)
+            if flags & FRIENDS_FOREVER:
+                self.friends_forever_cards.append(name)
+            if flags & CHOOSE_A_BACKGROUND:
+                self.background_choosers.append(name)
+            if flags & PLANESWALKER_COMMANDER:
+                self.planeswalkers.append(name)
+            if flags & BACKGROUND:
+                self.backgrounds.append(name)
+            if flags & LEGENDARY_ARTIFACT:
+                self.legendary_artifacts.append(name)
+
+        # Only pairs where both halves are in the collection, each pair once
+        names_by_lower = {name.lower(): name for name in self.masks}
+        self.partner_with_pairs = sorted({
+            tuple(sorted((name, names_by_lower[partner])))
+            for name, partners in partner_with_names.items()
+            for partner in partners
+            if partner in names_by_lower
+        })
+
+    def _single(self, name: str) -> tuple[str, str, str]:
+        return name, '', self.color_identities[name]
+
+    def _pair(self, name1: str, name2: str) -> tuple[str, str, str]:
+        combined = mask_to_color_identity(self.masks[name1] | self.masks[name2])
+        return name1, name2, combined if combined else 'C'
+
+    def _bucket(self, names: list[str], target_mask: int) -> dict[int, list[str]]:
+        buckets = defaultdict(list)
+        for name in names:
+            if self.masks[name] & ~target_mask == 0:
+                buckets[self.masks[name]].append(name)
+        return buckets
+
+    def _pairs_within(self, names: list[str], target_mask: int | None) -> Iterator[tuple[str, str, str]]:
+        if target_mask is None:
+            for i, name1 in enumerate(names):
+                for name2 in names[i+1:]:
+                    yield self._pair(name1, name2)
+            return
+        buckets = self._bucket(names, target_mask)
+        masks = sorted(buckets)
+        for i, mask1 in enumerate(masks):
+            for mask2 in masks[i:]:
+                if mask1 | mask2 != target_mask:
+                    continue
+                if mask1 == mask2:
+                    yield from self._pairs_within(buckets[mask1], None)
+                else:
+                    for name1, name2 in product(buckets[mask1], buckets[mask2]):
+                        # Keep the order of a full run, where the earlier card comes first
+                        if self.positions[name1] > self.positions[name2]:
+                            name1, name2 = name2, name1
+                        yield self._pair(name1, name2)
+
+    def _pairs_across(self, left: list[str], right: list[str], target_mask: int | None) -> Iterator[tuple[str, str, str]]:
+        if target_mask is None:
+            for name1, name2 in product(left, right):
+                yield self._pair(name1, name2)
+            return
+        left_buckets = self._bucket(left, target_mask)
+        right_buckets = self._bucket(right, target_mask)
+        for mask1 in submasks(target_mask):
+            for mask2 in submasks(target_mask):
+                if mask1 | mask2 == target_mask:
+                    for name1, name2 in product(left_buckets.get(mask1, []), right_buckets.get(mask2, [])):
+                        yield self._pair(name1, name2)
+
+    def iter_combinations(self, target_mask: int | None = None) -> Iterator[tuple[str, str, str]]:
+        """
+        Generates every valid commander combination.
+        Args:
+            target_mask (int): Only generate combinations with exactly this combined color mask
+        Yields:
+            tuple: (commander_1, commander_2, combined_color_identity), commander_2 is '' for single commanders
+        """
+        def singles(names: list[str]) -> Iterator[tuple[str, str, str]]:
+            for name in names:
+                if target_mask is None or self.masks[name] == target_mask:
+                    yield self._single(name)
+
+        # 1. Single legendary creatures
+        yield from singles(self.legendary_creatures)
+        # 2. Partner cards (any two different partner cards)
+        yield from self._pairs_within(self.partner_cards, target_mask)
+        # 3. Partner With pairs (only specific pairs)
+        for name1, name2 in self.partner_with_pairs:
+            if target_mask is None or self.masks[name1] | self.masks[name2] == target_mask:
+                yield self._pair(name1, name2)
+        # 4. Friends Forever cards (any two different Friends Forever cards)
+        yield from self._pairs_within(self.friends_forever_cards, target_mask)
+        # 5. Planeswalkers
+        yield from singles(self.planeswalkers)
+        # 6. Background combinations
+        yield from self._pairs_across(self.background_choosers, self.backgrounds, target_mask)
+        # 7. Legendary Artifacts
+        yield from singles(self.legendary_artifacts)
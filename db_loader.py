@@ -1,7 +1,23 @@
+import functools
+import gzip
+import hashlib
+import io
 import json
+import multiprocessing
+import os
 import sqlite3
+import struct
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import BinaryIO, Iterable, Iterator
+import click
 import ijson
 import requests
+from color_identity import color_mask
+from commanders import classify_commander
 from decimal import Decimal
 
 class CustomJSONEncoder(json.JSONEncoder):
@@ -13,54 +29,759 @@ class CustomJSONEncoder(json.JSONEncoder):
 
 SCRYFALL_API_USER_AGENT = "MyDeckListProcessor/1.0"
 
-def update_all_cards_file(all_cards_file_path: str):
-    response = requests.get('https://api.scryfall.com/bulk-data', headers={'User-Agent': SCRYFALL_API_USER_AGENT}).json()
-    data_url = [data for data in response['data'] if data['type'] == 'all_cards'][0]['download_uri']
-    response = requests.get(data_url, headers={'User-Agent': SCRYFALL_API_USER_AGENT})
-    with open(all_cards_file_path, 'wb') as f:
-        f.write(response.content)
+SCRYFALL_BULK_DATA_URL = 'https://api.scryfall.com/bulk-data'
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+# Fastest first, the pure Python backend is always available
+IJSON_BACKENDS = ['yajl2_c', 'yajl2_cffi', 'python']
 
-def load_db(json_file_path: str, db_path, batch_size: int = 1000):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+def get_bulk_data_info(bulk_data_url: str = SCRYFALL_BULK_DATA_URL, bulk_type: str = 'all_cards') -> dict:
+    """
+    Fetches the entry describing one of Scryfall's bulk data files.
+    Args:
+        bulk_data_url (str): URL of the Scryfall bulk data index
+        bulk_type (str): Type of the bulk data file, e.g. 'all_cards'
+    Returns:
+        dict: The bulk data entry, including 'download_uri', 'updated_at' and 'size'
+    """
+    response = requests.get(bulk_data_url, headers={'User-Agent': SCRYFALL_API_USER_AGENT})
+    response.raise_for_status()
+    return [data for data in response.json()['data'] if data['type'] == bulk_type][0]
+
+def _read_download_meta(meta_path: str) -> dict:
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def _write_download_meta(meta_path: str, meta: dict):
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+def update_all_cards_file(all_cards_file_path: str, bulk_data_url: str = SCRYFALL_BULK_DATA_URL, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> bool:
+    """
+    Downloads the Scryfall all_cards bulk data file, streaming it to disk in fixed-size chunks.
+
+    The download goes to `<path>.part` and is moved into place once its size has been checked.
+    An interrupted download is resumed with an HTTP Range request on the next call, and the
+    download is skipped entirely when the local copy matches the remote `updated_at`.
+    Args:
+        all_cards_file_path (str): Path to write the bulk data file to
+        bulk_data_url (str): URL of the Scryfall bulk data index
+        chunk_size (int): Number of bytes to write per chunk
+    Returns:
+        bool: True if the file was downloaded, False if the local copy was already up to date
+    """
+    info = get_bulk_data_info(bulk_data_url)
+    meta_path = f"{all_cards_file_path}.meta.json"
+    part_path = f"{all_cards_file_path}.part"
+    meta = _read_download_meta(meta_path)
+
+    if meta.get('updated_at') == info['updated_at'] and meta.get('complete') and os.path.exists(all_cards_file_path):
+        print(f"'{all_cards_file_path}' is up to date ({info['updated_at']}), skipping download.")
+        return False
+
+    # A partial file is only worth resuming if it belongs to the same version of the bulk data
+    offset = 0
+    if meta.get('updated_at') == info['updated_at'] and not meta.get('complete') and os.path.exists(part_path):
+        offset = os.path.getsize(part_path)
+    _write_download_meta(meta_path, {'updated_at': info['updated_at'], 'complete': False})
+
+    # Ask for the raw bytes so Range offsets line up with what is on disk
+    headers = {'User-Agent': SCRYFALL_API_USER_AGENT, 'Accept-Encoding': 'identity'}
+    if offset:
+        headers['Range'] = f"bytes={offset}-"
+    expected_size = info.get('size')
+    written = offset
+    with requests.get(info['download_uri'], headers=headers, stream=True) as response:
+        # 416 means the partial file already holds every byte
+        if response.status_code != 416:
+            response.raise_for_status()
+            if response.status_code != 206:
+                written = 0
+            if expected_size is None and 'Content-Length' in response.headers:
+                expected_size = written + int(response.headers['Content-Length'])
+            with open(part_path, 'ab' if written else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    written += len(chunk)
+                    print(f"Downloaded {written // (1024 * 1024)} MiB...", end='\r')
+                print()
+
+    if expected_size is not None and written != expected_size:
+        if written > expected_size or response.status_code == 416:
+            # The partial file does not match the remote file, resuming it would fail the same way
+            os.remove(part_path)
+            raise ValueError(f"Downloaded {written} bytes of '{info['download_uri']}' but expected {expected_size}, rerun to download it again")
+        raise ValueError(f"Downloaded {written} bytes of '{info['download_uri']}' but expected {expected_size}, rerun to resume")
+
+    os.replace(part_path, all_cards_file_path)
+    _write_download_meta(meta_path, {'updated_at': info['updated_at'], 'complete': True})
+    return True
+
+CARD_COLUMNS = ['id', 'name', 'commander_legal', 'color_identity', 'mana_cost', 'cmc', 'type_line', 'power', 'toughness', 'oracle_text']
+# Computed from the projected columns by derive_card_columns, with their SQL declarations
+DERIVED_CARD_COLUMNS = {
+    'color_mask': 'INTEGER NOT NULL DEFAULT 0',
+    'commander_flags': 'INTEGER NOT NULL DEFAULT 0',
+    'partner_with': "TEXT NOT NULL DEFAULT ''",
+}
+CARD_RECORD_COLUMNS = CARD_COLUMNS + list(DERIVED_CARD_COLUMNS)
+# Every printing of a card shares the projected columns except its id, so they are stored
+# once per oracle_id in oracle_cards and printings maps each printing id to its oracle_id
+ORACLE_TABLE_COLUMNS = ['oracle_id'] + CARD_COLUMNS[1:] + list(DERIVED_CARD_COLUMNS) + ['content_hash']
+PRINTING_TABLE_COLUMNS = ['id', 'oracle_id']
+
+def project_card(obj: dict) -> tuple:
+    """
+    Projects a Scryfall card object onto the columns of the cards table.
+    Args:
+        obj (dict): Scryfall card object
+    Returns:
+        tuple: Values in CARD_COLUMNS order
+    """
+    return (
+        obj['id'],
+        obj.get('name', ''),
+        obj.get('legalities', {}).get('commander', '') == 'legal',
+        ''.join(obj.get('color_identity', [])),
+        obj.get('mana_cost', ''),
+        float(obj.get('cmc', 0)),
+        obj.get('type_line', ''),
+        obj.get('power', ''),
+        obj.get('toughness', ''),
+        obj.get('oracle_text', ''),
+    )
+
+def card_content_hash(projected: tuple) -> str:
+    """
+    Hashes a projected card row. Only the projected fields take part, so changes to
+    volatile data such as prices do not count as a change to the card, and the printing id
+    is left out so every printing of a card hashes the same.
+    Args:
+        projected (tuple): Row returned by project_card
+    Returns:
+        str: Hex digest of the row
+    """
+    return hashlib.blake2b(json.dumps(projected[1:]).encode('utf-8'), digest_size=16).hexdigest()
+
+def derive_card_columns(projected: tuple) -> tuple:
+    """
+    Computes the derived columns of a projected card row.
+    Args:
+        projected (tuple): Row returned by project_card
+    Returns:
+        tuple: Values in DERIVED_CARD_COLUMNS order
+    """
+    column = dict(zip(CARD_COLUMNS, projected))
+    return (
+        color_mask(column['color_identity']),
+        *classify_commander(column['type_line'], column['oracle_text'], column['power'], column['toughness']),
+    )
+
+def card_oracle_id(obj: dict) -> str:
+    """
+    Returns the oracle_id shared by all printings of a card. Reversible cards only have
+    oracle ids on their faces, they are keyed by their own id instead.
+    """
+    return obj.get('oracle_id') or obj['id']
+
+def card_rows(obj: dict) -> tuple[tuple, tuple]:
+    """
+    Builds the oracle_cards and printings table rows for a Scryfall card object.
+    Args:
+        obj (dict): Scryfall card object
+    Returns:
+        tuple: (values in ORACLE_TABLE_COLUMNS order, values in PRINTING_TABLE_COLUMNS order)
+    """
+    projected = project_card(obj)
+    oracle_id = card_oracle_id(obj)
+    return (oracle_id,) + projected[1:] + derive_card_columns(projected) + (card_content_hash(projected),), (obj['id'], oracle_id)
+
+# Only the few cards that can lead a deck are indexed
+COMMANDER_INDEX = 'CREATE INDEX IF NOT EXISTS oracle_cards_commander_flags ON oracle_cards (commander_flags) WHERE commander_flags != 0'
+
+# Full-text index over the rules text of the oracle cards. It stores no copy of the text,
+# the triggers keep it in step with oracle_cards and porter stemming lets 'counter' match
+# 'counters'.
+SEARCH_INDEX_COLUMNS = ['name', 'type_line', 'oracle_text']
+SEARCH_INDEX = f"CREATE VIRTUAL TABLE IF NOT EXISTS oracle_cards_search USING fts5({', '.join(SEARCH_INDEX_COLUMNS)}, content='oracle_cards', tokenize='porter unicode61')"
+_search_columns = ', '.join(SEARCH_INDEX_COLUMNS)
+_new_values = ', '.join(f"new.{column}" for column in SEARCH_INDEX_COLUMNS)
+_old_values = ', '.join(f"old.{column}" for column in SEARCH_INDEX_COLUMNS)
+SEARCH_INDEX_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS oracle_cards_search_insert AFTER INSERT ON oracle_cards BEGIN
+        INSERT INTO oracle_cards_search (rowid, {_search_columns}) VALUES (new.rowid, {_new_values});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS oracle_cards_search_delete AFTER DELETE ON oracle_cards BEGIN
+        INSERT INTO oracle_cards_search (oracle_cards_search, rowid, {_search_columns}) VALUES ('delete', old.rowid, {_old_values});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS oracle_cards_search_update AFTER UPDATE OF {_search_columns} ON oracle_cards BEGIN
+        INSERT INTO oracle_cards_search (oracle_cards_search, rowid, {_search_columns}) VALUES ('delete', old.rowid, {_old_values});
+        INSERT INTO oracle_cards_search (rowid, {_search_columns}) VALUES (new.rowid, {_new_values});
+    END""",
+]
+
+BULK_LOAD_PRAGMAS = [
+    'PRAGMA journal_mode = OFF',
+    'PRAGMA synchronous = OFF',
+    'PRAGMA cache_size = -262144',  # 256 MiB
+    'PRAGMA temp_store = MEMORY',
+]
+
+def create_tables(cursor, store_json: bool = True, deferred_keys: bool = False):
+    """
+    Creates the card tables if they do not exist yet, and the cards view joining every
+    printing to its oracle card.
+    Args:
+        cursor: SQLite cursor
+        store_json (bool): Also create the json_data table for raw card objects
+        deferred_keys (bool): Leave the key columns unindexed, create_indexes builds them after a bulk load
+    """
+    def key_column(column: str) -> str:
+        return f"{column} TEXT NOT NULL" if deferred_keys else f"{column} TEXT PRIMARY KEY"
+
+    derived_columns = ',\n        '.join(f"{column} {declaration}" for column, declaration in DERIVED_CARD_COLUMNS.items())
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS oracle_cards (
+        {key_column('oracle_id')},
+        name TEXT NOT NULL,
+        commander_legal INTEGER NOT NULL,
+        color_identity TEXT NOT NULL,
+        mana_cost TEXT NOT NULL,
+        cmc REAL NOT NULL,
+        type_line TEXT NOT NULL,
+        power TEXT NOT NULL,
+        toughness TEXT NOT NULL,
+        oracle_text TEXT NOT NULL,
+        {derived_columns},
+        content_hash TEXT NOT NULL DEFAULT ''
+    )
+    ''')
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS printings (
+        {key_column('id')},
+        oracle_id TEXT NOT NULL
+    )
+    ''')
+    # Databases built before the oracle split have a cards table with a row per printing
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cards'").fetchone():
+        migrate_cards_table(cursor)
+    cursor.execute('DROP VIEW IF EXISTS cards')
+    existing_columns = [column[1] for column in cursor.execute('PRAGMA table_info(oracle_cards)')]
+    missing_derived_columns = [column for column in DERIVED_CARD_COLUMNS if column not in existing_columns]
+    if missing_derived_columns:
+        backfill_derived_columns(cursor, missing_derived_columns)
+    if not deferred_keys:
+        cursor.execute(COMMANDER_INDEX)
+        create_search_index(cursor)
+    oracle_columns = ', '.join(f"oracle_cards.{column}" for column in ORACLE_TABLE_COLUMNS[1:-1])
+    cursor.execute(f'''
+    CREATE VIEW cards AS
+    SELECT printings.id, {oracle_columns}, printings.oracle_id, oracle_cards.content_hash
+    FROM printings JOIN oracle_cards ON oracle_cards.oracle_id = printings.oracle_id
+    ''')
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS json_data (
-        id TEXT PRIMARY KEY,
-        value TEXT
+    CREATE TABLE IF NOT EXISTS refreshes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        started_at TEXT NOT NULL,
+        finished_at TEXT,
+        records_processed INTEGER NOT NULL DEFAULT 0,
+        cards_added INTEGER NOT NULL DEFAULT 0,
+        cards_updated INTEGER NOT NULL DEFAULT 0
     )
     ''')
-    
-    insert_sql = 'INSERT OR IGNORE INTO json_data (id, value) VALUES (?, ?)'
-    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS card_changes (
+        refresh_id INTEGER NOT NULL REFERENCES refreshes (id),
+        card_id TEXT NOT NULL,
+        change TEXT NOT NULL,
+        previous_hash TEXT,
+        content_hash TEXT NOT NULL
+    )
+    ''')
+    if store_json:
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS json_data (
+            {key_column('id')},
+            value TEXT
+        )
+        ''')
+
+def migrate_cards_table(cursor):
+    """
+    Moves the rows of a cards table built before the oracle split into the oracle_cards and
+    printings tables. The oracle ids of those rows are unknown, so every printing becomes its
+    own oracle card with an empty content hash until the next refresh regroups it.
+    Args:
+        cursor: SQLite cursor
+    """
+    rows = cursor.execute(f"SELECT {', '.join(CARD_COLUMNS)} FROM cards").fetchall()
+    cursor.executemany(
+        f"INSERT OR IGNORE INTO oracle_cards ({', '.join(ORACLE_TABLE_COLUMNS)}) VALUES ({', '.join('?' * len(ORACLE_TABLE_COLUMNS))})",
+        [row + derive_card_columns(row) + ('',) for row in rows]
+    )
+    cursor.executemany('INSERT OR IGNORE INTO printings (id, oracle_id) VALUES (?, ?)', [(row[0], row[0]) for row in rows])
+    cursor.execute('DROP TABLE cards')
+    print(f"Moved {len(rows)} stored cards into the oracle_cards and printings tables, refresh to group their printings.")
+
+def backfill_derived_columns(cursor, columns: list[str]):
+    """
+    Adds derived columns to an oracle_cards table built before they existed and computes
+    them from the stored projected columns.
+    Args:
+        cursor: SQLite cursor
+        columns (list): Names of the missing DERIVED_CARD_COLUMNS
+    """
+    for column in columns:
+        cursor.execute(f"ALTER TABLE oracle_cards ADD COLUMN {column} {DERIVED_CARD_COLUMNS[column]}")
+    positions = [list(DERIVED_CARD_COLUMNS).index(column) for column in columns]
+    # oracle_id stands in for the id column, which derive_card_columns does not use
+    rows = cursor.execute(f"SELECT oracle_id, {', '.join(CARD_COLUMNS[1:])} FROM oracle_cards").fetchall()
+    updates = [tuple(derive_card_columns(row)[position] for position in positions) + (row[0],) for row in rows]
+    cursor.executemany(f"UPDATE oracle_cards SET {', '.join(f'{column} = ?' for column in columns)} WHERE oracle_id = ?", updates)
+    print(f"Added {', '.join(columns)} to {len(rows)} stored cards.")
+
+def create_search_index(cursor):
+    """
+    Creates the full-text search index of the oracle cards and the triggers keeping it up to
+    date, indexing the stored cards when the index is new.
+    Args:
+        cursor: SQLite cursor
+    """
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'oracle_cards_search'").fetchone()
+    cursor.execute(SEARCH_INDEX)
+    for trigger in SEARCH_INDEX_TRIGGERS:
+        cursor.execute(trigger)
+    if not exists:
+        cursor.execute("INSERT INTO oracle_cards_search (oracle_cards_search) VALUES ('rebuild')")
+
+def create_indexes(cursor, store_json: bool = True):
+    """
+    Builds the unique key indexes, the commander index and the search index of tables
+    created with deferred keys, keeping the first occurrence of any duplicated key just like the INSERT OR IGNORE
+    of a regular load.
+    Args:
+        cursor: SQLite cursor
+        store_json (bool): Also index the json_data table
+    """
+    keys = {'oracle_cards': 'oracle_id', 'printings': 'id'}
+    if store_json:
+        keys['json_data'] = 'id'
+    for table, key in keys.items():
+        cursor.execute(f"DELETE FROM {table} WHERE rowid NOT IN (SELECT MIN(rowid) FROM {table} GROUP BY {key})")
+        cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_{key} ON {table} ({key})")
+    cursor.execute(COMMANDER_INDEX)
+    create_search_index(cursor)
+
+def open_bulk_stream(stream: BinaryIO) -> BinaryIO:
+    """
+    Prepares a byte stream of bulk data for parsing, transparently decompressing gzip data.
+    Args:
+        stream: Readable binary file-like object, e.g. an open file or an HTTP response body
+    Returns:
+        A readable binary file-like object yielding the JSON bytes
+    """
+    buffered = stream if hasattr(stream, 'peek') else io.BufferedReader(stream)
+    if buffered.peek(2)[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=buffered)
+    return buffered
+
+@contextmanager
+def stream_bulk_data(bulk_data_url: str = SCRYFALL_BULK_DATA_URL, bulk_type: str = 'all_cards') -> Iterator[BinaryIO]:
+    """
+    Opens the Scryfall bulk data download as a byte stream without writing it to disk.
+    Args:
+        bulk_data_url (str): URL of the Scryfall bulk data index
+        bulk_type (str): Type of the bulk data file, e.g. 'all_cards'
+    Yields:
+        The response body, decoded from any Content-Encoding
+    """
+    info = get_bulk_data_info(bulk_data_url, bulk_type)
+    with requests.get(info['download_uri'], headers={'User-Agent': SCRYFALL_API_USER_AGENT}, stream=True) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        # Keep the body readable at EOF so buffered readers wrapping it see b'' rather than an error
+        response.raw.auto_close = False
+        yield response.raw
+
+@functools.cache
+def get_ijson_backend():
+    """
+    Picks the fastest ijson backend that is installed.
+    Returns:
+        The ijson backend module, its name is in `backend_name`
+    """
+    for name in IJSON_BACKENDS:
+        try:
+            return ijson.get_backend(name)
+        except ImportError:
+            continue
+    raise ImportError(f"None of the ijson backends {IJSON_BACKENDS} could be loaded")
+
+def iter_card_objects(stream: BinaryIO) -> Iterator[dict]:
+    """
+    Parses the card objects out of a bulk data stream.
+
+    Numbers are parsed as floats rather than Decimals, which saves converting them back
+    when the objects are serialized.
+    Args:
+        stream: Readable binary file-like object holding the bulk data JSON, optionally gzip compressed
+    Yields:
+        dict: Scryfall card objects
+    """
+    backend = get_ijson_backend()
+    print(f"Parsing bulk data with the ijson '{backend.backend_name}' backend.")
+    for records_processed, obj in enumerate(backend.items(open_bulk_stream(stream), 'item', use_float=True)):
+        if 'id' not in obj:
+            raise ValueError(f"JSON object at record {records_processed + 1} must have an 'id' field")
+        yield obj
+
+def encode_batch(objects: list[dict], store_json: bool = True) -> tuple[list[tuple], list[tuple], list[tuple]]:
+    """
+    Turns a batch of parsed card objects into rows ready to insert.
+    Args:
+        objects (list): Scryfall card objects
+        store_json (bool): Also serialize the raw card objects for the json_data table
+    Returns:
+        tuple: (oracle_cards table rows, printings table rows, json_data table rows)
+    """
+    oracle_rows = []
+    printing_rows = []
+    json_rows = []
+    for obj in objects:
+        oracle_row, printing_row = card_rows(obj)
+        oracle_rows.append(oracle_row)
+        printing_rows.append(printing_row)
+        if store_json:
+            json_rows.append((obj['id'], json.dumps(obj, cls=CustomJSONEncoder)))
+    return oracle_rows, printing_rows, json_rows
+
+def _batched(items: Iterable, batch_size: int) -> Iterator[list]:
     batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def iter_encoded_batches(stream: BinaryIO, batch_size: int = 1000, store_json: bool = True, workers: int = 1) -> Iterator[tuple[list[tuple], list[tuple], list[tuple]]]:
+    """
+    Parses a bulk data stream and encodes it batch by batch.
+
+    With more than one worker the batches are encoded by a process pool while the calling
+    process keeps parsing. Results are still yielded in stream order, and at most two
+    batches per worker are in flight at a time.
+    Args:
+        stream: Readable binary file-like object holding the bulk data JSON, optionally gzip compressed
+        batch_size (int): Number of records per batch
+        store_json (bool): Also serialize the raw card objects for the json_data table
+        workers (int): Number of worker processes, 1 encodes in the calling process
+    Yields:
+        tuple: (oracle_cards table rows, printings table rows, json_data table rows) for each batch
+    """
+    batches = _batched(iter_card_objects(stream), batch_size)
+    if workers <= 1:
+        for batch in batches:
+            yield encode_batch(batch, store_json)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.apply_async(encode_batch, (batch, store_json)))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+def load_db(json_file_path: str, db_path, batch_size: int = 1000, store_json: bool = True, bulk: bool = False, workers: int = 1):
+    """
+    Loads a Scryfall bulk data file into the card database.
+    Args:
+        json_file_path (str): Path to the Scryfall bulk data JSON file, optionally gzip compressed
+        db_path (str): Path to the SQLite database
+        batch_size (int): Number of records to insert per batch
+        store_json (bool): Also store every raw card object in the json_data table
+        bulk (bool): Rebuild the database from scratch in fast bulk mode, see load_db_stream
+        workers (int): Number of processes encoding batches, see iter_encoded_batches
+    """
+    with open(json_file_path, 'rb') as file:  # Use binary mode for ijson
+        load_db_stream(file, db_path, batch_size, store_json, bulk, workers)
+
+def load_db_stream(stream: BinaryIO, db_path, batch_size: int = 1000, store_json: bool = True, bulk: bool = False, workers: int = 1):
+    """
+    Loads Scryfall bulk data from a byte stream into the card database.
+
+    In bulk mode the database is rebuilt from scratch: it is built in a fresh file next to
+    `db_path` with journaling and syncing turned off, loaded in a single transaction, indexed
+    once the load is complete and then atomically moved over `db_path`.
+    Args:
+        stream: Readable binary file-like object holding the bulk data JSON, optionally gzip compressed
+        db_path (str): Path to the SQLite database
+        batch_size (int): Number of records to insert per batch
+        store_json (bool): Also store every raw card object in the json_data table
+        bulk (bool): Rebuild the database from scratch in fast bulk mode
+        workers (int): Number of processes encoding batches, see iter_encoded_batches
+    """
+    build_path = f"{db_path}.building" if bulk else db_path
+    if bulk and os.path.exists(build_path):
+        os.remove(build_path)
+    conn = sqlite3.connect(build_path)
+    cursor = conn.cursor()
+    if bulk:
+        for pragma in BULK_LOAD_PRAGMAS:
+            cursor.execute(pragma)
+    create_tables(cursor, store_json, deferred_keys=bulk)
+
+    insert_oracle_sql = f"INSERT OR IGNORE INTO oracle_cards ({', '.join(ORACLE_TABLE_COLUMNS)}) VALUES ({', '.join('?' * len(ORACLE_TABLE_COLUMNS))})"
+    insert_printing_sql = 'INSERT OR IGNORE INTO printings (id, oracle_id) VALUES (?, ?)'
+    insert_json_sql = 'INSERT OR IGNORE INTO json_data (id, value) VALUES (?, ?)'
+    
     records_processed = 0
+    start_time = time.perf_counter()
     
     try:
-        with open(json_file_path, 'rb') as file:  # Use binary mode for ijson
-            parser = ijson.items(file, 'item')
-            for obj in parser:
-                if 'id' not in obj:
-                    raise ValueError(f"JSON object at record {records_processed + 1} must have an 'id' field")
-                batch.append((obj['id'], json.dumps(obj, cls=CustomJSONEncoder)))
-                records_processed += 1
-                
-                if len(batch) >= batch_size:
-                    cursor.executemany(insert_sql, batch)
-                    conn.commit()
-                    batch = []
-                    print(f"Processed {records_processed} records...", end='\r')
-            if batch:
-                cursor.executemany(insert_sql, batch)
+        for oracle_rows, printing_rows, json_rows in iter_encoded_batches(stream, batch_size, store_json, workers):
+            cursor.executemany(insert_oracle_sql, oracle_rows)
+            cursor.executemany(insert_printing_sql, printing_rows)
+            if json_rows:
+                cursor.executemany(insert_json_sql, json_rows)
+            if not bulk:
                 conn.commit()
-                
-        print(f"\nCompleted! Processed {records_processed} records.")
+            records_processed += len(printing_rows)
+            print(f"Processed {records_processed} records...", end='\r')
+        if bulk:
+            create_indexes(cursor, store_json)
+        conn.commit()
+
+        elapsed = time.perf_counter() - start_time
+        print(f"\nCompleted! Processed {records_processed} records in {elapsed:.1f}s ({records_processed / max(elapsed, 1e-9):.0f} rows/s).")
         
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        if bulk:
+            os.remove(build_path)
+        raise e
+    conn.close()
+    if bulk:
+        os.replace(build_path, db_path)
+
+def refresh_db(json_file_path: str, db_path, batch_size: int = 1000, store_json: bool = True) -> int:
+    """
+    Incrementally refreshes the card database from a Scryfall bulk data file.
+    Args:
+        json_file_path (str): Path to the Scryfall bulk data JSON file, optionally gzip compressed
+        db_path (str): Path to the SQLite database
+        batch_size (int): Number of records to compare and upsert per batch
+        store_json (bool): Also refresh the raw card objects in the json_data table
+    Returns:
+        int: ID of the refresh in the refreshes table
+    """
+    with open(json_file_path, 'rb') as file:  # Use binary mode for ijson
+        return refresh_db_stream(file, db_path, batch_size, store_json)
+
+def refresh_db_stream(stream: BinaryIO, db_path, batch_size: int = 1000, store_json: bool = True) -> int:
+    """
+    Incrementally refreshes the card database from a byte stream of Scryfall bulk data.
+
+    Each incoming card is compared with the stored one by content hash, and only new or
+    changed cards are written. Every refresh is recorded in the refreshes table, and the
+    cards it added or updated in the card_changes table.
+    Args:
+        stream: Readable binary file-like object holding the bulk data JSON, optionally gzip compressed
+        db_path (str): Path to the SQLite database
+        batch_size (int): Number of records to compare and upsert per batch
+        store_json (bool): Also refresh the raw card objects in the json_data table
+    Returns:
+        int: ID of the refresh in the refreshes table
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    create_tables(cursor, store_json)
+    cursor.execute('INSERT INTO refreshes (started_at) VALUES (?)', (datetime.now(timezone.utc).isoformat(),))
+    refresh_id = cursor.lastrowid
+    conn.commit()
+
+    update_columns = ', '.join(f"{column} = excluded.{column}" for column in ORACLE_TABLE_COLUMNS[1:])
+    upsert_oracle_sql = f"INSERT INTO oracle_cards ({', '.join(ORACLE_TABLE_COLUMNS)}) VALUES ({', '.join('?' * len(ORACLE_TABLE_COLUMNS))}) ON CONFLICT (oracle_id) DO UPDATE SET {update_columns}"
+    upsert_printing_sql = 'INSERT INTO printings (id, oracle_id) VALUES (?, ?) ON CONFLICT (id) DO UPDATE SET oracle_id = excluded.oracle_id'
+    upsert_json_sql = 'INSERT INTO json_data (id, value) VALUES (?, ?) ON CONFLICT (id) DO UPDATE SET value = excluded.value'
+    insert_change_sql = 'INSERT INTO card_changes (refresh_id, card_id, change, previous_hash, content_hash) VALUES (?, ?, ?, ?, ?)'
+
+    counts = {'added': 0, 'updated': 0}
+    records_processed = 0
+
+    def flush(objects: list[dict]):
+        rows = {}
+        for obj in objects:
+            if obj['id'] in rows:
+                continue
+            rows[obj['id']] = card_rows(obj) + (obj,)
+        placeholders = ','.join('?' * len(rows))
+        stored = {card_id: (oracle_id, content_hash) for card_id, oracle_id, content_hash in
+                  cursor.execute(f"SELECT id, oracle_id, content_hash FROM cards WHERE id IN ({placeholders})", list(rows))}
+        oracle_rows, printing_rows, json_rows, changes = {}, [], [], []
+        for card_id, (oracle_row, printing_row, obj) in rows.items():
+            previous = stored.get(card_id)
+            # A printing changes when its oracle card changes or when it is regrouped
+            if previous == (oracle_row[0], oracle_row[-1]):
+                continue
+            previous_hash = previous[1] if previous else None
+            change = 'added' if previous is None else 'updated'
+            counts[change] += 1
+            oracle_rows[oracle_row[0]] = oracle_row
+            printing_rows.append(printing_row)
+            changes.append((refresh_id, card_id, change, previous_hash, oracle_row[-1]))
+            if store_json:
+                json_rows.append((card_id, json.dumps(obj, cls=CustomJSONEncoder)))
+        cursor.executemany(upsert_oracle_sql, oracle_rows.values())
+        cursor.executemany(upsert_printing_sql, printing_rows)
+        if json_rows:
+            cursor.executemany(upsert_json_sql, json_rows)
+        cursor.executemany(insert_change_sql, changes)
+        conn.commit()
+
+    try:
+        batch = []
+        for obj in iter_card_objects(stream):
+            batch.append(obj)
+            records_processed += 1
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+                print(f"Compared {records_processed} records...", end='\r')
+        if batch:
+            flush(batch)
+        # Oracle cards left behind by regrouped printings
+        cursor.execute('DELETE FROM oracle_cards WHERE oracle_id NOT IN (SELECT oracle_id FROM printings)')
+        cursor.execute(
+            'UPDATE refreshes SET finished_at = ?, records_processed = ?, cards_added = ?, cards_updated = ? WHERE id = ?',
+            (datetime.now(timezone.utc).isoformat(), records_processed, counts['added'], counts['updated'], refresh_id)
+        )
+        conn.commit()
+        print(f"\nRefresh {refresh_id} complete! Compared {records_processed} records: {counts['added']} added, {counts['updated']} updated.")
     except Exception as e:
         conn.rollback()
         raise e
     finally:
         conn.close()
+    return refresh_id
+
+# Card index file: header, column names as JSON, fan-out table, sorted 16-byte printing ids,
+# one record offset per id, then the records, each a 4-byte length followed by a JSON array
+# of values. Entry i of the fan-out table counts the ids whose first two bytes are <= i, so
+# a lookup only has to binary search the few ids sharing its prefix.
+CARD_INDEX_MAGIC = b'CARDIDX1'
+CARD_INDEX_HEADER = struct.Struct('<8sQI')  # magic, number of ids, length of the column names
+CARD_INDEX_FANOUT = struct.Struct('<65536I')
+CARD_INDEX_OFFSET = struct.Struct('<Q')
+CARD_INDEX_RECORD_LENGTH = struct.Struct('<I')
+
+def write_card_index(db_path: str, index_path: str) -> int:
+    """
+    Writes an immutable card index file for memory-mapped lookups, see card_index.CardIndex.
+    Records are stored once per oracle card and shared by the offsets of its printings.
+    Args:
+        db_path (str): Path to the SQLite card database
+        index_path (str): Path of the index file to write
+    Returns:
+        int: Number of printing ids in the index
+    """
+    columns = CARD_RECORD_COLUMNS[1:]
+    with sqlite3.connect(db_path) as conn:
+        printings = sorted((uuid.UUID(card_id).bytes, oracle_id) for card_id, oracle_id in conn.execute('SELECT id, oracle_id FROM printings'))
+        oracle_records = {row[0]: json.dumps(row[1:], separators=(',', ':')).encode('utf-8')
+                          for row in conn.execute(f"SELECT oracle_id, {', '.join(columns)} FROM oracle_cards")}
+
+    columns_json = json.dumps(columns).encode('utf-8')
+    fanout = [0] * 65536
+    for key, _ in printings:
+        fanout[int.from_bytes(key[:2], 'big')] += 1
+    for prefix in range(1, 65536):
+        fanout[prefix] += fanout[prefix - 1]
+    keys_offset = CARD_INDEX_HEADER.size + len(columns_json) + CARD_INDEX_FANOUT.size
+    records_offset = keys_offset + len(printings) * (16 + CARD_INDEX_OFFSET.size)
+    record_offsets = {}
+    temp_path = f"{index_path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(CARD_INDEX_HEADER.pack(CARD_INDEX_MAGIC, len(printings), len(columns_json)))
+        f.write(columns_json)
+        f.write(CARD_INDEX_FANOUT.pack(*fanout))
+        for key, _ in printings:
+            f.write(key)
+        position = records_offset
+        for _, oracle_id in printings:
+            if oracle_id not in record_offsets:
+                record_offsets[oracle_id] = position
+                position += CARD_INDEX_RECORD_LENGTH.size + len(oracle_records[oracle_id])
+            f.write(CARD_INDEX_OFFSET.pack(record_offsets[oracle_id]))
+        for oracle_id in record_offsets:
+            f.write(CARD_INDEX_RECORD_LENGTH.pack(len(oracle_records[oracle_id])))
+            f.write(oracle_records[oracle_id])
+    os.replace(temp_path, index_path)
+    print(f"Wrote {len(printings)} printings of {len(record_offsets)} cards to the card index '{index_path}'.")
+    return len(printings)
+
+@click.group(invoke_without_command=True)
+@click.pass_context
+@click.option('--all-cards-file', default='all_cards.json', help='Path to download the Scryfall all_cards bulk data file to.')
+@click.option('--card-db', '--db', default='cards.db', help='Path to the SQLite database to load the card data into.')
+@click.option('--store-json/--no-store-json', default=True, help='Also store the raw Scryfall card objects in the json_data table.')
+@click.option('--stream', is_flag=True, help='Load the download straight into the database without writing the bulk data file.')
+@click.option('--bulk', is_flag=True, help='Rebuild the database from scratch in fast bulk mode.')
+@click.option('--incremental', is_flag=True, help='Only write cards that are new or changed since the last load.')
+@click.option('--workers', default=1, show_default=True, help='Number of processes encoding card batches for a full load.')
+@click.option('--index-file', default=None, help='Also write a memory-mapped card index file for fast read-only lookups.')
+def cli(ctx, all_cards_file, card_db, store_json, stream, bulk, incremental, workers, index_file):
+    """
+    Downloads the Scryfall bulk data and loads it into the card database.
+    """
+    if ctx.invoked_subcommand is not None:
+        return
+    if bulk and incremental:
+        raise click.UsageError('--bulk and --incremental cannot be combined.')
+    if stream:
+        with stream_bulk_data() as bulk_stream:
+            if incremental:
+                refresh_db_stream(bulk_stream, card_db, store_json=store_json)
+            else:
+                load_db_stream(bulk_stream, card_db, store_json=store_json, bulk=bulk, workers=workers)
+    else:
+        update_all_cards_file(all_cards_file)
+        if incremental:
+            refresh_db(all_cards_file, card_db, store_json=store_json)
+        else:
+            load_db(all_cards_file, card_db, store_json=store_json, bulk=bulk, workers=workers)
+    if index_file:
+        write_card_index(card_db, index_file)
+
+@cli.command()
+@click.argument('query')
+@click.option('--card-db', '--db', default='cards.db', help='Path to the SQLite card database to search.')
+@click.option('--identity', default=None, help='Only list cards that fit within this color identity, e.g. rw.')
+@click.option('--collection-file', '-f', default=None, help='Only list cards owned in this ManaBox export or enhancer CSV.')
+@click.option('--limit', default=50, show_default=True, help='Maximum number of cards to list.')
+def search(query, card_db, identity, collection_file, limit):
+    """
+    Searches the name, type line and rules text of the cards, e.g.
+    'counters AND type_line:(creature OR planeswalker)'.
+    """
+    # Imported here as card_search builds on this module
+    from card_search import read_collection_ids, search_cards
+    card_ids = read_collection_ids(collection_file) if collection_file else None
+    start_time = time.perf_counter()
+    try:
+        cards = search_cards(card_db, query, identity, card_ids, limit)
+    except sqlite3.OperationalError as e:
+        raise click.BadParameter(str(e), param_hint='QUERY')
+    elapsed = time.perf_counter() - start_time
+    for card in cards:
+        print(f"{card['name']} ({card['color_identity'] or 'C'}) - {card['type_line']}")
+    print(f"Found {len(cards)} cards in {elapsed * 1000:.1f}ms.")
 
 if __name__ == '__main__':
-    update_all_cards_file('all_cards.json')
-    load_db('all_cards.json', 'cards.db')
\ No newline at end of file
+    cli()
\ No newline at end of file
@@ -1,31 +1,151 @@
+import click
+from contextlib import ExitStack
 #from ai.magic_card_selector import MagicCardSelector
 from ai.magic_card_selector_light import MagicCardSelectorLight as MagicCardSelector
-import pandas as pd
+from ai.response_cache import DEFAULT_CACHE_PATH, ResponseCache
+from chunk_planner import estimate_tokens, plan_chunks
+from chunk_dispatch import DEFAULT_CONCURRENCY, TokenBucket, dispatch_chunks
+from columnar import count_card_rows, iter_card_frames
+from run_journal import DEFAULT_JOURNAL_PATH, RunJournal, filter_run_id
+
+class CardChunks:
+    """
+    Lazy chunks of the cards of a CSV or Parquet file. Its length comes from a row count,
+    and chunks are only read and converted to dicts as they are iterated.
+    """
+    def __init__(self, file_path, chunk_size):
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self._row_count = None
+
+    def __len__(self):
+        if self._row_count is None:
+            self._row_count = count_card_rows(self.file_path)
+        return -(-self._row_count // self.chunk_size)
+
+    def __iter__(self):
+        return (chunk for _, chunk in self.iter_from(0))
+
+    def iter_from(self, start_chunk):
+        """
+        Yields (chunk index, cards) from the given chunk on, skipping the earlier rows
+        without converting them.
+        """
+        frames = iter_card_frames(self.file_path, self.chunk_size, skip_rows=start_chunk * self.chunk_size)
+        for i, frame in enumerate(frames, start_chunk):
+            yield i, frame.fillna('').to_dict(orient='records')
 
 def split_csv_into_chunks(file_path, chunk_size):
-    chunks = []
-    for chunk in pd.read_csv(file_path, chunksize=chunk_size):
-        chunks.append(chunk.fillna('').to_dict(orient='records'))
-    return chunks
-
-def filter_cards(csv_file_path, deck_concept, chunk_size, start_chunk=0):
-    selected_cards = []
-    chunks = split_csv_into_chunks(csv_file_path, chunk_size)
-    print("number of chunks:", len(chunks))
-    for i, chunk in enumerate(chunks):
-        if i < start_chunk:
-            continue
-        print(f"Processing chunk {i+1}/{len(chunks)}")
-        selector = MagicCardSelector()
-        newly_selected = selector.select_cards(chunk, deck_concept)
-        print(newly_selected)
-        selected_cards.append(newly_selected['selected_cards'])
-    return selected_cards
+    return CardChunks(file_path, chunk_size)
+
+def filter_cards(csv_file_path, deck_concept, chunk_size, start_chunk=0, concurrency=DEFAULT_CONCURRENCY, requests_per_minute=None, selector=None, cache_path=DEFAULT_CACHE_PATH, journal_path=DEFAULT_JOURNAL_PATH, run_id=None, token_budget=None, new_run=False):
+    """
+    Asks the card selector for the cards of each chunk that fit the deck concept, sending
+    several chunks at once.
+
+    Every completed chunk is recorded in the run journal. Running again with the same inputs
+    and the same selector resumes the run, only sending the chunks that were not completed
+    before. A finished run is replayed from the journal unless new_run is set.
+    Args:
+        csv_file_path (str): Path to the CSV or Parquet file of cards
+        deck_concept (str): Description of the deck
+        chunk_size (int): Number of cards sent per request
+        start_chunk (int): Index of the first chunk to process
+        concurrency (int): Maximum number of requests in flight
+        requests_per_minute (float): Maximum rate of requests, unlimited if None
+        selector: Card selector shared by all requests, a MagicCardSelector by default
+        cache_path (str): Response cache of the default selector, so reruns only pay for
+            chunks that were not answered before. None disables the cache
+        journal_path (str): Path of the run journal
+        run_id (str): ID of the run in the journal, derived from the inputs and the selector
+            by default
+        token_budget (int): Pack the cards into chunks of about this many prompt tokens
+            instead of chunk_size cards, see chunk_planner.plan_chunks
+        new_run (bool): Drop the journal entries of the run and send every chunk again
+    Returns:
+        list: Selected card names of each processed chunk, in chunk order
+    """
+    with RunJournal(journal_path) as journal:
+        return [selection for _, selection in run_filter(journal, csv_file_path, deck_concept, chunk_size, start_chunk, concurrency, requests_per_minute, selector, cache_path, run_id, token_budget, new_run)]
+
+def run_filter(journal, csv_file_path, deck_concept, chunk_size, start_chunk=0, concurrency=DEFAULT_CONCURRENCY, requests_per_minute=None, selector=None, cache_path=DEFAULT_CACHE_PATH, run_id=None, token_budget=None, new_run=False):
+    """
+    Runs or resumes a filter run recorded in the given journal, see filter_cards.
+    Yields:
+        tuple: (chunk index, selected card names), streamed from the journal in chunk order
+            once every chunk is done
+    """
+    with ExitStack() as stack:
+        if selector is None:
+            # The response cache is closed with the stack once every chunk is done
+            cache = stack.enter_context(ResponseCache(cache_path)) if cache_path else None
+            selector = MagicCardSelector(cache=cache)
+
+        run_id = run_id or filter_run_id(csv_file_path, deck_concept, chunk_size, token_budget, selector)
+        if new_run:
+            journal.reset_run(run_id)
+        journal.start_run(run_id, csv_file_path, deck_concept, chunk_size, token_budget)
+        completed = journal.completed_chunks(run_id)
+
+        if token_budget:
+            # Planning needs every card up front, to report the calls before the first one
+            cards = (card for chunk in split_csv_into_chunks(csv_file_path, chunk_size) for card in chunk)
+            overhead_tokens = estimate_tokens(selector.prompt_overhead(deck_concept))
+            # Selectors with capped completions also need chunks small enough to answer in full
+            chunks = plan_chunks(cards, selector.format_card, token_budget, overhead_tokens, selector.max_output_tokens, selector.card_output_tokens)
+            print(chunks.summary())
+        else:
+            chunks = split_csv_into_chunks(csv_file_path, chunk_size)
+        print("number of chunks:", len(chunks))
+        # Completed chunks at the start of the run are skipped without being read
+        first_chunk = start_chunk
+        while first_chunk in completed:
+            first_chunk += 1
+        pending = ((i, chunk) for i, chunk in chunks.iter_from(first_chunk) if i not in completed)
+        if completed:
+            print(f"Resuming run {run_id}: {len([i for i in completed if i >= start_chunk])} chunks already done")
+        else:
+            print(f"Starting run {run_id}")
+
+        if first_chunk < len(chunks):
+            rate_limiter = TokenBucket(requests_per_minute / 60) if requests_per_minute else None
+
+            def select(indexed_chunk):
+                i, chunk = indexed_chunk
+                print(f"Processing chunk {i+1}/{len(chunks)}")
+                newly_selected = selector.select_cards(chunk, deck_concept)
+                print(newly_selected)
+                journal.record(run_id, i, newly_selected['selected_cards'])
+
+            dispatch_chunks(pending, select, concurrency, rate_limiter)
+    journal.finish_run(run_id)
+    yield from journal.iter_selections(run_id, start_chunk)
+
+@click.command()
+@click.option('--csv-file', '-f', default=None, help='Path to the CSV or Parquet file of cards to filter.')
+@click.option('--deck-concept', '-c', default=None, help='Description of the deck the cards are selected for.')
+@click.option('--chunk-size', default=12, show_default=True, help='Number of cards sent per request.')
+@click.option('--token-budget', default=None, type=int, help='Pack cards into chunks of about this many prompt tokens instead of --chunk-size cards.')
+@click.option('--concurrency', default=DEFAULT_CONCURRENCY, show_default=True, help='Maximum number of requests in flight.')
+@click.option('--requests-per-minute', default=None, type=float, help='Maximum rate of requests.')
+@click.option('--journal', 'journal_path', default=DEFAULT_JOURNAL_PATH, show_default=True, help='Path of the run journal.')
+@click.option('--resume', 'resume_run_id', default=None, help='ID of a journaled run to resume with its recorded inputs.')
+@click.option('--new-run', is_flag=True, help='Start over instead of resuming or replaying a journaled run with the same inputs.')
+def cli(csv_file, deck_concept, chunk_size, token_budget, concurrency, requests_per_minute, journal_path, resume_run_id, new_run):
+    """
+    Selects the cards of a collection that fit a deck concept, chunk by chunk.
+    """
+    with RunJournal(journal_path) as journal:
+        if resume_run_id:
+            run = journal.get_run(resume_run_id)
+            if run is None:
+                raise click.BadParameter(f"no run '{resume_run_id}' in {journal_path}", param_hint='--resume')
+            csv_file, deck_concept, chunk_size, token_budget = run['csv_file'], run['deck_concept'], run['chunk_size'], run['token_budget']
+        elif not csv_file or not deck_concept:
+            raise click.UsageError('--csv-file and --deck-concept are required unless resuming a run.')
+        for _, selected_cards in run_filter(journal, csv_file, deck_concept, chunk_size, concurrency=concurrency, requests_per_minute=requests_per_minute, run_id=resume_run_id, token_budget=token_budget, new_run=new_run):
+            for card in selected_cards:
+                print(card)
 
 if __name__ == "__main__":
-    csv_file_path = "test/test_data/test-collection-reduced-enhanced-expected-commander-legal.csv"
-    deck_concept = "I'm building a +1/+1 counters deck"
-    recommended_cards = filter_cards(csv_file_path, deck_concept, 20)
-    for card_set in recommended_cards:
-        for card in card_set:
-            print(card)
+    cli()
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Iterator
+
+DEFAULT_JOURNAL_PATH = 'filter_runs.db'
+
+def selector_identity(selector) -> list:
+    """
+    The parts of a card selector that change its answers: its class, model, prompt template,
+    temperature and API endpoint, the same inputs ai.response_cache.response_cache_key covers.
+    Selectors without some of these attributes leave them out.
+    """
+    template = getattr(getattr(selector, 'prompt_template', None), 'template', None)
+    return [
+        f"{type(selector).__module__}.{type(selector).__qualname__}",
+        getattr(selector, 'model_name', None),
+        hashlib.sha256(template.encode('utf-8')).hexdigest() if template is not None else None,
+        getattr(selector, 'temperature', None),
+        getattr(selector, 'api_base', None),
+    ]
+
+def filter_run_id(csv_file_path: str, deck_concept: str, chunk_size: int, token_budget: int | None = None, selector=None) -> str:
+    """
+    Identifies a filter run by its inputs, so a restarted run finds its own journal entries.
+    A collection file that was rewritten since, or another selector, gets a new run.
+    Args:
+        csv_file_path (str): Path to the CSV or Parquet file of cards
+        deck_concept (str): Description of the deck
+        chunk_size (int): Number of cards sent per request
+        token_budget (int): Prompt token budget per request, if chunks are planned by tokens
+        selector: Card selector answering the requests, see selector_identity
+    Returns:
+        str: Short hex run ID
+    """
+    stat = os.stat(csv_file_path)
+    inputs = [os.path.abspath(csv_file_path), stat.st_size, stat.st_mtime_ns, deck_concept, chunk_size]
+    if token_budget:
+        inputs.append(token_budget)
+    if selector is not None:
+        inputs.append(selector_identity(selector))
+    inputs = json.dumps(inputs)
+    return hashlib.sha256(inputs.encode('utf-8')).hexdigest()[:12]
+
+class RunJournal:
+    """
+    Durable SQLite journal of filter runs. The selection of every chunk is committed as soon
+    as the chunk completes, so a crashed run loses at most the chunks in flight. It can be
+    shared by the threads of a chunk dispatch.
+    """
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id TEXT PRIMARY KEY,
+            csv_file TEXT NOT NULL,
+            deck_concept TEXT NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            token_budget INTEGER,
+            started_at TEXT NOT NULL,
+            finished_at TEXT
+        )
+        ''')
+        # Journals written before chunks could be planned by tokens
+        if 'token_budget' not in [column[1] for column in self.conn.execute('PRAGMA table_info(runs)')]:
+            self.conn.execute('ALTER TABLE runs ADD COLUMN token_budget INTEGER')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS chunk_selections (
+            run_id TEXT NOT NULL REFERENCES runs (run_id),
+            chunk INTEGER NOT NULL,
+            selected_cards TEXT NOT NULL,
+            PRIMARY KEY (run_id, chunk)
+        )
+        ''')
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def start_run(self, run_id: str, csv_file_path: str, deck_concept: str, chunk_size: int, token_budget: int | None = None):
+        """
+        Records the inputs of a run, unless the run is already in the journal.
+        """
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR IGNORE INTO runs (run_id, csv_file, deck_concept, chunk_size, token_budget, started_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (run_id, os.path.abspath(csv_file_path), deck_concept, chunk_size, token_budget, datetime.now(timezone.utc).isoformat())
+            )
+            self.conn.commit()
+
+    def reset_run(self, run_id: str):
+        """
+        Forgets a run and the selections recorded for it, so it starts over.
+        """
+        with self._lock:
+            self.conn.execute('DELETE FROM chunk_selections WHERE run_id = ?', (run_id,))
+            self.conn.execute('DELETE FROM runs WHERE run_id = ?', (run_id,))
+            self.conn.commit()
+
+    def get_run(self, run_id: str) -> dict | None:
+        """
+        Returns the inputs of a run as a dict with the csv_file, deck_concept, chunk_size,
+        token_budget and finished_at columns, or None if the run is not in the journal.
+        """
+        columns = ['csv_file', 'deck_concept', 'chunk_size', 'token_budget', 'finished_at']
+        with self._lock:
+            row = self.conn.execute(f"SELECT {', '.join(columns)} FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return dict(zip(columns, row)) if row else None
+
+    def completed_chunks(self, run_id: str) -> set[int]:
+        with self._lock:
+            return {chunk for (chunk,) in self.conn.execute('SELECT chunk FROM chunk_selections WHERE run_id = ?', (run_id,))}
+
+    def record(self, run_id: str, chunk: int, selected_cards: list[str]):
+        """
+        Durably records the selection of a completed chunk.
+        """
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO chunk_selections (run_id, chunk, selected_cards) VALUES (?, ?, ?)',
+                (run_id, chunk, json.dumps(selected_cards))
+            )
+            self.conn.commit()
+
+    def finish_run(self, run_id: str):
+        with self._lock:
+            self.conn.execute('UPDATE runs SET finished_at = ? WHERE run_id = ?', (datetime.now(timezone.utc).isoformat(), run_id))
+            self.conn.commit()
+
+    def iter_selections(self, run_id: str, start_chunk: int = 0) -> Iterator[tuple[int, list[str]]]:
+        """
+        Streams the recorded selections of a run from the journal in chunk order.
+        Args:
+            run_id (str): ID of the run
+            start_chunk (int): Index of the first chunk to read
+        Yields:
+            tuple: (chunk index, selected card names)
+        """
+        cursor = self.conn.execute(
+            'SELECT chunk, selected_cards FROM chunk_selections WHERE run_id = ? AND chunk >= ? ORDER BY chunk',
+            (run_id, start_chunk)
+        )
+        for chunk, selected_cards in cursor:
+            yield chunk, json.loads(selected_cards)
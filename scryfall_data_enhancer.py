@@ -2,170 +2,221 @@ import csv
 import os
 import click
 import csv
-from collections import defaultdict
-from typing import Dict
+from contextlib import ExitStack
+import itertools
+import importlib.util
+from typing import Dict, Iterable, Iterator
 import json
 import sqlite3
+from card_index import CardIndex, open_card_source
+from card_lookup import DEFAULT_CACHE_SIZE, CardLookup
+from commanders import COMMANDER_COMBINATION_HEADERS, CommanderPool
+from color_identity import W, U, B, R, G, UNKNOWN_COLOR_BIT, color_mask, fits_color_mask, mask_to_color_identity
 
 COLOR_IDENTITIES = {
     'colorless': {
         'color_identity': '',
-        'legal_color_identities': ['']
+        'color_mask': 0
     },
     'white': {
         'color_identity': 'w',
-        'legal_color_identities': ['', 'W']
+        'color_mask': W
     },
     'blue': {
         'color_identity': 'u',
-        'legal_color_identities': ['', 'U']
+        'color_mask': U
     },
     'black': {
         'color_identity': 'b',
-        'legal_color_identities': ['', 'B']
+        'color_mask': B
     },
     'red': {
         'color_identity': 'r',
-        'legal_color_identities': ['', 'R']
+        'color_mask': R
     },
     'green': {
         'color_identity': 'g',
-        'legal_color_identities': ['', 'G']
+        'color_mask': G
     },
     'azorius': {  # White-Blue
         'color_identity': 'uw',
-        'legal_color_identities': ['', 'W', 'U', 'WU']
+        'color_mask': W | U
     },
     'boros': {  # White-Red
         'color_identity': 'rw',
-        'legal_color_identities': ['', 'W', 'R', 'WR']
+        'color_mask': W | R
     },
     'orzhov': {  # White-Black
         'color_identity': 'bw',
-        'legal_color_identities': ['', 'W', 'B', 'WB']
+        'color_mask': W | B
     },
     'selesnya': {  # White-Green
         'color_identity': 'gw',
-        'legal_color_identities': ['', 'W', 'G', 'WG']
+        'color_mask': W | G
     },
     'dimir': {  # Blue-Black
         'color_identity': 'bu',
-        'legal_color_identities': ['', 'U', 'B', 'UB']
+        'color_mask': U | B
     },
     'izzet': {  # Blue-Red
         'color_identity': 'ru',
-        'legal_color_identities': ['', 'U', 'R', 'UR']
+        'color_mask': U | R
     },
     'simic': {  # Blue-Green
         'color_identity': 'gu',
-        'legal_color_identities': ['', 'U', 'G', 'UG']
+        'color_mask': U | G
     },
     'rakdos': {  # Black-Red
         'color_identity': 'br',
-        'legal_color_identities': ['', 'B', 'R', 'BR']
+        'color_mask': B | R
     },
     'golgari': {  # Black-Green
         'color_identity': 'bg',
-        'legal_color_identities': ['', 'B', 'G', 'BG']
+        'color_mask': B | G
     },
     'gruul': {  # Red-Green
         'color_identity': 'gr',
-        'legal_color_identities': ['', 'R', 'G', 'RG']
+        'color_mask': R | G
     },
     'wub': {  # White-Blue-Black
         'color_identity': 'buw',
-        'legal_color_identities': ['', 'W', 'U', 'B', 'WU', 'WB', 'UB', 'WUB']
+        'color_mask': W | U | B
     },
     'wur': {  # White-Blue-Red
         'color_identity': 'ruw',
-        'legal_color_identities': ['', 'W', 'U', 'R', 'WU', 'WR', 'UR', 'WUR']
+        'color_mask': W | U | R
     },
     'wug': {  # White-Blue-Green
         'color_identity': 'guw',
-        'legal_color_identities': ['', 'W', 'U', 'G', 'WU', 'WG', 'UG', 'WUG']
+        'color_mask': W | U | G
     },
     'wbr': {  # White-Black-Red
         'color_identity': 'brw',
-        'legal_color_identities': ['', 'W', 'B', 'R', 'WB', 'WR', 'BR', 'WBR']
+        'color_mask': W | B | R
     },
     'wbg': {  # White-Black-Green
         'color_identity': 'bgw',
-        'legal_color_identities': ['', 'W', 'B', 'G', 'WB', 'WG', 'BG', 'WBG']
+        'color_mask': W | B | G
     },
     'wrg': {  # White-Red-Green
         'color_identity': 'grw',
-        'legal_color_identities': ['', 'W', 'R', 'G', 'WR', 'WG', 'RG', 'WRG']
+        'color_mask': W | R | G
     },
     'ubr': {  # Blue-Black-Red
         'color_identity': 'bru',
-        'legal_color_identities': ['', 'U', 'B', 'R', 'UB', 'UR', 'BR', 'UBR']
+        'color_mask': U | B | R
     },
     'ubg': {  # Blue-Black-Green
         'color_identity': 'bgu',
-        'legal_color_identities': ['', 'U', 'B', 'G', 'UB', 'UG', 'BG', 'UBG']
+        'color_mask': U | B | G
     },
     'urg': {  # Blue-Red-Green
         'color_identity': 'gru',
-        'legal_color_identities': ['', 'U', 'R', 'G', 'UR', 'UG', 'RG', 'URG']
+        'color_mask': U | R | G
     },
     'brg': {  # Black-Red-Green
         'color_identity': 'bgr',
-        'legal_color_identities': ['', 'B', 'R', 'G', 'BR', 'BG', 'RG', 'BRG']
+        'color_mask': B | R | G
     },
     'wubr': {  # White-Blue-Black-Red
         'color_identity': 'bruw',
-        'legal_color_identities': ['', 'W', 'U', 'B', 'R', 'WU', 'WB', 'WR', 'UB', 'UR', 'BR', 'WUB', 'WUR', 'WBR', 'UBR', 'WUBR']
+        'color_mask': W | U | B | R
     },
     'wubg': {  # White-Blue-Black-Green
         'color_identity': 'bguw',
-        'legal_color_identities': ['', 'W', 'U', 'B', 'G', 'WU', 'WB', 'WG', 'UB', 'UG', 'BG', 'WUB', 'WUG', 'WBG', 'UBG', 'WUBG']
+        'color_mask': W | U | B | G
     },
     'wurg': {  # White-Blue-Red-Green
         'color_identity': 'gruw',
-        'legal_color_identities': ['', 'W', 'U', 'R', 'G', 'WU', 'WR', 'WG', 'UR', 'UG', 'RG', 'WUR', 'WUG', 'WRG', 'URG', 'WURG']
+        'color_mask': W | U | R | G
     },
     'wbrg': {  # White-Black-Red-Green
         'color_identity': 'bgrw',
-        'legal_color_identities': ['', 'W', 'B', 'R', 'G', 'WB', 'WR', 'WG', 'BR', 'BG', 'RG', 'WBR', 'WBG', 'WRG', 'BRG', 'WBRG']
+        'color_mask': W | B | R | G
     },
     'ubrg': {  # Blue-Black-Red-Green
         'color_identity': 'bgru',
-        'legal_color_identities': ['', 'U', 'B', 'R', 'G', 'UB', 'UR', 'UG', 'BR', 'BG', 'RG', 'UBR', 'UBG', 'URG', 'BRG', 'UBRG']
+        'color_mask': U | B | R | G
     },
     'wubrg': {  # White-Blue-Black-Red-Green
         'color_identity': 'bgruw',
-        'legal_color_identities': ['', 'W', 'U', 'B', 'R', 'G', 'WU', 'WB', 'WR', 'WG', 'UB', 'UR', 'UG', 'BR', 'BG', 'RG', 'WUB', 'WUR', 'WBR', 'WBG', 'WRG', 'UBR', 'UBG', 'URG', 'BRG', 'WUBR', 'WUBG', 'WURG', 'WBRG', 'UBRG', 'WUBRG']
+        'color_mask': W | U | B | R | G
     }
 }
 
-def reduce_collection_csv(input_file) -> str:
+REDUCED_COLUMN_MAPPING = {
+    'Name': 'name',
+    'Scryfall ID': 'scryfall_id'
+}
+
+# Aggregates of the ManaBox lines of one Scryfall ID, written by reduce_collection_csv(dedupe=True)
+QUANTITY_COLUMNS = ['quantity', 'foil_quantity', 'purchase_price']
+
+ENHANCED_HEADERS = ['name', 'scryfall_id', 'commander_legal', 'color_identity', 'mana_cost', 'cmc', 'type_line', 'power', 'toughness', 'oracle_text']
+
+def reduce_row(row: dict) -> dict:
+    """
+    Reduces a ManaBox collection row to the columns the rest of the pipeline uses.
+    Args:
+        row (dict): Row of the ManaBox collection CSV
+    Returns:
+        dict: Row with the reduced column names
+    """
+    return {new_name: row[old_name] for old_name, new_name in REDUCED_COLUMN_MAPPING.items() if old_name in row}
+
+def dedupe_collection_rows(rows: Iterable[dict]) -> list[dict]:
+    """
+    Collapses ManaBox collection rows into one reduced row per Scryfall ID, in order of first
+    appearance, with the quantity, foil quantity and total purchase price of all its lines.
+    Args:
+        rows: Rows of the ManaBox collection CSV
+    Returns:
+        list: Reduced rows with the QUANTITY_COLUMNS added
+    """
+    totals = {}
+    for row in rows:
+        reduced = reduce_row(row)
+        quantity = int(row.get('Quantity') or 1)
+        total = totals.get(reduced['scryfall_id'])
+        if total is None:
+            total = totals[reduced['scryfall_id']] = {**reduced, 'quantity': 0, 'foil_quantity': 0, 'purchase_price': 0.0}
+        total['quantity'] += quantity
+        if row.get('Foil', 'normal') != 'normal':
+            total['foil_quantity'] += quantity
+        total['purchase_price'] += float(row.get('Purchase price') or 0) * quantity
+    return [{**total, 'purchase_price': f"{total['purchase_price']:.2f}"} for total in totals.values()]
+
+def iter_card_copies(rows: Iterable[dict]) -> Iterator[dict]:
+    """
+    Expands rows carrying QUANTITY_COLUMNS back into one row per copy, without those columns.
+    Rows without a quantity are passed through unchanged.
+    """
+    for row in rows:
+        if 'quantity' not in row:
+            yield row
+            continue
+        copy = {column: value for column, value in row.items() if column not in QUANTITY_COLUMNS}
+        for _ in range(int(row['quantity'])):
+            yield copy
+
+def reduce_collection_csv(input_file, dedupe: bool = False) -> str:
     """
     Reduces the collection CSV to only include specific columns name and scryfall_id.
     Args:
         input_file (str): Path to the collection CSV file
+        dedupe (bool): Write one row per Scryfall ID with the QUANTITY_COLUMNS instead of one row per line
     Returns:
         str: Path to the reduced CSV file
     """
     with open(input_file, mode='r', newline='', encoding='utf-8') as infile:
         reader = csv.DictReader(infile)
         
-        # Get the fieldnames we want to keep, with new names
-        fieldnames = ['name', 'scryfall_id']
-        
-        # Map old names to new names
-        column_mapping = {
-            'Name': 'name',
-            'Scryfall ID': 'scryfall_id'
-        }
-        
-        # Filter for only the columns we want
-        filtered_rows = []
-        for row in reader:
-            filtered_row = {}
-            for old_name, new_name in column_mapping.items():
-                if old_name in row:
-                    filtered_row[new_name] = row[old_name]
-            filtered_rows.append(filtered_row)
+        # Filter for only the columns we want, with new names
+        if dedupe:
+            filtered_rows = dedupe_collection_rows(reader)
+        else:
+            filtered_rows = [reduce_row(row) for row in reader]
+    fieldnames = list(REDUCED_COLUMN_MAPPING.values()) + (QUANTITY_COLUMNS if dedupe else [])
 
     output_file = input_file.replace('.csv', '-reduced.csv')
 
@@ -196,42 +247,77 @@ def get_card_data(id: str, db_path: str) -> dict:
         conn.close()
     return record_dict
 
-def enhance_card_data(reduced_file, card_db) -> str:
+def format_enhanced_row(card_id: str, details: dict) -> dict:
+    """
+    Formats a card record as a row of the enhanced CSV.
+    Args:
+        card_id (str): Scryfall ID of the card
+        details (dict): Card record from the card database
+    Returns:
+        dict: Row keyed by ENHANCED_HEADERS, with values as they are written to the CSV
+    """
+    return {
+        'name': details['name'],
+        'scryfall_id': card_id,
+        'commander_legal': str(bool(details['commander_legal'])),
+        'color_identity': details['color_identity'],
+        'mana_cost': details['mana_cost'],
+        'cmc': str(int(details['cmc'])),
+        'type_line': details['type_line'],
+        'power': details['power'],
+        'toughness': details['toughness'],
+        'oracle_text': details['oracle_text'].replace('\n', '|'),
+    }
+
+def enhance_card_data(reduced_file, card_db, cache_size: int = DEFAULT_CACHE_SIZE, warm_cache: str | None = None, expand_copies: bool = False) -> str:
     print(f"Reading card IDs from '{reduced_file}'...")
     with open(reduced_file, 'r', newline='', encoding='utf-8') as infile:
-        reader = csv.reader(infile)
-        card_ids = [row[1] for row in reader if row and row[1] != "scryfall_id"]
-    print(f"Found {len(card_ids)} card IDs to process.")
+        reader = csv.DictReader(infile)
+        reduced_rows = list(reader)
+        quantity_columns = [column for column in QUANTITY_COLUMNS if column in reader.fieldnames]
+    print(f"Found {len(reduced_rows)} card IDs to process.")
 
-    final_headers = ['name', 'scryfall_id', 'commander_legal', 'color_identity', 'mana_cost', 'cmc', 'type_line', 'power', 'toughness', 'oracle_text']
     output_file_path = reduced_file.replace('.csv', '-enhanced.csv')
     print(f"Enhancing data and saving to '{output_file_path}'...")
 
-    with open(output_file_path, 'w', newline='', encoding='utf-8') as outfile:
-        writer = csv.writer(outfile)
-        writer.writerow(final_headers)
+    with open(output_file_path, 'w', newline='', encoding='utf-8') as outfile, open_card_source(card_db, cache_size, warm_cache) as lookup:
+        writer = csv.DictWriter(outfile, fieldnames=ENHANCED_HEADERS if expand_copies else ENHANCED_HEADERS + quantity_columns)
+        writer.writeheader()
 
-        for i, card_id in enumerate(card_ids):
-            print(f"Processing card {i+1}/{len(card_ids)}: {card_id}...")
-            details = get_card_data(id=card_id, db_path=card_db)
+        card_ids = (row['scryfall_id'] for row in reduced_rows)
+        for i, (row, (card_id, details)) in enumerate(zip(reduced_rows, lookup.iter_cards(card_ids))):
+            print(f"Processing card {i+1}/{len(reduced_rows)}: {card_id}...")
             if details:
-                name = details.get('name', '')
-                commander_legal = details.get('legalities', {}).get('commander', '') == 'legal'
-                color_identity = ''.join(details.get('color_identity', []))
-                mana_cost = details.get('mana_cost', '')
-                cmc = str(int(details.get('cmc', 0)))
-                type_line = details.get('type_line', '')
-                power = details.get('power', '')
-                toughness = details.get('toughness', '')
-                oracle_text = details.get('oracle_text', '').replace('\n', '|')
-                writer.writerow([name, card_id, commander_legal, color_identity, mana_cost, cmc, type_line, power, toughness, oracle_text])
+                enhanced_row = {**format_enhanced_row(card_id, details), **{column: row[column] for column in quantity_columns}}
+                writer.writerows(iter_card_copies([enhanced_row]) if expand_copies else [enhanced_row])
             else:
                 print(f" -> Could not fetch details for {card_id}. Skipping.")
+        print(lookup.summary())
 
     print("\nProcessing complete!")
     print(f"Enhanced data saved to '{output_file_path}'")
     return output_file_path
 
+def iter_enhanced_rows(reduced_rows: Iterable[dict], lookup: CardLookup | CardIndex) -> Iterator[dict]:
+    """
+    Enhances reduced collection rows with card data, skipping cards that are not in the database.
+    Args:
+        reduced_rows: Rows with a 'scryfall_id' column, and optionally the QUANTITY_COLUMNS
+        lookup (CardLookup or CardIndex): Open lookup against the card database
+    Yields:
+        dict: Rows keyed by ENHANCED_HEADERS, followed by the quantity columns of the reduced row
+    """
+    # The lookup reads ahead one chunk of IDs, tee keeps the rows of that chunk around
+    id_rows, reduced_rows = itertools.tee(reduced_rows)
+    card_ids = (row['scryfall_id'] for row in id_rows)
+    for i, (row, (card_id, details)) in enumerate(zip(reduced_rows, lookup.iter_cards(card_ids))):
+        if i % 1000 == 0:
+            print(f"Processing card {i+1}...", end='\r')
+        if details:
+            yield {**format_enhanced_row(card_id, details), **{column: row[column] for column in QUANTITY_COLUMNS if column in row}}
+        else:
+            print(f" -> Could not fetch details for {card_id}. Skipping.")
+
 def filter_commander_legal(enhanced_file) -> str:
     """
     Filters the enhanced CSV file to include only commander legal cards.
@@ -252,12 +338,15 @@ def filter_commander_legal(enhanced_file) -> str:
         writer.writeheader()
         
         for row in reader:
-            # Check if 'commander_legal' exists and is 'True' (case-insensitive)
-            if 'commander_legal' in row and row['commander_legal'].strip().lower() == 'true':
+            if is_commander_legal(row):
                 writer.writerow(row)
     
     return output_file
 
+def is_commander_legal(row: dict) -> bool:
+    # Check if 'commander_legal' exists and is 'True' (case-insensitive)
+    return 'commander_legal' in row and row['commander_legal'].strip().lower() == 'true'
+
 def filter_by_color_identity(input_file, target_colors) -> list[dict]:
     """
     Filters rows from a CSV file that have one of the specified color identities.
@@ -269,10 +358,25 @@ def filter_by_color_identity(input_file, target_colors) -> list[dict]:
     Returns:
         list: List of dictionaries, where each dictionary represents a row matching the filter
     """
-    matching_rows = []
+    # Color identities match regardless of case and letter order
+    target_masks = {color_mask(color) for color in target_colors}
+    return _filter_rows(input_file, lambda row: color_mask(row['color_identity']) in target_masks)
+
+def filter_by_color_mask(input_file, target_mask: int) -> list[dict]:
+    """
+    Filters rows from a CSV file that can be played under a commander with the given color mask.
     
-    # Convert target colors to lowercase for case-insensitive matching
-    target_colors_lower = [''.join(sorted(color.lower())) for color in target_colors]
+    Args:
+        input_file (str): Path to the input CSV file
+        target_mask (int): Color mask of the commander(s), see color_identity.color_mask
+        
+    Returns:
+        list: List of dictionaries, where each dictionary represents a row matching the filter
+    """
+    return _filter_rows(input_file, lambda row: fits_color_mask(color_mask(row['color_identity']), target_mask))
+
+def _filter_rows(input_file, predicate) -> list[dict]:
+    matching_rows = []
     
     try:
         with open(input_file, mode='r', newline='', encoding='utf-8') as csvfile:
@@ -280,13 +384,8 @@ def filter_by_color_identity(input_file, target_colors) -> list[dict]:
             
             for row in reader:
                 # Check if 'color_identity' column exists
-                if 'color_identity' in row:
-                    color_identity = ''.join(sorted(row['color_identity'].strip().lower()))
-                    if '' in target_colors_lower and (color_identity == '' or color_identity is None):
-                        matching_rows.append(row)
-                        continue
-                    if color_identity in target_colors_lower:
-                        matching_rows.append(row)
+                if 'color_identity' in row and predicate(row):
+                    matching_rows.append(row)
 
     except FileNotFoundError:
         print(f"Error: The file {input_file} was not found.")
@@ -301,14 +400,14 @@ def create_color_identity_csv(commander_legal_file, color_identity_map: dict) ->
     
     Args:
         commander_legal_file (str): Path to the input CSV file
-        target_colors (list): List of color identity values to filter by (default: ['B', ''])
+        color_identity_map (dict): Entry of COLOR_IDENTITIES to filter by
         
     Returns:
         str: Path to the output CSV file if successful, None otherwise
     """
     try:
         # Use the previously defined function to get filtered rows
-        filtered_rows = filter_by_color_identity(commander_legal_file, color_identity_map['legal_color_identities'])
+        filtered_rows = filter_by_color_mask(commander_legal_file, color_identity_map['color_mask'])
         
         # Generate output filename based on input file and target colors
         output_file = commander_legal_file.replace('.csv', f"-{color_identity_map['color_identity']}.csv") 
@@ -336,153 +435,125 @@ def create_color_identity_csv(commander_legal_file, color_identity_map: dict) ->
         print(f"An error occurred: {str(e)}")
         return None
 
+class ColorIdentityFanOut:
+    """
+    Writes rows to the CSV of every entry in COLOR_IDENTITIES they fit, in a single pass.
+
+    A card fits a commander identity when its color mask is a subset of the commander's, so
+    the outputs for each of the 32 possible card masks are worked out once up front.
+    """
+    def __init__(self, commander_legal_file: str, fieldnames: list[str]):
+        self.fieldnames = fieldnames
+        self.output_files = [commander_legal_file.replace('.csv', f"-{color_info['color_identity']}.csv") for color_info in COLOR_IDENTITIES.values()]
+        self.outputs_by_mask = [
+            [i for i, color_info in enumerate(COLOR_IDENTITIES.values()) if fits_color_mask(mask, color_info['color_mask'])]
+            for mask in range(UNKNOWN_COLOR_BIT)
+        ]
+        self.row_counts = [0] * len(self.output_files)
+        self._files = []
+        self._writers = []
+
+    def __enter__(self):
+        for output_file in self.output_files:
+            csvfile = open(output_file, mode='w', newline='', encoding='utf-8')
+            self._files.append(csvfile)
+            writer = csv.DictWriter(csvfile, fieldnames=self.fieldnames)
+            writer.writeheader()
+            self._writers.append(writer)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for csvfile in self._files:
+            csvfile.close()
+        if exc_type is None:
+            for output_file, row_count in zip(self.output_files, self.row_counts):
+                print(f"Successfully wrote {row_count} rows to {output_file}")
+
+    def write(self, row: dict):
+        mask = color_mask(row.get('color_identity', ''))
+        if 'color_identity' not in row or mask >= UNKNOWN_COLOR_BIT:
+            return
+        for i in self.outputs_by_mask[mask]:
+            self._writers[i].writerow(row)
+            self.row_counts[i] += 1
+
 def create_all_color_identity_csvs(commander_legal_file) -> list[str]:
     """
-    Creates CSV files for all defined color identities from the commander legal cards file.
+    Creates CSV files for all defined color identities from the commander legal cards file,
+    reading it only once.
     Args:
         commander_legal_file (str): Path to the commander legal CSV file
     Returns:
         list: List of paths to the created CSV files
     """
-    created_files = []
-    for color_name, color_info in COLOR_IDENTITIES.items():
-        print(f"Creating CSV for color identity: {color_name}...")
-        output_file = create_color_identity_csv(commander_legal_file, color_info)
-        if output_file:
-            created_files.append(output_file)
-    return created_files
+    print(f"Creating CSVs for {len(COLOR_IDENTITIES)} color identities...")
+    with open(commander_legal_file, mode='r', newline='', encoding='utf-8') as infile:
+        reader = csv.DictReader(infile)
+        with ColorIdentityFanOut(commander_legal_file, reader.fieldnames) as fan_out:
+            for row in reader:
+                fan_out.write(row)
+    return fan_out.output_files
 
-def generate_commander_combinations(input_file: str) -> str:
+def generate_commander_combinations(input_file: str, target_mask: int | None = None, card_db: str | None = None, cache_size: int = DEFAULT_CACHE_SIZE, warm_cache: str | None = None) -> str:
     """
     Generate all possible commander combinations from a CSV file of Magic: the Gathering cards.
     
     Args:
         input_file: Path to the input CSV file containing card data
+        target_mask: Only generate combinations with exactly this combined color mask
+        card_db: Path to the SQLite database or card index file the CSV was enhanced from.
+            The commander flags stored in it are used instead of classifying the oracle text
+            of every row.
+        cache_size: Number of card records kept in the lookup cache
+        warm_cache: Path of a warm cache file to load before and save after the lookups
         
     Returns:
         Path to the output CSV file containing all valid commander combinations
     """
-    # Read the input CSV and process cards
-    cards = []
+    output_path = os.path.splitext(input_file)[0] + '_commander_combinations.csv'
     with open(input_file, 'r', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            cards.append(row)
-    
-    # Create a dictionary for quick lookup by name
-    card_by_name = {card['name']: card for card in cards}
-    
-    # Categorize cards
-    legendary_creatures = []
-    partner_cards = []  # Cards with "Partner" (not "Partner With")
-    partner_with_cards = defaultdict(list)  # Maps card name to list of cards it can partner with
-    friends_forever_cards = [] # cards with "Friends Forever"
-    planeswalkers = []
-    backgrounds = []
-    legendary_artifacts = []
+        if card_db is None:
+            # Only commander candidates are kept by the pool, the rest of the file is streamed past
+            return write_commander_combinations(csv.DictReader(csvfile), output_path, target_mask)
+        card_ids = [row['scryfall_id'] for row in csv.DictReader(csvfile)]
+    with open_card_source(card_db, cache_size, warm_cache) as lookup:
+        candidates = load_commander_candidates(card_ids, lookup)
+    return write_commander_combinations(candidates, output_path, target_mask)
+
+def load_commander_candidates(card_ids: Iterable[str], lookup: CardLookup | CardIndex) -> list[dict]:
+    """
+    Loads the cards that can take part in a commander combination through the commander
+    flags stored in the card database.
+    Args:
+        card_ids: Scryfall IDs of the cards, in collection order
+        lookup (CardLookup or CardIndex): Open lookup against the card database
+    Returns:
+        list: Card records of the candidates in collection order, a card repeated in the
+            collection is repeated here as well
+    """
+    card_ids = list(card_ids)
+    records = {record['id']: record for record in lookup.commander_cards(card_ids)}
+    return [records[card_id] for card_id in card_ids if card_id in records]
+
+def write_commander_combinations(cards: Iterable[dict], output_path: str, target_mask: int | None = None) -> str:
+    """
+    Writes all possible commander combinations from a list of Magic: the Gathering cards.
+    Combinations are generated lazily and streamed to the CSV, so the output can be far
+    larger than what fits in memory.
     
-    for card in cards:
-        name = card['name']
-        type_line = card.get('type_line', '').lower()
-        oracle_text = card.get('oracle_text', '').lower()
-        color_identity = card.get('color_identity', '').lower()
-        
-        # Check if legendary creature
-        if 'legendary' in type_line and 'creature' in type_line:
-            # Check for special keywords
-            if 'partner with ' in oracle_text:
-                # Extract the partner name from "Partner With: <Card Name>"
-                partner_name = oracle_text.split('partner with ')[1].split('|')[0].strip()
-                partner_with_cards[name].append(partner_name)
-                partner_with_cards[partner_name].append(name)
-            elif 'partner' in oracle_text and 'partner with' not in oracle_text:
-                partner_cards.append(name)
-            elif 'friends forever' in oracle_text:
-                friends_forever_cards.append(name)
-            legendary_creatures.append(name)
-        
-        # Check for planeswalkers that can be commanders
-        elif 'planeswalker' in type_line and 'can be your commander' in oracle_text:
-            planeswalkers.append(name)
-        
-        # Check for backgrounds
-        elif 'legendary' in type_line and 'enchantment' in type_line and 'background' in type_line:
-            backgrounds.append(name)
+    Args:
+        cards: Rows of card data as in the enhanced CSV
+        output_path: Path of the CSV file to write
+        target_mask: Only write combinations with exactly this combined color mask
         
-        # Check for legendary artifacts with power and toughness
-        elif 'legendary' in type_line and 'artifact' in type_line:
-            power = card.get('power', '')
-            toughness = card.get('toughness', '')
-            if power and toughness:
-                legendary_artifacts.append(name)
-    
-    # Generate all possible commander combinations
-    combinations = []
-    
-    # 1. Single legendary creatures
-    for creature in legendary_creatures:
-        combinations.append((creature, '', color_identity))
-    
-    # 2. Partner cards (any two different partner cards)
-    for i, card1 in enumerate(partner_cards):
-        for card2 in partner_cards[i+1:]:
-            # Get combined color identity
-            color1 = card_by_name[card1].get('color_identity', '').lower()
-            color2 = card_by_name[card2].get('color_identity', '').lower()
-            combined_color = combine_color_identities(color1, color2)
-            combinations.append((card1, card2, combined_color))
-    
-    # 3. Partner With pairs (only specific pairs)
-    for card1, partners in partner_with_cards.items():
-        for partner in partners:
-            if card1 < partner:  # Avoid duplicates (A,B) and (B,A)
-                color1 = card_by_name[card1].get('color_identity', '').lower()
-                color2 = card_by_name[partner].get('color_identity', '').lower()
-                combined_color = combine_color_identities(color1, color2)
-                combinations.append((card1, partner, combined_color))
-
-    # 4. Friends Forever cards (any two different Friends Forever cards)
-    for i, card1 in enumerate(friends_forever_cards):
-        for card2 in friends_forever_cards[i+1:]:
-            # Get combined color identity
-            color1 = card_by_name[card1].get('color_identity', '').lower()
-            color2 = card_by_name[card2].get('color_identity', '').lower()
-            combined_color = combine_color_identities(color1, color2)
-            combinations.append((card1, card2, combined_color))
-    
-    # 5. Planeswalkers
-    for walker in planeswalkers:
-        combinations.append(walker, '', card_by_name[walker].get('color_identity', '').lower())
-    
-    # 6. Background combinations
-    for creature in legendary_creatures:
-        creature_card = card_by_name[creature]
-        creature_text = creature_card.get('oracle_text', '').lower()
-        if 'choose a background' in creature_text:
-            for background in backgrounds:
-                bg_card = card_by_name[background]
-                color1 = creature_card.get('color_identity', '').lower()
-                color2 = bg_card.get('color_identity', '').lower()
-                combined_color = combine_color_identities(color1, color2)
-                combinations.append((creature, background, combined_color))
-    
-    # 7. Legendary Artifacts
-    for artifact in legendary_artifacts:
-        combinations.append((artifact, '', card_by_name[artifact].get('color_identity', '').lower()))
-    
-    # Write to output CSV
-    output_path = os.path.splitext(input_file)[0] + '_commander_combinations.csv'
+    Returns:
+        Path to the output CSV file containing all valid commander combinations
+    """
+    pool = CommanderPool(cards)
     with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['commander_1', 'commander_2', 'combined_color_identity']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-        writer.writeheader()
-        for cmd1, cmd2, color in combinations:
-            writer.writerow({
-                'commander_1': cmd1,
-                'commander_2': cmd2,
-                'combined_color_identity': color
-            })
+        writer = csv.writer(csvfile)
+        writer.writerow(COMMANDER_COMBINATION_HEADERS)
+        writer.writerows(pool.iter_combinations(target_mask))
     
     return output_path
 
@@ -529,21 +600,117 @@ def combine_color_identities(color1: str, color2: str) -> str:
     Returns:
         Combined color identity string
     """
-    combined = set(color1 + color2)
-    return ''.join(sorted(combined)) if combined else 'C'
+    combined = mask_to_color_identity(color_mask(color1) | color_mask(color2))
+    return combined if combined else 'C'
+
+def run_streaming_pipeline(collection_file: str, card_db: str, keep_intermediate: bool = False, cache_size: int = DEFAULT_CACHE_SIZE, warm_cache: str | None = None, dedupe: bool = False, expand_copies: bool = False) -> list[str]:
+    """
+    Runs the whole pipeline in a single pass over the collection CSV.
+
+    Rows flow through reduce, enhance and the commander legality filter as generators and
+    are fanned out to the color identity CSVs as they arrive, so memory use does not grow
+    with the size of the collection. Only commander candidates are kept in memory for the
+    commander combinations. The output files have the same names and contents as the ones
+    written by the stage-by-stage pipeline.
+    Args:
+        collection_file (str): Path to the ManaBox collection CSV file
+        card_db (str): Path to the SQLite database or card index file containing card data
+        keep_intermediate (bool): Also write the reduced, enhanced and commander legal CSVs
+        cache_size (int): Number of card records kept in the lookup cache
+        warm_cache (str): Path of a warm cache file to load before and save after the run
+        dedupe (bool): Collapse the collection to one row per Scryfall ID first, this keeps
+            the running totals of every unique card in memory
+        expand_copies (bool): With dedupe, write one row per copy after the enhance stage
+    Returns:
+        list: Paths to the created CSV files
+    """
+    reduced_file = collection_file.replace('.csv', '-reduced.csv')
+    enhanced_file = reduced_file.replace('.csv', '-enhanced.csv')
+    commander_legal_file = enhanced_file.replace('.csv', '-commander-legal.csv')
+    created_files = []
+
+    with ExitStack() as stack:
+        def open_writer(path: str, fieldnames: list[str]) -> csv.DictWriter:
+            writer = csv.DictWriter(stack.enter_context(open(path, mode='w', newline='', encoding='utf-8')), fieldnames=fieldnames)
+            writer.writeheader()
+            created_files.append(path)
+            return writer
+
+        def tee(rows: Iterable[dict], path: str, fieldnames: list[str]) -> Iterator[dict]:
+            writer = open_writer(path, fieldnames)
+            for row in rows:
+                writer.writerow(row)
+                yield row
+
+        infile = stack.enter_context(open(collection_file, mode='r', newline='', encoding='utf-8'))
+        lookup = stack.enter_context(open_card_source(card_db, cache_size, warm_cache))
+
+        if dedupe:
+            rows = dedupe_collection_rows(csv.DictReader(infile))
+        else:
+            rows = (reduce_row(row) for row in csv.DictReader(infile))
+        quantity_columns = QUANTITY_COLUMNS if dedupe else []
+        if keep_intermediate:
+            rows = tee(rows, reduced_file, list(REDUCED_COLUMN_MAPPING.values()) + quantity_columns)
+        rows = iter_enhanced_rows(rows, lookup)
+        if expand_copies:
+            rows = iter_card_copies(rows)
+            quantity_columns = []
+        if keep_intermediate:
+            rows = tee(rows, enhanced_file, ENHANCED_HEADERS + quantity_columns)
+        rows = (row for row in rows if is_commander_legal(row))
+        if keep_intermediate:
+            rows = tee(rows, commander_legal_file, ENHANCED_HEADERS + quantity_columns)
+
+        fan_out = stack.enter_context(ColorIdentityFanOut(commander_legal_file, ENHANCED_HEADERS + quantity_columns))
+        created_files.extend(fan_out.output_files)
+        legal_ids = []
+
+        for row in rows:
+            fan_out.write(row)
+            legal_ids.append(row['scryfall_id'])
+        commander_candidates = load_commander_candidates(legal_ids, lookup)
+        print(lookup.summary())
+
+    combinations_file = os.path.splitext(commander_legal_file)[0] + '_commander_combinations.csv'
+    created_files.append(write_commander_combinations(commander_candidates, combinations_file))
+    return created_files
 
 @click.command()
 @click.option('--collection-file', '-f', required=True, help='Path to the input CSV file with Scryfall IDs.')
-@click.option('--card-db', '--db', default='cards.db', help='Path to the SQLite database containing card data.')
-def cli(collection_file, card_db):
+@click.option('--card-db', '--db', default='cards.db', help='Path to the SQLite database or card index file containing card data.')
+@click.option('--stream', is_flag=True, help='Process the collection in a single streaming pass.')
+@click.option('--engine', type=click.Choice(['rows', 'columnar']), default='rows', show_default=True, help='Process the collection row by row or as pandas DataFrames.')
+@click.option('--keep-intermediate', is_flag=True, help='With --stream, also write the reduced, enhanced and commander legal CSVs.')
+@click.option('--dedupe', is_flag=True, help='Collapse the collection to one row per Scryfall ID with quantity, foil quantity and purchase price.')
+@click.option('--expand-copies', is_flag=True, help='With --dedupe, write one enhanced row per copy of each card.')
+@click.option('--cache-size', default=DEFAULT_CACHE_SIZE, show_default=True, help='Number of card records kept in the lookup cache, 0 disables it.')
+@click.option('--warm-cache', default=None, help='Path of a warm cache file reused across runs against the same card database.')
+@click.option('--parquet', is_flag=True, help='Also write a Parquet file with typed columns next to every CSV (needs pyarrow).')
+def cli(collection_file, card_db, stream, engine, keep_intermediate, dedupe, expand_copies, cache_size, warm_cache, parquet):
     """
     Command-line interface to enhance card data from a collection CSV file.
     """
-    reduced_file = reduce_collection_csv(collection_file)
-    enhanced_file = enhance_card_data(reduced_file, card_db)
-    commander_legal_file = filter_commander_legal(enhanced_file)
-    create_all_color_identity_csvs(commander_legal_file)
-    generate_commander_combinations(commander_legal_file)
+    if parquet and importlib.util.find_spec('pyarrow') is None:
+        raise click.UsageError('--parquet needs pyarrow, install it with: pip install pyarrow')
+    if engine == 'columnar':
+        if stream or dedupe:
+            raise click.UsageError('--engine columnar cannot be combined with --stream or --dedupe.')
+        # Imported here as pandas is slow to import and only the columnar engine needs it
+        from columnar import run_columnar_pipeline
+        created_files = run_columnar_pipeline(collection_file, card_db, cache_size, warm_cache)
+    elif stream:
+        created_files = run_streaming_pipeline(collection_file, card_db, keep_intermediate, cache_size, warm_cache, dedupe, expand_copies)
+    else:
+        reduced_file = reduce_collection_csv(collection_file, dedupe)
+        enhanced_file = enhance_card_data(reduced_file, card_db, cache_size, warm_cache, expand_copies)
+        commander_legal_file = filter_commander_legal(enhanced_file)
+        created_files = [reduced_file, enhanced_file, commander_legal_file]
+        created_files += create_all_color_identity_csvs(commander_legal_file)
+        created_files.append(generate_commander_combinations(commander_legal_file, card_db=card_db, cache_size=cache_size, warm_cache=warm_cache))
+    if parquet:
+        from columnar import write_parquet_files
+        write_parquet_files(created_files)
 
 if __name__ == "__main__":
-    cli()
+    cli()
\ No newline at end of file
@@ -0,0 +1,20 @@
+import os
+import pytest
+from db_loader import load_db, write_card_index
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+all_cards_file = os.path.join(this_dir, 'test_data', 'test-all-cards.json')
+
+@pytest.fixture
+def card_db(tmp_path) -> str:
+    """Path of a SQLite card database loaded with the test cards."""
+    db_path = str(tmp_path / 'cards.db')
+    load_db(all_cards_file, db_path)
+    return db_path
+
+@pytest.fixture
+def card_index(card_db, tmp_path) -> str:
+    """Path of a card index file written from the card_db database."""
+    index_path = str(tmp_path / 'cards.idx')
+    assert write_card_index(card_db, index_path) == 12
+    return index_path
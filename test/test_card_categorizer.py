@@ -0,0 +1,48 @@
+import os
+import pytest
+import pandas as pd
+
+pytest.importorskip('langchain_openai')
+from ai.card_categorizer import MagicCardSelector
+from chunk_planner import estimate_tokens
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+CATEGORIES = ['Tutors', 'Ramp', 'Card Draw']
+
+def _cards() -> list[dict]:
+    csv_file = os.path.join(this_dir, 'test_data', 'test-collection-reduced-enhanced-expected.csv')
+    return pd.read_csv(csv_file, dtype=str, keep_default_na=False).to_dict(orient='records')
+
+def test_categorizer_plans_chunks_by_its_completion_cap(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    categorizer = MagicCardSelector()
+    assert categorizer.max_output_tokens == 2000
+    cards = _cards()
+    assert len(categorizer.plan_categorize_chunks(cards, 'tutors', CATEGORIES, token_budget=100_000)) == 1
+
+    # Each card is named in two categories, inside the objects of every category and CUT
+    categorizer.max_output_tokens = 100
+    plan = categorizer.plan_categorize_chunks(cards, 'tutors', CATEGORIES, token_budget=100_000)
+    assert len(plan) > 1
+    overhead = categorizer.output_overhead_tokens(CATEGORIES)
+    assert overhead == estimate_tokens('{"categories": [{"category": "Tutors", "cards": []}, {"category": "Ramp", "cards": []}, {"category": "Card Draw", "cards": []}, {"category": "CUT", "cards": []}]}')
+    for chunk in plan:
+        assert overhead + sum(categorizer.card_output_tokens(card) for card in chunk) <= 100
+    assert [card['name'] for chunk in plan for card in chunk] == [card['name'] for card in cards]
+
+def test_categorize_in_chunks_merges_the_categories_of_every_chunk(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    categorizer = MagicCardSelector()
+    categorizer.max_output_tokens = 100
+    calls = []
+
+    def categorize_cards(cards, deck_concept, categories):
+        calls.append([card['name'] for card in cards])
+        return {'categories': [{'category': 'Tutors', 'cards': [cards[0]['name']]}, {'category': 'CUT', 'cards': [card['name'] for card in cards[1:]]}]}
+    monkeypatch.setattr(categorizer, 'categorize_cards', categorize_cards)
+    result = categorizer.categorize_in_chunks(_cards(), 'tutors', CATEGORIES, token_budget=100_000)
+    assert len(calls) > 1
+    assert result['categories'] == [
+        {'category': 'Tutors', 'cards': [names[0] for names in calls]},
+        {'category': 'CUT', 'cards': [name for names in calls for name in names[1:]]},
+    ]
@@ -0,0 +1,35 @@
+import os
+import shutil
+from card_index import CardIndex, open_card_source
+from card_lookup import CardLookup
+from scryfall_data_enhancer import enhance_card_data
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+
+OZOLITH_ID = '7d9df3ce-25f9-426c-a113-6aea53ddf619'
+MISSING_ID = '00000000-0000-0000-0000-000000000000'
+
+def test_card_index_matches_card_lookup(card_db, card_index):
+    with CardLookup(card_db) as lookup:
+        all_ids = [card_id for (card_id,) in lookup.conn.execute('SELECT id FROM printings')]
+        expected = list(lookup.iter_cards(all_ids + [MISSING_ID, 'not-a-uuid']))
+        expected_commanders = lookup.commander_cards(all_ids + all_ids)
+    with CardIndex(card_index) as index:
+        assert list(index.iter_cards(all_ids + [MISSING_ID, 'not-a-uuid'])) == expected
+        assert (index.found, index.missing) == (12, 2)
+        assert index.commander_cards(all_ids + all_ids) == expected_commanders
+        assert list(index.get_cards([OZOLITH_ID, MISSING_ID, OZOLITH_ID])) == [OZOLITH_ID]
+
+def test_open_card_source_detects_index_files(card_db, card_index):
+    with open_card_source(card_index) as source:
+        assert isinstance(source, CardIndex)
+    with open_card_source(card_db) as source:
+        assert isinstance(source, CardLookup)
+
+def test_enhance_card_data_from_card_index(tmp_path, card_index):
+    reduced_file = str(tmp_path / 'collection-reduced.csv')
+    shutil.copy(os.path.join(this_dir, 'test_data', 'test-collection-reduced-expected.csv'), reduced_file)
+    with open(enhance_card_data(reduced_file, card_index), 'r', encoding='utf-8') as f:
+        actual_content = f.read()
+    with open(os.path.join(this_dir, 'test_data', 'test-collection-reduced-enhanced-expected.csv'), 'r', encoding='utf-8') as f:
+        assert actual_content == f.read()
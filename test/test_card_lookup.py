@@ -0,0 +1,100 @@
+import os
+import sqlite3
+from db_loader import load_db
+from card_lookup import CardLookup
+from color_identity import color_mask
+from commanders import LEGENDARY_CREATURE
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+
+OZOLITH_ID = '7d9df3ce-25f9-426c-a113-6aea53ddf619'
+VAMPIRIC_TUTOR_ID = '0a07cba3-2e8d-48ec-a6f8-4d2edfcd833d'
+MISSING_ID = '00000000-0000-0000-0000-000000000000'
+
+def test_get_cards(card_db):
+    with CardLookup(card_db) as lookup:
+        cards = lookup.get_cards([VAMPIRIC_TUTOR_ID, MISSING_ID, VAMPIRIC_TUTOR_ID, OZOLITH_ID])
+    assert set(cards) == {OZOLITH_ID, VAMPIRIC_TUTOR_ID}
+    assert cards[OZOLITH_ID]['name'] == 'The Ozolith'
+
+def test_iter_cards_preserves_order_across_chunks(card_db):
+    ids = [OZOLITH_ID, MISSING_ID, VAMPIRIC_TUTOR_ID, OZOLITH_ID, MISSING_ID]
+    with CardLookup(card_db, chunk_size=2) as lookup:
+        results = list(lookup.iter_cards(ids))
+    assert [card_id for card_id, _ in results] == ids
+    assert [details['name'] if details else None for _, details in results] == \
+        ['The Ozolith', None, 'Vampiric Tutor', 'The Ozolith', None]
+
+def test_color_index(card_db):
+    atraxa_id = 'dac080ef-8f40-43a2-8440-b457b6074b69'
+    with CardLookup(card_db) as lookup:
+        index = lookup.color_index([OZOLITH_ID, VAMPIRIC_TUTOR_ID, atraxa_id, MISSING_ID])
+    assert sorted(index.fitting(color_mask('B'))) == sorted([OZOLITH_ID, VAMPIRIC_TUTOR_ID])
+    assert sorted(index.fitting(color_mask('WUBG'))) == sorted([OZOLITH_ID, VAMPIRIC_TUTOR_ID, atraxa_id])
+
+def test_commander_cards(card_db):
+    atraxa_id = 'dac080ef-8f40-43a2-8440-b457b6074b69'
+    with CardLookup(card_db, chunk_size=2) as lookup:
+        commanders = lookup.commander_cards([OZOLITH_ID, atraxa_id, VAMPIRIC_TUTOR_ID, atraxa_id])
+    assert [card['name'] for card in commanders] == ["Atraxa, Praetors' Voice"]
+    assert commanders[0]['commander_flags'] == LEGENDARY_CREATURE
+
+def test_cache_counts_hits_and_evicts(card_db):
+    ids = [OZOLITH_ID, OZOLITH_ID, VAMPIRIC_TUTOR_ID, MISSING_ID, OZOLITH_ID, MISSING_ID]
+    with CardLookup(card_db, chunk_size=2, cache_size=2) as lookup:
+        results = list(lookup.iter_cards(ids))
+        assert [details['name'] if details else None for _, details in results] == \
+            ['The Ozolith', 'The Ozolith', 'Vampiric Tutor', None, 'The Ozolith', None]
+        # The Ozolith is evicted by Vampiric Tutor and the missing ID before it is asked for again
+        assert (lookup.cache.hits, lookup.cache.misses) == (2, 4)
+        assert len(lookup.cache) == 2
+
+def test_warm_cache_is_reused_for_the_same_db_version(tmp_path, card_db):
+    warm_cache = str(tmp_path / 'cards.cache')
+    with CardLookup(card_db, warm_cache_path=warm_cache) as lookup:
+        lookup.get_cards([OZOLITH_ID, MISSING_ID])
+    with CardLookup(card_db, warm_cache_path=warm_cache) as lookup:
+        cards = lookup.get_cards([OZOLITH_ID, MISSING_ID])
+        assert (lookup.cache.hits, lookup.cache.misses) == (2, 0)
+    assert list(cards) == [OZOLITH_ID]
+
+    load_db(os.path.join(this_dir, 'test_data', 'test-all-cards.json'), card_db)
+    os.utime(card_db, ns=(0, 0))
+    with CardLookup(card_db, warm_cache_path=warm_cache) as lookup:
+        lookup.get_cards([OZOLITH_ID])
+        assert lookup.cache.misses == 1
+
+def test_unreadable_warm_cache_is_ignored(tmp_path, card_db):
+    warm_cache = str(tmp_path / 'cards.cache')
+    with CardLookup(card_db, warm_cache_path=warm_cache) as lookup:
+        lookup.get_cards([OZOLITH_ID])
+    with open(warm_cache, 'rb') as f:
+        content = f.read()
+    # Truncated, not JSON at all, and JSON of another shape
+    for broken in [content[:len(content) // 2], b'\x80\x05\x95garbage', b'[1, 2, 3]', content.replace(b'"records": [', b'"records": [1, ')]:
+        with open(warm_cache, 'wb') as f:
+            f.write(broken)
+        with CardLookup(card_db, warm_cache_path=warm_cache) as lookup:
+            assert lookup.get_cards([OZOLITH_ID])[OZOLITH_ID]['name'] == 'The Ozolith'
+            assert lookup.cache.misses == 1
+    # The ignored file is replaced by a readable one on close
+    with CardLookup(card_db, warm_cache_path=warm_cache) as lookup:
+        lookup.get_cards([OZOLITH_ID])
+        assert (lookup.cache.hits, lookup.cache.misses) == (1, 0)
+
+def test_printings_of_one_oracle_card_are_read_once(card_db):
+    reprint_id = '22222222-3333-4444-8555-666666666666'
+    with sqlite3.connect(card_db) as conn:
+        conn.execute("INSERT INTO printings (id, oracle_id) SELECT ?, oracle_id FROM printings WHERE id = ?", (reprint_id, VAMPIRIC_TUTOR_ID))
+    with CardLookup(card_db) as lookup:
+        cards = lookup.get_cards([VAMPIRIC_TUTOR_ID, reprint_id, OZOLITH_ID])
+        assert (lookup.oracle_cache.hits, lookup.oracle_cache.misses) == (1, 2)
+    assert cards[reprint_id] == dict(cards[VAMPIRIC_TUTOR_ID], id=reprint_id)
+
+def test_oracle_cache_evictions_do_not_lose_records_of_the_same_chunk(card_db):
+    with CardLookup(card_db, cache_size=1) as lookup:
+        lookup.get_cards([OZOLITH_ID])
+        lookup.get_cards([MISSING_ID])
+        # The Ozolith is a cached oracle hit, fetching Vampiric Tutor evicts it from the cache
+        cards = lookup.get_cards([OZOLITH_ID, VAMPIRIC_TUTOR_ID])
+    assert [card['name'] for card in cards.values()] == ['The Ozolith', 'Vampiric Tutor']
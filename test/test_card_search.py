@@ -0,0 +1,61 @@
+import json
+import os
+import sqlite3
+import pytest
+from card_search import read_collection_ids, search_cards
+from db_loader import load_db, refresh_db
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+all_cards_file = os.path.join(this_dir, 'test_data', 'test-all-cards.json')
+
+ATRAXA_ID = 'dac080ef-8f40-43a2-8440-b457b6074b69'
+
+def _names(cards: list[dict]) -> list[str]:
+    return sorted(card['name'] for card in cards)
+
+def test_search_cards(card_db):
+    # 'counter' is stemmed and matches 'counters'
+    assert _names(search_cards(card_db, 'counter AND type_line:(creature OR artifact)')) == ["Atraxa, Praetors' Voice", 'The Great Henge', 'The One Ring', 'The Ozolith']
+    assert _names(search_cards(card_db, 'counter AND type_line:(creature OR artifact)', identity='gw')) == ['The Great Henge', 'The One Ring', 'The Ozolith']
+    assert _names(search_cards(card_db, 'tutor', identity='u')) == []
+    assert len(search_cards(card_db, 'a*', limit=3)) == 3
+
+def test_search_cards_in_collection(tmp_path):
+    db_path = str(tmp_path / 'cards.db')
+    load_db(all_cards_file, db_path, bulk=True)
+    owned = read_collection_ids(os.path.join(this_dir, 'test_data', 'test-collection.csv'))
+    assert read_collection_ids(os.path.join(this_dir, 'test_data', 'test-collection-reduced-expected.csv')) == owned
+    found = search_cards(db_path, 'search your library', card_ids=owned)
+    assert _names(found) == ['Demonic Tutor', 'Vampiric Tutor']
+    assert found[0]['oracle_id'] and found[0]['commander_legal'] == 1
+    assert search_cards(db_path, 'search your library', card_ids=['0a07cba3-2e8d-48ec-a6f8-4d2edfcd833d'])[0]['name'] == 'Vampiric Tutor'
+
+def test_search_index_follows_refreshes(tmp_path, card_db):
+    with open(all_cards_file, 'r', encoding='utf-8') as f:
+        cards = json.load(f)
+    for card in cards:
+        if card['name'] == 'Vampiric Tutor':
+            card['oracle_text'] = 'Errata: look at the top card of your library.'
+    refreshed_file = str(tmp_path / 'all_cards.json')
+    with open(refreshed_file, 'w', encoding='utf-8') as f:
+        json.dump(cards, f)
+    refresh_db(refreshed_file, card_db)
+    assert _names(search_cards(card_db, 'errata')) == ['Vampiric Tutor']
+    assert _names(search_cards(card_db, '"search your library"')) == ['Demonic Tutor']
+
+def test_search_index_is_built_for_older_databases(card_db):
+    with sqlite3.connect(card_db) as conn:
+        conn.execute('DROP TABLE oracle_cards_search')
+    load_db(all_cards_file, card_db)
+    assert _names(search_cards(card_db, 'proliferate')) == ["Atraxa, Praetors' Voice"]
+
+def test_search_cards_opens_the_database_read_only(tmp_path, card_db):
+    with open(card_db, 'rb') as f:
+        content = f.read()
+    assert _names(search_cards(card_db, 'proliferate', card_ids=[ATRAXA_ID])) == ["Atraxa, Praetors' Voice"]
+    with open(card_db, 'rb') as f:
+        assert f.read() == content
+    missing_path = tmp_path / 'missing.db'
+    with pytest.raises(sqlite3.OperationalError):
+        search_cards(str(missing_path), 'proliferate')
+    assert not missing_path.exists()
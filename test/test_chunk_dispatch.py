@@ -0,0 +1,51 @@
+import threading
+import time
+from chunk_dispatch import TokenBucket, dispatch_chunks
+
+def test_dispatch_chunks_keeps_order_and_concurrency_limit():
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def work(chunk):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        # Later chunks finish first
+        time.sleep(0.01 * (10 - chunk))
+        with lock:
+            running[0] -= 1
+        return chunk * 2
+
+    assert dispatch_chunks(range(10), work, concurrency=3) == [chunk * 2 for chunk in range(10)]
+    assert peak[0] == 3
+
+def test_token_bucket_waits_for_tokens():
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0], sleep=sleep)
+    for _ in range(4):
+        bucket.acquire()
+    # Two tokens of burst, then one every half second
+    assert sleeps == [0.5, 0.5]
+    assert now[0] == 1.0
+
+def test_dispatch_chunks_reads_lazy_chunks_as_the_pool_frees_up():
+    read = []
+
+    def chunks():
+        for chunk in range(20):
+            read.append(chunk)
+            yield chunk
+
+    def work(chunk):
+        # Never more than the running chunks and one waiting chunk have been read
+        assert len(read) <= chunk + 3
+        return chunk
+
+    assert dispatch_chunks(chunks(), work, concurrency=2) == list(range(20))
@@ -0,0 +1,29 @@
+from chunk_planner import estimate_tokens, plan_chunks
+
+def _card(name: str, oracle_text: str = '') -> dict:
+    return {'name': name, 'oracle_text': oracle_text}
+
+def _format_card(card: dict) -> str:
+    return f"- {card['name']}: {card['oracle_text']}"
+
+def test_plan_chunks_packs_cards_up_to_the_budget():
+    cards = [_card('A', 'x' * 30), _card('B', 'x' * 30), _card('C', 'x' * 70), _card('D'), _card('E', 'x' * 200)]
+    plan = plan_chunks(cards, _format_card, token_budget=40, overhead_tokens=10)
+    assert [[card['name'] for card in chunk] for chunk in plan] == [['A', 'B'], ['C', 'D'], ['E']]
+    assert plan.prompt_tokens[0] == 10 + 2 * (estimate_tokens(_format_card(cards[0])) + 1)
+    assert all(tokens <= 40 for tokens in plan.prompt_tokens[:2])
+    assert plan.oversized == 1
+    assert list(plan.iter_from(1)) == [(1, plan.chunks[1]), (2, plan.chunks[2])]
+    assert plan.summary().startswith('Planned 3 calls for 5 cards')
+
+def test_plan_chunks_respects_the_output_cap():
+    cards = [_card(f"Card {i}") for i in range(10)]
+    plan = plan_chunks(cards, _format_card, token_budget=10_000, max_output_tokens=20)
+    # Each name is about 2 tokens plus 2 for the JSON list around it
+    assert [len(chunk) for chunk in plan] == [5, 5]
+
+def test_plan_chunks_uses_the_output_estimate_of_the_selector():
+    cards = [_card(f"Card {i}") for i in range(10)]
+    # Every card named in two categories, below a response skeleton of 8 tokens
+    plan = plan_chunks(cards, _format_card, token_budget=10_000, max_output_tokens=20, card_output_tokens=lambda card: 6, output_overhead_tokens=8)
+    assert [len(chunk) for chunk in plan] == [2, 2, 2, 2, 2]
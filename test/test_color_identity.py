@@ -0,0 +1,24 @@
+from itertools import combinations
+from color_identity import ColorMaskIndex, color_mask, fits_color_mask, mask_to_color_identity, submasks
+
+IDENTITIES = [''.join(colors) for size in range(6) for colors in combinations('WUBRG', size)]
+
+def test_color_mask_round_trip():
+    assert color_mask('') == 0
+    assert color_mask('BG') == color_mask('gb')
+    assert mask_to_color_identity(color_mask('WUBRG')) == 'bgruw'
+    assert len({color_mask(identity) for identity in IDENTITIES}) == 32
+
+def test_fits_color_mask_is_subset():
+    for identity in IDENTITIES:
+        for target in IDENTITIES:
+            assert fits_color_mask(color_mask(identity), color_mask(target)) == set(identity).issubset(target), f"{identity} in {target}"
+    assert not fits_color_mask(color_mask('C'), color_mask('WUBRG'))
+
+def test_color_mask_index_fitting():
+    index = ColorMaskIndex()
+    for identity in IDENTITIES:
+        index.add(identity or 'colorless', color_mask(identity))
+    assert sorted(index.fitting(color_mask('BG'))) == ['B', 'BG', 'G', 'colorless']
+    assert len(index.fitting(color_mask('WUBRG'))) == 32
+    assert len(list(submasks(color_mask('WUB')))) == 8
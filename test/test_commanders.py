@@ -0,0 +1,69 @@
+import random
+from color_identity import color_mask
+from commanders import LEGENDARY_ARTIFACT, LEGENDARY_CREATURE, PARTNER, PARTNER_WITH, CommanderPool, classify_commander
+
+def _card(name: str, color_identity: str, type_line: str, oracle_text: str = '', power: str = '', toughness: str = '') -> dict:
+    return {'name': name, 'color_identity': color_identity, 'type_line': type_line, 'oracle_text': oracle_text, 'power': power, 'toughness': toughness}
+
+CARDS = [
+    _card('Atraxa', 'BGUW', 'Legendary Creature — Phyrexian Angel Horror'),
+    _card('Thrasios', 'GU', 'Legendary Creature — Merfolk Wizard', 'Partner'),
+    _card('Tymna', 'BW', 'Legendary Creature — Human Cleric', 'Partner'),
+    _card('Pako', 'G', 'Legendary Creature — Elemental Dog', 'Partner with Haldan|Haste'),
+    _card('Haldan', 'U', 'Legendary Creature — Avatar Rogue', 'Partner with Pako|Haste'),
+    _card('Wilson', 'G', 'Legendary Creature — Bear Warrior', 'Choose a Background'),
+    _card('Raised by Giants', 'G', 'Legendary Enchantment — Background'),
+    _card('Nahiri', 'RW', 'Legendary Planeswalker — Nahiri', 'Nahiri can be your commander.'),
+    _card('Shorikai', 'UW', 'Legendary Artifact — Vehicle', '', '3', '3'),
+    _card('The One Ring', '', 'Legendary Artifact'),
+]
+
+def test_iter_combinations():
+    combinations = list(CommanderPool(CARDS).iter_combinations())
+    assert combinations == [
+        ('Atraxa', '', 'bguw'),
+        ('Thrasios', '', 'gu'),
+        ('Tymna', '', 'bw'),
+        ('Pako', '', 'g'),
+        ('Haldan', '', 'u'),
+        ('Wilson', '', 'g'),
+        ('Thrasios', 'Tymna', 'bguw'),
+        ('Haldan', 'Pako', 'gu'),
+        ('Nahiri', '', 'rw'),
+        ('Wilson', 'Raised by Giants', 'g'),
+        ('Shorikai', '', 'uw'),
+    ]
+
+def test_iter_combinations_for_target_matches_filtered_full_run():
+    rng = random.Random(0)
+    cards = []
+    for i in range(60):
+        color_identity = ''.join(rng.sample('WUBRG', rng.randint(0, 3)))
+        kind = rng.choice(['partner', 'friends', 'chooser', 'background'])
+        if kind == 'background':
+            cards.append(_card(f"Background {i}", color_identity, 'Legendary Enchantment — Background'))
+        else:
+            oracle_text = {'partner': 'Partner', 'friends': 'Friends forever', 'chooser': 'Choose a Background'}[kind]
+            cards.append(_card(f"Creature {i}", color_identity, 'Legendary Creature — Human', oracle_text))
+    pool = CommanderPool(cards)
+    full_run = list(pool.iter_combinations())
+    for target in ['', 'G', 'WU', 'BRG', 'WUBRG']:
+        expected = {combination for combination in full_run if color_mask(combination[2].replace('C', '')) == color_mask(target)}
+        found = list(pool.iter_combinations(color_mask(target)))
+        assert len(found) == len(set(found))
+        assert set(found) == expected, target
+
+def test_classify_commander_extracts_partner_with_name():
+    oracle_text = 'Partner with Pako, Arcane Retriever (When this creature enters, target player may put Pako into their hand from their library.)\nHaste'
+    assert classify_commander('Legendary Creature — Avatar Rogue', oracle_text) == (LEGENDARY_CREATURE | PARTNER_WITH, 'Pako, Arcane Retriever')
+    assert classify_commander('Legendary Creature — Avatar Rogue', oracle_text.replace('\n', '|')) == (LEGENDARY_CREATURE | PARTNER_WITH, 'Pako, Arcane Retriever')
+    assert classify_commander('Legendary Creature — Human', 'Partner (You can have two commanders if both have partner.)') == (LEGENDARY_CREATURE | PARTNER, '')
+    assert classify_commander('Legendary Artifact', 'Indestructible') == (0, '')
+    assert classify_commander('Legendary Artifact — Vehicle', '', '3', '3') == (LEGENDARY_ARTIFACT, '')
+
+def test_pool_uses_stored_flags():
+    cards = [
+        {'name': 'Haldan, Avatar of Knowledge', 'color_identity': 'U', 'commander_flags': LEGENDARY_CREATURE | PARTNER_WITH, 'partner_with': 'Pako, Arcane Retriever'},
+        {'name': 'Pako, Arcane Retriever', 'color_identity': 'G', 'commander_flags': LEGENDARY_CREATURE | PARTNER_WITH, 'partner_with': 'Haldan, Avatar of Knowledge'},
+    ]
+    assert list(CommanderPool(cards).iter_combinations(color_mask('UG'))) == [('Haldan, Avatar of Knowledge', 'Pako, Arcane Retriever', 'gu')]
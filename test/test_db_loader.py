@@ -0,0 +1,228 @@
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import db_loader
+import pytest
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from db_loader import get_ijson_backend, iter_card_objects, load_db, load_db_stream, refresh_db, stream_bulk_data, update_all_cards_file
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+all_cards_file = os.path.join(this_dir, 'test_data', 'test-all-cards.json')
+
+def _tables(db_path) -> set[str]:
+    with sqlite3.connect(db_path) as conn:
+        return {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+def test_load_db_projects_cards(tmp_path):
+    db_path = str(tmp_path / 'cards.db')
+    load_db(all_cards_file, db_path)
+    assert {'oracle_cards', 'printings', 'json_data'} <= _tables(db_path)
+    with sqlite3.connect(db_path) as conn:
+        atraxa = conn.execute("SELECT name, commander_legal, color_identity, cmc, power FROM cards WHERE id = 'dac080ef-8f40-43a2-8440-b457b6074b69'").fetchone()
+        lotus_legal = conn.execute("SELECT commander_legal FROM cards WHERE name = 'Black Lotus'").fetchone()[0]
+    assert atraxa == ("Atraxa, Praetors' Voice", 1, 'BGUW', 4.0, '4')
+    assert lotus_legal == 0
+
+def test_load_db_without_json_data(tmp_path):
+    db_path = str(tmp_path / 'cards.db')
+    load_db(all_cards_file, db_path, store_json=False)
+    assert 'json_data' not in _tables(db_path)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM cards').fetchone()[0] == 12
+
+@contextmanager
+def _bulk_data_server(payload: bytes, updated_at: str = '2026-01-01T09:00:00.000+00:00'):
+    """Serves a Scryfall style bulk data index and a Range capable download on localhost."""
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            requests_seen.append((self.path, self.headers.get('Range')))
+            if self.path == '/bulk-data':
+                body = json.dumps({'data': [{
+                    'type': 'all_cards',
+                    'updated_at': updated_at,
+                    'size': len(payload),
+                    'download_uri': f"http://127.0.0.1:{self.server.server_port}/all-cards.json",
+                }]}).encode()
+                self.send_response(200)
+            else:
+                start = int(self.headers['Range'][len('bytes='):-1]) if self.headers.get('Range') else 0
+                body = payload[start:]
+                self.send_response(416 if start >= len(payload) else 206 if start else 200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/bulk-data", requests_seen
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_update_all_cards_file_skips_unchanged_data(tmp_path):
+    with open(all_cards_file, 'rb') as f:
+        payload = f.read()
+    target = str(tmp_path / 'all_cards.json')
+    with _bulk_data_server(payload) as (bulk_data_url, requests_seen):
+        assert update_all_cards_file(target, bulk_data_url, chunk_size=256) is True
+        assert update_all_cards_file(target, bulk_data_url, chunk_size=256) is False
+    with open(target, 'rb') as f:
+        assert f.read() == payload
+    assert [path for path, _ in requests_seen] == ['/bulk-data', '/all-cards.json', '/bulk-data']
+
+def test_update_all_cards_file_resumes_partial_download(tmp_path):
+    with open(all_cards_file, 'rb') as f:
+        payload = f.read()
+    target = str(tmp_path / 'all_cards.json')
+    with open(f"{target}.part", 'wb') as f:
+        f.write(payload[:1000])
+    with open(f"{target}.meta.json", 'w', encoding='utf-8') as f:
+        json.dump({'updated_at': '2026-01-01T09:00:00.000+00:00', 'complete': False}, f)
+    with _bulk_data_server(payload) as (bulk_data_url, requests_seen):
+        assert update_all_cards_file(target, bulk_data_url) is True
+    with open(target, 'rb') as f:
+        assert f.read() == payload
+    assert requests_seen[-1] == ('/all-cards.json', 'bytes=1000-')
+
+def test_update_all_cards_file_restarts_oversized_partial_download(tmp_path):
+    with open(all_cards_file, 'rb') as f:
+        payload = f.read()
+    target = str(tmp_path / 'all_cards.json')
+    with open(f"{target}.part", 'wb') as f:
+        f.write(payload + b'garbage')
+    with open(f"{target}.meta.json", 'w', encoding='utf-8') as f:
+        json.dump({'updated_at': '2026-01-01T09:00:00.000+00:00', 'complete': False}, f)
+    with _bulk_data_server(payload) as (bulk_data_url, requests_seen):
+        with pytest.raises(ValueError):
+            update_all_cards_file(target, bulk_data_url)
+        assert not os.path.exists(f"{target}.part")
+        assert update_all_cards_file(target, bulk_data_url) is True
+    with open(target, 'rb') as f:
+        assert f.read() == payload
+    assert requests_seen[-1] == ('/all-cards.json', None)
+
+def test_load_db_stream_from_gzipped_download(tmp_path):
+    with open(all_cards_file, 'rb') as f:
+        payload = gzip.compress(f.read())
+    db_path = str(tmp_path / 'cards.db')
+    with _bulk_data_server(payload) as (bulk_data_url, _):
+        with stream_bulk_data(bulk_data_url) as stream:
+            load_db_stream(stream, db_path, batch_size=5)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM cards').fetchone()[0] == 12
+        assert conn.execute('SELECT COUNT(*) FROM json_data').fetchone()[0] == 12
+
+def test_bulk_load_matches_regular_load(tmp_path):
+    regular_db = str(tmp_path / 'regular.db')
+    bulk_db = str(tmp_path / 'bulk.db')
+    load_db(all_cards_file, regular_db)
+    # A bulk rebuild replaces whatever was there before
+    load_db(all_cards_file, bulk_db, store_json=False)
+    load_db(all_cards_file, bulk_db, batch_size=5, bulk=True)
+    assert not os.path.exists(f"{bulk_db}.building")
+    query = 'SELECT * FROM cards ORDER BY id'
+    with sqlite3.connect(regular_db) as regular, sqlite3.connect(bulk_db) as bulk:
+        assert bulk.execute(query).fetchall() == regular.execute(query).fetchall()
+        assert bulk.execute('SELECT COUNT(*) FROM json_data').fetchone()[0] == 12
+        assert bulk.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'printings_id'").fetchone()
+
+def test_refresh_db_only_writes_changed_cards(tmp_path):
+    db_path = str(tmp_path / 'cards.db')
+    load_db(all_cards_file, db_path)
+    with open(all_cards_file, 'r', encoding='utf-8') as f:
+        cards = json.load(f)
+    for card in cards:
+        if card['name'] == 'Vampiric Tutor':
+            card['legalities']['commander'] = 'banned'
+        # Price changes alone are not a change to the card
+        card['prices']['usd'] = '0.01'
+    cards.append(dict(cards[0], id='11111111-2222-4333-8444-555555555555', oracle_id='66666666-7777-4888-9999-000000000000', name='Fresh Print'))
+    refreshed_file = str(tmp_path / 'all_cards.json')
+    with open(refreshed_file, 'w', encoding='utf-8') as f:
+        json.dump(cards, f)
+
+    refresh_id = refresh_db(refreshed_file, db_path)
+    with sqlite3.connect(db_path) as conn:
+        changes = conn.execute('SELECT card_id, change FROM card_changes WHERE refresh_id = ? ORDER BY change', (refresh_id,)).fetchall()
+        summary = conn.execute('SELECT records_processed, cards_added, cards_updated FROM refreshes WHERE id = ?', (refresh_id,)).fetchone()
+        tutor_legal = conn.execute("SELECT commander_legal FROM cards WHERE name = 'Vampiric Tutor'").fetchone()[0]
+        tutor_json = json.loads(conn.execute("SELECT value FROM json_data WHERE id = '0a07cba3-2e8d-48ec-a6f8-4d2edfcd833d'").fetchone()[0])
+    assert changes == [('11111111-2222-4333-8444-555555555555', 'added'), ('0a07cba3-2e8d-48ec-a6f8-4d2edfcd833d', 'updated')]
+    assert summary == (13, 1, 1)
+    assert tutor_legal == 0
+    assert tutor_json['legalities']['commander'] == 'banned'
+
+    second_refresh_id = refresh_db(refreshed_file, db_path)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM card_changes WHERE refresh_id = ?', (second_refresh_id,)).fetchone()[0] == 0
+
+def test_load_db_with_workers_matches_single_process(tmp_path):
+    single_db = str(tmp_path / 'single.db')
+    parallel_db = str(tmp_path / 'parallel.db')
+    load_db(all_cards_file, single_db, batch_size=2)
+    load_db(all_cards_file, parallel_db, batch_size=2, workers=2)
+    with sqlite3.connect(single_db) as single, sqlite3.connect(parallel_db) as parallel:
+        for query in ['SELECT rowid, * FROM oracle_cards', 'SELECT rowid, * FROM printings', 'SELECT rowid, * FROM json_data']:
+            assert parallel.execute(query).fetchall() == single.execute(query).fetchall()
+
+def test_ijson_backend_falls_back_and_parses_floats(monkeypatch):
+    monkeypatch.setattr(db_loader, 'IJSON_BACKENDS', ['not_installed', 'python'])
+    get_ijson_backend.cache_clear()
+    try:
+        assert get_ijson_backend().backend_name == 'python'
+        with open(all_cards_file, 'rb') as f:
+            cards = list(iter_card_objects(f))
+    finally:
+        get_ijson_backend.cache_clear()
+    assert len(cards) == 12
+    assert all(type(card['cmc']) is float for card in cards)
+
+def test_derived_columns_are_backfilled_for_older_databases(tmp_path):
+    db_path = str(tmp_path / 'cards.db')
+    load_db(all_cards_file, db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('DROP VIEW cards')
+        conn.execute('ALTER TABLE oracle_cards DROP COLUMN color_mask')
+    load_db(all_cards_file, db_path)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT color_mask FROM cards WHERE name = \"Atraxa, Praetors' Voice\"").fetchone()[0] == 1 | 2 | 4 | 16
+        assert conn.execute("SELECT color_mask FROM cards WHERE name = 'The Ozolith'").fetchone()[0] == 0
+
+def test_reprints_share_one_oracle_card(tmp_path):
+    with open(all_cards_file, 'r', encoding='utf-8') as f:
+        cards = json.load(f)
+    tutor = next(card for card in cards if card['name'] == 'Vampiric Tutor')
+    cards.append(dict(tutor, id='22222222-3333-4444-8555-666666666666', lang='de', set='cst'))
+    reprints_file = str(tmp_path / 'all_cards.json')
+    with open(reprints_file, 'w', encoding='utf-8') as f:
+        json.dump(cards, f)
+    db_path = str(tmp_path / 'cards.db')
+    load_db(reprints_file, db_path)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM printings').fetchone()[0] == 13
+        assert conn.execute('SELECT COUNT(*) FROM oracle_cards').fetchone()[0] == 12
+        assert conn.execute("SELECT COUNT(*) FROM cards WHERE name = 'Vampiric Tutor'").fetchone()[0] == 2
+
+def test_cards_table_of_older_databases_is_migrated(tmp_path):
+    db_path = str(tmp_path / 'cards.db')
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('CREATE TABLE cards (id TEXT PRIMARY KEY, name TEXT NOT NULL, commander_legal INTEGER NOT NULL, color_identity TEXT NOT NULL, mana_cost TEXT NOT NULL, cmc REAL NOT NULL, type_line TEXT NOT NULL, power TEXT NOT NULL, toughness TEXT NOT NULL, oracle_text TEXT NOT NULL)')
+        conn.execute("INSERT INTO cards VALUES ('0a07cba3-2e8d-48ec-a6f8-4d2edfcd833d', 'Vampiric Tutor', 1, 'B', '{B}', 1.0, 'Instant', '', '', 'Old text')")
+    refresh_id = refresh_db(all_cards_file, db_path, store_json=False)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'cards'").fetchone()[0] == 'view'
+        assert conn.execute("SELECT oracle_id, color_mask, oracle_text FROM cards WHERE name = 'Vampiric Tutor'").fetchone() == \
+            ('23449cfe-fb4c-4dfa-b6c3-0399396d3cca', 4, 'Search your library for a card, then shuffle and put that card on top. You lose 2 life.')
+        # The placeholder oracle card of the migrated row is gone once the printing is regrouped
+        assert conn.execute('SELECT COUNT(*) FROM oracle_cards').fetchone()[0] == 12
+        assert conn.execute('SELECT cards_added, cards_updated FROM refreshes WHERE id = ?', (refresh_id,)).fetchone() == (11, 1)
@@ -0,0 +1,191 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import pytest
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+pytest.importorskip('langchain_openai')
+from ai.magic_card_selector_light import MagicCardSelectorLight
+from ai.response_cache import ResponseCache
+from chunk_planner import name_output_tokens
+import filter_cards as filter_cards_module
+from filter_cards import filter_cards, split_csv_into_chunks
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+
+@contextmanager
+def _chat_completions_server(delay: float = 0.05):
+    """Serves an OpenAI style chat completions API on localhost that selects the first card of every prompt."""
+    lock = threading.Lock()
+    state = {'running': 0, 'peak': 0, 'requests': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            with lock:
+                state['running'] += 1
+                state['requests'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            prompt = request['messages'][-1]['content']
+            first_card = re.search(r'Cards:\s*- (.*)', prompt).group(1).strip()
+            time.sleep(delay)
+            body = json.dumps({
+                'id': 'chatcmpl-test', 'object': 'chat.completion', 'created': 0, 'model': request['model'],
+                'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': json.dumps({'selected_cards': [first_card]})}}],
+                'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2},
+            }).encode()
+            with lock:
+                state['running'] -= 1
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/v1", state
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_filter_cards_dispatches_chunks_concurrently(monkeypatch, tmp_path):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    csv_file = os.path.join(this_dir, 'test_data', 'test-collection-reduced-enhanced-expected.csv')
+    with _chat_completions_server() as (api_base, state):
+        selector = MagicCardSelectorLight(api_base=api_base)
+        selected = filter_cards(csv_file, 'tutors', 2, start_chunk=1, concurrency=3, selector=selector, journal_path=str(tmp_path / 'filter_runs.db'))
+    assert selected[0] == ['Sword of Feast and Famine']
+    assert len(selected) == state['requests'] == 5
+    assert state['peak'] == 3
+
+def test_filter_cards_reruns_are_answered_from_the_response_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    csv_file = os.path.join(this_dir, 'test_data', 'test-collection-reduced-enhanced-expected.csv')
+    with _chat_completions_server(delay=0) as (api_base, state):
+        with ResponseCache(str(tmp_path / 'llm_cache.db')) as cache:
+            first_run = filter_cards(csv_file, 'tutors', 4, selector=MagicCardSelectorLight(api_base=api_base, cache=cache), journal_path=str(tmp_path / 'first.db'))
+        assert state['requests'] == 3
+        with ResponseCache(str(tmp_path / 'llm_cache.db')) as cache:
+            # A fresh journal, so the run is not resumed and every chunk asks the selector again
+            assert filter_cards(csv_file, 'tutors', 4, selector=MagicCardSelectorLight(api_base=api_base, cache=cache), journal_path=str(tmp_path / 'second.db')) == first_run
+            assert (cache.hits, cache.misses) == (3, 0)
+        assert state['requests'] == 3
+
+class _ReadOnlyCache(ResponseCache):
+    def put(self, key, response):
+        raise sqlite3.OperationalError('attempt to write a readonly database')
+
+def test_failing_cache_writes_are_not_retried_as_requests(monkeypatch, tmp_path):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    cards = [{'name': 'The Ozolith', 'mana_cost': '{1}', 'type_line': 'Legendary Artifact', 'oracle_text': ''}]
+    with _chat_completions_server(delay=0) as (api_base, state):
+        with _ReadOnlyCache(str(tmp_path / 'llm_cache.db')) as cache:
+            with pytest.raises(sqlite3.OperationalError):
+                MagicCardSelectorLight(api_base=api_base, cache=cache).select_cards(cards, 'tutors')
+        assert state['requests'] == 1
+
+class _FlakySelector:
+    """Selects the first card of every chunk, failing on the chunks in `failing`."""
+    def __init__(self, failing=(), max_output_tokens=None):
+        self.failing = set(failing)
+        self.max_output_tokens = max_output_tokens
+        self.calls = []
+
+    def format_card(self, card):
+        return f"- {card['name']}: {card['oracle_text']}"
+
+    def prompt_overhead(self, deck_concept):
+        return f"Deck Concept: {deck_concept}"
+
+    def card_output_tokens(self, card):
+        return name_output_tokens(card)
+
+    def select_cards(self, cards, deck_concept):
+        self.calls.append(cards[0]['name'])
+        if cards[0]['name'] in self.failing:
+            raise RuntimeError('connection reset')
+        return {'selected_cards': [cards[0]['name']]}
+
+def test_filter_cards_resumes_from_the_journal(tmp_path):
+    csv_file = os.path.join(this_dir, 'test_data', 'test-collection-reduced-enhanced-expected.csv')
+    journal_path = str(tmp_path / 'filter_runs.db')
+    flaky = _FlakySelector(failing=['The One Ring'])
+    with pytest.raises(RuntimeError):
+        filter_cards(csv_file, 'tutors', 2, concurrency=1, selector=flaky, journal_path=journal_path)
+    first_cards = ['The Ozolith', 'Sword of Feast and Famine', 'The One Ring', 'Phyrexian Altar', 'Urborg, Tomb of Yawgmoth', "Atraxa, Praetors' Voice"]
+    assert flaky.calls[:3] == first_cards[:3]
+
+    resumed = _FlakySelector()
+    selected = filter_cards(csv_file, 'tutors', 2, concurrency=1, selector=resumed, journal_path=journal_path)
+    # Only the failed chunk and the ones that never ran are sent again
+    assert resumed.calls == [name for name in first_cards if name not in flaky.calls or name == 'The One Ring']
+    assert [cards[0] for cards in selected] == first_cards
+
+class _LastCardSelector(_FlakySelector):
+    """Selects the last card of every chunk."""
+    def select_cards(self, cards, deck_concept):
+        self.calls.append(cards[-1]['name'])
+        return {'selected_cards': [cards[-1]['name']]}
+
+def test_filter_cards_starts_a_new_run_for_another_selector_or_when_asked(tmp_path):
+    csv_file = os.path.join(this_dir, 'test_data', 'test-collection-reduced-enhanced-expected.csv')
+    journal_path = str(tmp_path / 'filter_runs.db')
+    first = filter_cards(csv_file, 'tutors', 4, selector=_FlakySelector(), journal_path=journal_path)
+    replayed = _FlakySelector()
+    assert filter_cards(csv_file, 'tutors', 4, selector=replayed, journal_path=journal_path) == first
+    assert replayed.calls == []
+
+    other = _LastCardSelector()
+    selected = filter_cards(csv_file, 'tutors', 4, selector=other, journal_path=journal_path)
+    assert len(other.calls) == 3
+    assert selected != first
+
+    fresh = _FlakySelector()
+    assert filter_cards(csv_file, 'tutors', 4, selector=fresh, journal_path=journal_path, new_run=True) == first
+    assert len(fresh.calls) == 3
+
+def test_split_csv_into_chunks_is_lazy():
+    csv_file = os.path.join(this_dir, 'test_data', 'test-collection-reduced-enhanced-expected.csv')
+    chunks = split_csv_into_chunks(csv_file, 4)
+    assert len(chunks) == 3
+    all_chunks = list(chunks)
+    assert [len(chunk) for chunk in all_chunks] == [4, 4, 3]
+    assert list(chunks.iter_from(2)) == [(2, all_chunks[2])]
+
+def test_filter_cards_plans_chunks_by_token_budget(tmp_path, capsys):
+    csv_file = os.path.join(this_dir, 'test_data', 'test-collection-reduced-enhanced-expected.csv')
+    selector = _FlakySelector()
+    selected = filter_cards(csv_file, 'tutors', 2, selector=selector, journal_path=str(tmp_path / 'filter_runs.db'), token_budget=150)
+    assert 'Planned 4 calls for 11 cards' in capsys.readouterr().out
+    assert len(selected) == len(selector.calls) == 4
+
+def test_filter_cards_plans_chunks_by_the_output_cap_of_the_selector(tmp_path, capsys):
+    csv_file = os.path.join(this_dir, 'test_data', 'test-collection-reduced-enhanced-expected.csv')
+    selector = _FlakySelector(max_output_tokens=8)
+    # The prompt budget fits every card, the cap only fits the names of one card per response
+    selected = filter_cards(csv_file, 'tutors', 2, selector=selector, journal_path=str(tmp_path / 'filter_runs.db'), token_budget=100000)
+    assert 'Planned 11 calls for 11 cards' in capsys.readouterr().out
+    assert len(selected) == 11
+
+def test_filter_cards_closes_the_response_cache_of_the_default_selector(monkeypatch, tmp_path):
+    caches = []
+
+    def default_selector(cache):
+        caches.append(cache)
+        return _FlakySelector()
+    monkeypatch.setattr(filter_cards_module, 'MagicCardSelector', default_selector)
+    csv_file = os.path.join(this_dir, 'test_data', 'test-collection-reduced-enhanced-expected.csv')
+    filter_cards(csv_file, 'tutors', 4, cache_path=str(tmp_path / 'llm_cache.db'), journal_path=str(tmp_path / 'filter_runs.db'))
+    assert len(caches) == 1
+    with pytest.raises(sqlite3.ProgrammingError):
+        caches[0].get('a')
@@ -0,0 +1,57 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from ai.response_cache import ResponseCache, response_cache_key
+
+def test_response_cache_key_covers_every_input():
+    inputs = {'cards': '- The Ozolith', 'deck_concept': 'counters'}
+    api_base = 'https://open.bigmodel.cn/api/paas/v4/'
+    key = response_cache_key('glm-4.5-flash', 'template {cards}', inputs, 0.1, api_base)
+    assert key == response_cache_key('glm-4.5-flash', 'template {cards}', dict(reversed(inputs.items())), 0.1, api_base)
+    assert key != response_cache_key('glm-4.6', 'template {cards}', inputs, 0.1, api_base)
+    assert key != response_cache_key('glm-4.5-flash', 'other template {cards}', inputs, 0.1, api_base)
+    assert key != response_cache_key('glm-4.5-flash', 'template {cards}', dict(inputs, deck_concept='tokens'), 0.1, api_base)
+    assert key != response_cache_key('glm-4.5-flash', 'template {cards}', dict(inputs, cards='- The One Ring'), 0.1, api_base)
+    assert key != response_cache_key('glm-4.5-flash', 'template {cards}', inputs, 0.7, api_base)
+    assert key != response_cache_key('glm-4.5-flash', 'template {cards}', inputs, 0.1, 'http://localhost:8000/v1')
+
+def test_response_cache_persists_and_counts(tmp_path):
+    path = str(tmp_path / 'llm_cache.db')
+    with ResponseCache(path) as cache:
+        assert cache.get('a') is None
+        cache.put('a', {'selected_cards': ['The Ozolith']})
+    with ResponseCache(path) as cache:
+        assert cache.get('a') == {'selected_cards': ['The Ozolith']}
+        assert (cache.hits, cache.misses) == (1, 0)
+
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    response = {'selected_cards': ['x' * 10]}
+    size = len(json.dumps(response))
+    with ResponseCache(str(tmp_path / 'llm_cache.db'), max_bytes=size * 3) as cache:
+        for key in 'abc':
+            cache.put(key, response)
+        cache.get('a')
+        cache.put('d', response)
+        assert [key for key in 'abcd' if cache.get(key) is not None] == ['a', 'c', 'd']
+
+def test_response_cache_keeps_the_total_size(tmp_path):
+    path = str(tmp_path / 'llm_cache.db')
+    response = {'selected_cards': ['x' * 10]}
+    size = len(json.dumps(response))
+    with ResponseCache(path, max_bytes=size * 3) as cache:
+        for key in 'abcd':
+            cache.put(key, response)
+        cache.put('d', {'selected_cards': []})
+        assert [key for key in 'abcd' if cache.get(key) is not None] == ['b', 'c', 'd']
+        assert cache.conn.execute('SELECT total FROM responses_size').fetchone()[0] == size * 2 + len(json.dumps({'selected_cards': []}))
+    # Caches written before the total was kept get it on open
+    with ResponseCache(path) as cache:
+        cache.conn.execute('DROP TABLE responses_size')
+        cache.conn.commit()
+    with ResponseCache(path) as cache:
+        assert cache.conn.execute('SELECT total FROM responses_size').fetchone()[0] == cache.conn.execute('SELECT SUM(size) FROM responses').fetchone()[0]
+
+def test_response_cache_is_shared_by_threads(tmp_path):
+    with ResponseCache(str(tmp_path / 'llm_cache.db')) as cache:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda i: cache.put(str(i), [i]), range(50)))
+            assert list(executor.map(lambda i: cache.get(str(i)), range(50))) == [[i] for i in range(50)]
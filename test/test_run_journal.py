@@ -0,0 +1,54 @@
+import os
+from run_journal import RunJournal, filter_run_id
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+csv_file = os.path.join(this_dir, 'test_data', 'test-collection-reduced-enhanced-expected.csv')
+
+def test_filter_run_id_depends_on_inputs():
+    run_id = filter_run_id(csv_file, 'tutors', 12)
+    assert run_id == filter_run_id(csv_file, 'tutors', 12)
+    assert run_id != filter_run_id(csv_file, 'tutors', 10)
+    assert run_id != filter_run_id(csv_file, 'counters', 12)
+
+class _Template:
+    def __init__(self, template):
+        self.template = template
+
+class _Selector:
+    def __init__(self, model_name='glm-4.5-flash', template='Cards: {cards}', temperature=0.1, api_base='https://open.bigmodel.cn/api/paas/v4/'):
+        self.model_name = model_name
+        self.prompt_template = _Template(template)
+        self.temperature = temperature
+        self.api_base = api_base
+
+class _OtherSelector(_Selector):
+    pass
+
+def test_filter_run_id_depends_on_the_selector():
+    run_id = filter_run_id(csv_file, 'tutors', 12, selector=_Selector())
+    assert run_id == filter_run_id(csv_file, 'tutors', 12, selector=_Selector())
+    assert run_id != filter_run_id(csv_file, 'tutors', 12)
+    assert run_id != filter_run_id(csv_file, 'tutors', 12, selector=_OtherSelector())
+    assert run_id != filter_run_id(csv_file, 'tutors', 12, selector=_Selector(model_name='glm-4.6'))
+    assert run_id != filter_run_id(csv_file, 'tutors', 12, selector=_Selector(template='Deck: {cards}'))
+    assert run_id != filter_run_id(csv_file, 'tutors', 12, selector=_Selector(temperature=0.7))
+    assert run_id != filter_run_id(csv_file, 'tutors', 12, selector=_Selector(api_base='http://localhost:8000/v1'))
+
+def test_run_journal_records_and_streams_in_chunk_order(tmp_path):
+    journal_path = str(tmp_path / 'filter_runs.db')
+    with RunJournal(journal_path) as journal:
+        journal.start_run('run', csv_file, 'tutors', 2)
+        journal.record('run', 2, ['Demonic Tutor'])
+        journal.record('run', 0, ['Vampiric Tutor'])
+    with RunJournal(journal_path) as journal:
+        assert journal.get_run('run') == {'csv_file': csv_file, 'deck_concept': 'tutors', 'chunk_size': 2, 'token_budget': None, 'finished_at': None}
+        assert journal.completed_chunks('run') == {0, 2}
+        journal.record('run', 1, [])
+        journal.finish_run('run')
+        assert list(journal.iter_selections('run')) == [(0, ['Vampiric Tutor']), (1, []), (2, ['Demonic Tutor'])]
+        assert list(journal.iter_selections('run', start_chunk=2)) == [(2, ['Demonic Tutor'])]
+        assert journal.get_run('run')['finished_at'] is not None
+        assert journal.get_run('other') is None
+        journal.reset_run('run')
+        assert journal.get_run('run') is None
+        assert journal.completed_chunks('run') == set()
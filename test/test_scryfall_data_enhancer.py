@@ -1,5 +1,7 @@
 import os
-from scryfall_data_enhancer import reduce_collection_csv, enhance_card_data, filter_commander_legal, create_color_identity_csv, COLOR_IDENTITIES
+import shutil
+import commanders
+from scryfall_data_enhancer import reduce_collection_csv, dedupe_collection_rows, enhance_card_data, filter_commander_legal, create_color_identity_csv, create_all_color_identity_csvs, generate_commander_combinations, run_streaming_pipeline, combine_color_identities, COLOR_IDENTITIES
 
 this_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -13,12 +15,12 @@ def test_reduce_collection_csv():
         actual_content = f.read()
     assert expected_content == actual_content, "Reduced CSV content does not match expected output."
 
-def test_enhance_card_data():
+def test_enhance_card_data(card_db):
     input_file = os.path.join(this_dir, 'test_data', 'test-collection-reduced-expected.csv')
     expected_output_file = os.path.join(this_dir, 'test_data', 'test-collection-reduced-enhanced-expected.csv')
     with open(expected_output_file, 'r', encoding='utf-8') as f:
         expected_content = f.read()
-    actual_output_file = enhance_card_data(input_file)
+    actual_output_file = enhance_card_data(input_file, card_db)
     with open(actual_output_file, 'r', encoding='utf-8') as f:
         actual_content = f.read()
     assert expected_content == actual_content, "Enhanced CSV content does not match expected output."
@@ -47,3 +49,91 @@ def test_filter_by_color_identity():
     _filter_by_color_identity('colorless', 'test-collection-reduced-enhanced-commander-legal--expected.csv')
     _filter_by_color_identity('golgari', 'test-collection-reduced-enhanced-commander-legal-bg-expected.csv')
     _filter_by_color_identity('wubrg', 'test-collection-reduced-enhanced-commander-legal-bgruw-expected.csv')
+
+def test_streaming_pipeline_matches_staged_pipeline(tmp_path, card_db):
+    outputs = {}
+    for mode in ['staged', 'streaming', 'streaming-intermediate']:
+        os.mkdir(tmp_path / mode)
+        collection_file = str(tmp_path / mode / 'collection.csv')
+        shutil.copy(os.path.join(this_dir, 'test_data', 'test-collection.csv'), collection_file)
+        if mode == 'staged':
+            commander_legal_file = filter_commander_legal(enhance_card_data(reduce_collection_csv(collection_file), card_db))
+            create_all_color_identity_csvs(commander_legal_file)
+            generate_commander_combinations(commander_legal_file)
+        else:
+            run_streaming_pipeline(collection_file, card_db, keep_intermediate=mode == 'streaming-intermediate')
+        outputs[mode] = {}
+        for name in os.listdir(tmp_path / mode):
+            with open(tmp_path / mode / name, 'rb') as f:
+                outputs[mode][name] = f.read()
+
+    assert outputs['streaming-intermediate'] == outputs['staged']
+    intermediate_files = {'collection-reduced.csv', 'collection-reduced-enhanced.csv', 'collection-reduced-enhanced-commander-legal.csv'}
+    assert outputs['streaming'] == {name: content for name, content in outputs['staged'].items() if name not in intermediate_files}
+    assert len(outputs['streaming']) == 1 + len(COLOR_IDENTITIES) + 1
+
+def test_commander_combinations_use_stored_flags(tmp_path, card_db, monkeypatch):
+    commander_legal_file = str(tmp_path / 'collection-commander-legal.csv')
+    shutil.copy(os.path.join(this_dir, 'test_data', 'test-collection-reduced-enhanced-commander-legal-expected.csv'), commander_legal_file)
+    with open(generate_commander_combinations(commander_legal_file), 'rb') as f:
+        classified = f.read()
+
+    def classify_commander(*args):
+        raise AssertionError('oracle text was classified')
+    monkeypatch.setattr(commanders, 'classify_commander', classify_commander)
+    with open(generate_commander_combinations(commander_legal_file, card_db=card_db), 'rb') as f:
+        assert f.read() == classified
+    collection_file = str(tmp_path / 'collection.csv')
+    shutil.copy(os.path.join(this_dir, 'test_data', 'test-collection.csv'), collection_file)
+    run_streaming_pipeline(collection_file, card_db)
+    with open(str(tmp_path / 'collection-reduced-enhanced-commander-legal_commander_combinations.csv'), 'rb') as f:
+        assert f.read() == classified
+
+def test_combine_color_identities():
+    assert combine_color_identities('wu', 'bu') == 'buw'
+    assert combine_color_identities('', 'g') == 'g'
+    assert combine_color_identities('', '') == 'C'
+
+def test_create_all_color_identity_csvs_matches_per_color_csvs(tmp_path):
+    for mode in ['per-color', 'fan-out']:
+        os.mkdir(tmp_path / mode)
+        shutil.copy(os.path.join(this_dir, 'test_data', 'test-collection-reduced-enhanced-expected.csv'), tmp_path / mode / 'legal.csv')
+    per_color_files = [create_color_identity_csv(str(tmp_path / 'per-color' / 'legal.csv'), color_info) for color_info in COLOR_IDENTITIES.values()]
+    fan_out_files = create_all_color_identity_csvs(str(tmp_path / 'fan-out' / 'legal.csv'))
+    assert [os.path.basename(f) for f in fan_out_files] == [os.path.basename(f) for f in per_color_files]
+    for per_color_file, fan_out_file in zip(per_color_files, fan_out_files):
+        with open(per_color_file, 'rb') as expected, open(fan_out_file, 'rb') as actual:
+            assert actual.read() == expected.read()
+
+def _write_collection_with_duplicates(path) -> str:
+    with open(os.path.join(this_dir, 'test_data', 'test-collection.csv'), 'r', encoding='utf-8') as f:
+        header, ozolith, vampiric_tutor = f.read().splitlines()[:3]
+    vampiric_tutor_foil = vampiric_tutor.replace(',normal,rare,1,', ',foil,rare,2,')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join([header, vampiric_tutor, ozolith, vampiric_tutor_foil, vampiric_tutor]) + '\n')
+    return str(path)
+
+def test_reduce_collection_csv_dedupe(tmp_path):
+    collection_file = _write_collection_with_duplicates(tmp_path / 'collection.csv')
+    with open(reduce_collection_csv(collection_file, dedupe=True), 'r', encoding='utf-8') as f:
+        assert f.read().splitlines() == [
+            'name,scryfall_id,quantity,foil_quantity,purchase_price',
+            'Vampiric Tutor,0a07cba3-2e8d-48ec-a6f8-4d2edfcd833d,4,2,279.04',
+            'The Ozolith,7d9df3ce-25f9-426c-a113-6aea53ddf619,1,1,89.86',
+        ]
+    assert dedupe_collection_rows([]) == []
+
+def test_dedupe_expand_copies_matches_undeduped_run(tmp_path, card_db):
+    collection_file = _write_collection_with_duplicates(tmp_path / 'collection.csv')
+    with open(enhance_card_data(reduce_collection_csv(collection_file), card_db), 'r', encoding='utf-8') as f:
+        per_line = f.read().splitlines()
+    with open(enhance_card_data(reduce_collection_csv(collection_file, dedupe=True), card_db, expand_copies=True), 'r', encoding='utf-8') as f:
+        per_copy = f.read().splitlines()
+    # One row per line before, one row per copy after expanding, the foil line holds two copies
+    assert sorted(per_copy) == sorted(per_line + [per_line[1]])
+
+    os.mkdir(tmp_path / 'streaming')
+    streaming_collection_file = _write_collection_with_duplicates(tmp_path / 'streaming' / 'collection.csv')
+    run_streaming_pipeline(streaming_collection_file, card_db, keep_intermediate=True, dedupe=True, expand_copies=True)
+    with open(tmp_path / 'streaming' / 'collection-reduced-enhanced.csv', 'r', encoding='utf-8') as f:
+        assert f.read().splitlines() == per_copy